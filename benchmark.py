@@ -0,0 +1,377 @@
+"""
+Benchmarks AutoTrack sur données synthétiques (in-process, sans réseau)
+
+1. Génère 10k / 100k / 1M annonces réalistes (parts de marché des marques,
+   prix selon l'âge, kilométrage corrélé à l'année, villes pondérées) et les
+   charge dans un store neuf, comme le ferait le pipeline.
+2. Appelle les routes FastAPI en process (httpx.ASGITransport, middlewares
+   compris) pour chaque combinaison filtre x tri x profondeur de pagination,
+   plus /api/stats, /api/facets et /api/export.
+3. Diffuse des annonces à N faux clients WebSocket.
+
+Chaque scénario rapporte débit, p50/p95/p99, pic d'allocation par requête
+(tracemalloc, passe séparée) et collections GC pendant la mesure.
+
+Usage:
+    python benchmark.py --sizes 10000,100000
+    python benchmark.py --sizes 1000000 --output after.json --compare before.json
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import math
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+import httpx
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, HERE)
+import main  # noqa: E402
+
+# Parts de marché approximatives du marché de l'occasion en France
+BRAND_SHARES = {
+    "Renault": 0.17, "Peugeot": 0.16, "Citroën": 0.09, "Volkswagen": 0.08, "Toyota": 0.06,
+    "Dacia": 0.05, "Ford": 0.05, "BMW": 0.05, "Mercedes": 0.05, "Audi": 0.05, "Opel": 0.04,
+    "Fiat": 0.04, "Nissan": 0.03, "Kia": 0.025, "Hyundai": 0.025, "Tesla": 0.01,
+}
+MODELS = {
+    "Renault": ["Clio", "Megane", "Captur", "Scenic", "Twingo", "Kadjar"],
+    "Peugeot": ["208", "308", "3008", "2008", "5008", "108"],
+    "Citroën": ["C3", "C4", "Berlingo", "C5 Aircross", "C1"],
+    "Volkswagen": ["Golf", "Polo", "Tiguan", "T-Roc"],
+    "Toyota": ["Yaris", "Corolla", "C-HR", "RAV4"],
+    "Dacia": ["Sandero", "Duster", "Logan"],
+    "Ford": ["Fiesta", "Focus", "Kuga", "Puma"],
+    "BMW": ["Serie 1", "Serie 3", "X1", "X3"],
+    "Mercedes": ["Classe A", "Classe C", "GLA"],
+    "Audi": ["A3", "A4", "Q3"],
+    "Opel": ["Corsa", "Astra", "Mokka"],
+    "Fiat": ["500", "Panda", "Tipo"],
+    "Nissan": ["Qashqai", "Juke", "Micra"],
+    "Kia": ["Sportage", "Ceed", "Picanto"],
+    "Hyundai": ["Tucson", "i20", "Kona"],
+    "Tesla": ["Model 3", "Model Y"],
+}
+# Prix neuf indicatif par marque (k€): base de la décote
+NEW_PRICE = {
+    "Renault": 24, "Peugeot": 26, "Citroën": 23, "Volkswagen": 30, "Toyota": 28, "Dacia": 16,
+    "Ford": 25, "BMW": 42, "Mercedes": 45, "Audi": 40, "Opel": 23, "Fiat": 18, "Nissan": 27,
+    "Kia": 26, "Hyundai": 26, "Tesla": 50,
+}
+# (ville, code postal, poids ~ population)
+CITIES = [
+    ("Paris", "75011", 22), ("Marseille", "13008", 9), ("Lyon", "69003", 8), ("Toulouse", "31000", 5),
+    ("Nice", "06000", 3.5), ("Nantes", "44000", 3.3), ("Strasbourg", "67000", 2.9),
+    ("Montpellier", "34000", 2.9), ("Bordeaux", "33000", 2.6), ("Lille", "59000", 2.4),
+    ("Rennes", "35000", 2.2), ("Reims", "51100", 1.8), ("Toulon", "83000", 1.7),
+    ("Saint-Étienne", "42000", 1.7), ("Grenoble", "38000", 1.6), ("Dijon", "21000", 1.6),
+    ("Angers", "49000", 1.5), ("Nîmes", "30000", 1.5), ("Clermont-Ferrand", "63000", 1.5),
+    ("Le Mans", "72000", 1.4), ("Tours", "37000", 1.4), ("Amiens", "80000", 1.3),
+    ("Limoges", "87000", 1.3), ("Metz", "57000", 1.2), ("Perpignan", "66000", 1.2),
+    ("Orléans", "45000", 1.2), ("Rouen", "76000", 1.1), ("Caen", "14000", 1.1),
+    ("Brest", "29200", 1.4), ("Pau", "64000", 0.8), ("Bourges", "18000", 0.6),
+]
+FUELS = [("diesel", 0.42), ("essence", 0.40), ("hybride", 0.12), ("électrique", 0.06)]
+TRIMS = ["Business", "Intens", "Allure", "Life", "GT Line", "Zen", "Active", "Premium"]
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+# ============ GÉNÉRATEUR ============
+
+class VehicleGenerator:
+    """Annonces au format de _parse_ad, distributions proches du marché réel"""
+
+    def __init__(self, seed=42):
+        self.random = random.Random(seed)
+        self.brands = list(BRAND_SHARES)
+        self.brand_weights = list(BRAND_SHARES.values())
+        self.city_weights = [c[2] for c in CITIES]
+        self.next_id = 2000000000
+        self.now = datetime.now()
+
+    def vehicle(self):
+        r = self.random
+        self.next_id += 1
+        brand = r.choices(self.brands, self.brand_weights)[0]
+        model = r.choice(MODELS[brand])
+        fuel = r.choices([f for f, _ in FUELS], [w for _, w in FUELS])[0]
+        if brand == "Tesla":
+            fuel = "électrique"
+        age = min(int(r.expovariate(1 / 6)), 20)
+        year = 2025 - age
+        mileage = max(0, int(r.gauss(age * 14000, 6000 + age * 3000)))
+        # Décote ~15%/an, dispersion log-normale
+        price = NEW_PRICE[brand] * 1000 * (0.85 ** age) * math.exp(r.gauss(0, 0.25))
+        price = max(500, int(round(price, -2)))
+        city, zip_code, _ = r.choices(CITIES, self.city_weights)[0]
+        is_pro = r.random() < 0.3
+        location = f"{city} ({zip_code})"
+        title = f"{brand} {model} {r.choice(TRIMS)} {year}"
+        images = [
+            f"https://img.leboncoin.fr/api/v1/lbcpb1/images/{r.getrandbits(64):016x}.jpg?rule=ad-image"
+            for _ in range(r.choice([0, 1, 3, 5, 5]))
+        ]
+        vehicle = {
+            "id": str(self.next_id),
+            "title": title,
+            "brand": brand,
+            "model": model,
+            "price": price,
+            "year": year,
+            "mileage": mileage,
+            "fuel": fuel,
+            "gearbox": r.choice(["manuelle", "manuelle", "automatique"]),
+            "location": location,
+            "coordinates": main.get_city_coordinates(city),
+            "is_pro": is_pro,
+            "images": images,
+            "url": f"https://www.leboncoin.fr/ad/voitures/{self.next_id}",
+            "published_at": self.now - timedelta(seconds=r.randint(0, 30 * 86400)),
+            "score": 0,
+        }
+        vehicle["score"] = main.scoring.score_vehicle(vehicle)
+        return vehicle
+
+
+def load_store(size, seed=42):
+    """Remplace le store (et les stats de marché) par `size` annonces synthétiques"""
+    store = main.VehicleStore(size)
+    store.evict_listeners = main.store.evict_listeners
+    main.store = store
+    main.market = main.MarketStats()
+    generator = VehicleGenerator(seed)
+    started = time.perf_counter()
+    for i in range(size):
+        vehicle = generator.vehicle()
+        main.market.observe(vehicle)
+        store.add(vehicle)
+        if size >= 100000 and (i + 1) % 100000 == 0:
+            print(f"   … {i + 1} annonces", file=sys.stderr)
+    return time.perf_counter() - started, generator
+
+
+# ============ SCÉNARIOS ============
+
+FILTERS = {
+    "none": {},
+    "brand": {"brand": "peugeot"},
+    "department": {"location": "75"},
+    "city_text": {"location": "lyon"},
+    "price_range": {"min_price": 5000, "max_price": 15000},
+    "brand_price": {"brand": "renault", "max_price": 10000},
+}
+SORTS = ["recent", "price_asc", "price_desc"]
+PAGES = [1, 20, 200]
+
+
+def route_scenarios():
+    for filter_name, params in FILTERS.items():
+        for sort in SORTS:
+            for page in PAGES:
+                yield (f"vehicles[{filter_name},{sort},p{page}]", "/api/vehicles",
+                       {**params, "sort": sort, "page": page, "limit": 50})
+    yield "stats", "/api/stats", {}
+    yield "facets[none]", "/api/facets", {}
+    yield "facets[brand]", "/api/facets", {"brand": "peugeot"}
+    yield "market[renault]", "/api/market", {"brand": "renault"}
+    yield "export[brand,ndjson]", "/api/export", {"brand": "tesla"}
+    yield "export[brand,csv,gzip]", "/api/export", {"brand": "tesla", "format": "csv", "gzip": "true"}
+
+
+async def measure(call, iterations, max_seconds):
+    """Latences d'appels séquentiels + collections GC pendant la mesure"""
+    await call()  # chauffe
+    latencies = []
+    gc_before = sum(s["collections"] for s in gc.get_stats())
+    started = time.perf_counter()
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        await call()
+        latencies.append(time.perf_counter() - t0)
+        if time.perf_counter() - started > max_seconds:
+            break
+    elapsed = time.perf_counter() - started
+    gc_collections = sum(s["collections"] for s in gc.get_stats()) - gc_before
+
+    # Passe séparée sous tracemalloc (ralentit trop pour mesurer les latences)
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    await call()
+    _, peak = tracemalloc.get_traced_memory()
+    retained_blocks = sys.getallocatedblocks() - blocks_before
+    tracemalloc.stop()
+
+    ms = lambda v: round(v * 1000, 3) if v is not None else None
+    return {
+        "requests": len(latencies),
+        "throughput_per_s": round(len(latencies) / elapsed, 1) if elapsed else None,
+        "p50_ms": ms(percentile(latencies, 0.5)),
+        "p95_ms": ms(percentile(latencies, 0.95)),
+        "p99_ms": ms(percentile(latencies, 0.99)),
+        "max_ms": ms(max(latencies)),
+        "peak_alloc_kb": round((peak - base) / 1024, 1),
+        "retained_blocks": retained_blocks,
+        "gc_collections": gc_collections,
+    }
+
+
+async def bench_routes(iterations, max_seconds, only=None):
+    results = {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for name, path, params in route_scenarios():
+            if only and only not in name:
+                continue
+
+            async def call(path=path, params=params):
+                response = await client.get(path, params=params)
+                if response.status_code != 200:
+                    raise RuntimeError(f"{path} {params}: HTTP {response.status_code}")
+                return response
+
+            results[name] = await measure(call, iterations, max_seconds)
+            r = results[name]
+            print(f"   {name:<42} p50 {r['p50_ms']:>9.3f}ms  p99 {r['p99_ms']:>9.3f}ms  "
+                  f"{r['throughput_per_s']:>8.1f}/s  pic {r['peak_alloc_kb']:>9.1f}Ko", file=sys.stderr)
+    return results
+
+
+class FakeWebSocket:
+    """Client /ws factice: compte les messages (send_text comme Starlette)"""
+
+    def __init__(self):
+        self.messages = 0
+        self.bytes = 0
+
+    async def send_text(self, text):
+        self.messages += 1
+        self.bytes += len(text)
+
+
+async def bench_broadcast(client_counts, iterations, max_seconds, generator):
+    results = {}
+    saved = list(main.websocket_clients)
+    try:
+        for count in client_counts:
+            clients = [FakeWebSocket() for _ in range(count)]
+            main.websocket_clients[:] = clients
+            vehicles = [generator.vehicle() for _ in range(64)]
+            position = 0
+
+            async def new_vehicle():
+                nonlocal position
+                position += 1
+                await main.broadcast_new_vehicle(vehicles[position % len(vehicles)])
+
+            async def price_drop():
+                nonlocal position
+                position += 1
+                vehicle = vehicles[position % len(vehicles)]
+                await main.broadcast_price_drop(vehicle, vehicle["price"] + 500)
+
+            async def new_vehicles():
+                await main.broadcast_new_vehicles(vehicles)
+
+            for kind, call in (("new_vehicle", new_vehicle), ("price_drop", price_drop),
+                               (f"new_vehicles x{len(vehicles)}", new_vehicles)):
+                name = f"broadcast[{kind},{count} clients]"
+                r = results[name] = await measure(call, iterations, max_seconds)
+                r["messages_per_s"] = round(r["throughput_per_s"] * count, 1)
+                print(f"   {name:<42} p50 {r['p50_ms']:>9.3f}ms  p99 {r['p99_ms']:>9.3f}ms  "
+                      f"{r['messages_per_s']:>10.1f} msg/s", file=sys.stderr)
+    finally:
+        main.websocket_clients[:] = saved
+    return results
+
+
+# ============ COMPARAISON ============
+
+def compare(report, baseline):
+    """Ratio p50 et débit par scénario commun (> 1 = plus rapide qu'avant)"""
+    lines = []
+    for size, current in report["sizes"].items():
+        previous = baseline.get("sizes", {}).get(size)
+        if not previous:
+            continue
+        for group in ("routes", "broadcast"):
+            for name, result in current[group].items():
+                before = previous.get(group, {}).get(name)
+                if not before or not result["p50_ms"] or not before["p50_ms"]:
+                    continue
+                speedup = before["p50_ms"] / result["p50_ms"]
+                marker = "🟢" if speedup >= 1.1 else "🔴" if speedup <= 0.9 else "⚪"
+                lines.append(f"{marker} {size:>8} {name:<42} p50 {before['p50_ms']:>9.3f} -> "
+                             f"{result['p50_ms']:>9.3f}ms  x{speedup:.2f}")
+    return lines
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmarks AutoTrack (données synthétiques)")
+    parser.add_argument("--sizes", default="10000,100000", help="Tailles du store (ex: 10000,100000,1000000)")
+    parser.add_argument("--iterations", type=int, default=200, help="Appels max par scénario")
+    parser.add_argument("--max-seconds", type=float, default=3.0, help="Durée max par scénario")
+    parser.add_argument("--clients", default="10,100,1000", help="Clients WebSocket factices")
+    parser.add_argument("--only", help="Ne lance que les scénarios contenant ce texte")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Écrit le rapport JSON dans ce fichier")
+    parser.add_argument("--compare", help="Rapport JSON de référence à comparer")
+    args = parser.parse_args()
+
+    main.logger.setLevel("WARNING")
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    client_counts = [int(c) for c in args.clients.split(",") if c]
+    report = {
+        "python": sys.version.split()[0],
+        "started_at": datetime.now().isoformat(timespec="seconds"),
+        "config": vars(args),
+        "sizes": {},
+    }
+    for size in sizes:
+        print(f"📦 {size} annonces…", file=sys.stderr)
+        load_seconds, generator = load_store(size, args.seed)
+        gc.collect()
+        print(f"   chargées en {load_seconds:.1f}s ({size / load_seconds:.0f}/s), "
+              f"~{main.store.bytes / 1024 / 1024:.0f} Mo estimés", file=sys.stderr)
+        routes = asyncio.run(bench_routes(args.iterations, args.max_seconds, args.only))
+        broadcast = {}
+        if not args.only or "broadcast" in args.only:
+            broadcast = asyncio.run(bench_broadcast(client_counts, args.iterations, args.max_seconds, generator))
+        report["sizes"][str(size)] = {
+            "load": {"seconds": round(load_seconds, 2), "per_s": round(size / load_seconds),
+                     "store_mb": round(main.store.bytes / 1024 / 1024, 1)},
+            "routes": routes,
+            "broadcast": broadcast,
+        }
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        for line in compare(report, baseline):
+            print(line, file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,434 @@
+"""
+Banc de charge AutoTrack (sans toucher au vrai leboncoin)
+
+1. Démarre un faux leboncoin local qui sert des pages de résultats au format
+   de backend_leboncoin_debug.html, avec un flux de nouvelles annonces
+   (processus de Poisson) et des 403 / 429 / captchas injectables.
+2. Lance l'API (main.py) pointée dessus via LEBONCOIN_BASE_URL.
+3. Ouvre N clients /ws et envoie M req/s sur /api/vehicles.
+4. Rapporte la latence apparition -> push WebSocket, les p50/p99 de l'API
+   et la mémoire du process API dans le temps.
+
+Usage:
+    python loadtest.py --duration 60 --clients 50 --rps 20 --arrival-rate 1
+    python loadtest.py --max-api-p99-ms 200 --max-push-p99-s 30   # gate de release
+    python loadtest.py --workers 4   # process d'ingestion + 4 workers API
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import deque
+
+import httpx
+import uvicorn
+import websockets
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+BRANDS = {
+    "Renault": ["Clio", "Megane", "Captur", "Scenic"],
+    "Peugeot": ["208", "308", "3008", "2008"],
+    "Citroën": ["C3", "C4", "Berlingo"],
+    "Volkswagen": ["Golf", "Polo", "Tiguan"],
+    "Toyota": ["Yaris", "Corolla", "C-HR"],
+    "BMW": ["Serie 1", "Serie 3", "X1"],
+    "Dacia": ["Sandero", "Duster"],
+    "Ford": ["Fiesta", "Focus", "Kuga"],
+}
+CITIES = [
+    ("Paris", "75011"), ("Marseille", "13008"), ("Lyon", "69003"), ("Toulouse", "31000"),
+    ("Nantes", "44000"), ("Bordeaux", "33000"), ("Lille", "59000"), ("Rennes", "35000"),
+    ("Grenoble", "38000"), ("Dijon", "21000"),
+]
+FUELS = ["Essence", "Diesel", "Hybride", "Électrique"]
+GEARBOXES = ["Manuelle", "Automatique"]
+CAPTCHA_PAGE = "<html><body><h1>Please verify you are human</h1><div class='captcha'></div></body></html>"
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def format_thousands(value):
+    return f"{value:,}".replace(",", " ")
+
+
+# ============ FAUX LEBONCOIN ============
+
+class StandInSite:
+    """Faux leboncoin: annonces synthétiques, erreurs injectables"""
+
+    def __init__(self, arrival_rate=1.0, ads_per_page=35, pages=20,
+                 forbidden_rate=0.0, rate_limit_rate=0.0, captcha_rate=0.0):
+        self.arrival_rate = arrival_rate
+        self.ads_per_page = ads_per_page
+        self.ads = deque(maxlen=ads_per_page * pages)  # plus récente d'abord
+        self.created_at = {}  # id annonce -> time.time() d'apparition
+        self.next_id = 3000000000
+        self.forbidden_rate = forbidden_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.captcha_rate = captcha_rate
+        self.served = {"200": 0, "403": 0, "429": 0, "captcha": 0}
+        self.app = self._build_app()
+
+    def new_ad(self):
+        self.next_id += 1
+        brand = random.choice(list(BRANDS))
+        model = random.choice(BRANDS[brand])
+        city, zip_code = random.choice(CITIES)
+        year = random.randint(2008, 2024)
+        ad = {
+            "id": str(self.next_id),
+            "title": f"{brand} {model} {random.choice(['Business', 'Intens', 'Allure', 'Life', 'GT Line'])} réf {self.next_id} occasion",
+            "price": random.randint(20, 600) * 100,
+            "year": year,
+            "mileage": max(0, int(random.gauss((2025 - year) * 13000, 15000))),
+            "fuel": random.choice(FUELS),
+            "gearbox": random.choice(GEARBOXES),
+            "city": city,
+            "zip": zip_code,
+            "is_pro": random.random() < 0.3,
+            "image": f"https://img.leboncoin.fr/api/v1/lbcpb1/images/{self.next_id % 97:02x}/{self.next_id}.jpg?rule=ad-image",
+        }
+        self.ads.appendleft(ad)
+        self.created_at[ad["id"]] = time.time()
+        return ad
+
+    def seed(self, count):
+        for _ in range(count):
+            self.new_ad()
+        # Les annonces initiales ne comptent pas dans les latences
+        self.created_at.clear()
+
+    async def arrivals(self):
+        while True:
+            await asyncio.sleep(random.expovariate(self.arrival_rate))
+            self.new_ad()
+
+    def render_ad(self, ad):
+        return (
+            f'<article aria-label="{ad["title"]}" class="relative h-[inherit] group/adcard" '
+            f'data-qa-id="aditem_container" data-test-id="ad">'
+            f'<h3>{ad["title"]}</h3>'
+            f'<a aria-label="Voir l’annonce" class="absolute inset-0" href="/ad/voitures/{ad["id"]}">'
+            f'<span aria-hidden="true">{ad["title"]}</span></a>'
+            f'<div data-test-id="adcard-image"><img src="{ad["image"]}" alt="{ad["title"]}"/></div>'
+            f'<p data-qa-id="aditem_price"><span>{format_thousands(ad["price"])} €</span></p>'
+            f'<p>{ad["year"]} · {format_thousands(ad["mileage"])} km · {ad["fuel"]} · {ad["gearbox"]}</p>'
+            f'<p data-qa-id="aditem_location">{ad["city"]} ({ad["zip"]})</p>'
+            f'{"<span>Pro</span>" if ad["is_pro"] else ""}'
+            f'</article>'
+        )
+
+    def render_page(self, page):
+        start = (page - 1) * self.ads_per_page
+        ads = list(self.ads)[start:start + self.ads_per_page]
+        body = "".join(self.render_ad(ad) for ad in ads)
+        return (
+            '<html lang="fr"><head><title>Voitures d’occasion - leboncoin</title></head>'
+            f'<body><main><div data-test-id="listing-column">{body}</div></main></body></html>'
+        )
+
+    def _respond(self, page):
+        roll = random.random()
+        if roll < self.forbidden_rate:
+            self.served["403"] += 1
+            return HTMLResponse("Forbidden", status_code=403)
+        roll -= self.forbidden_rate
+        if roll < self.rate_limit_rate:
+            self.served["429"] += 1
+            return HTMLResponse("Too Many Requests", status_code=429)
+        roll -= self.rate_limit_rate
+        if roll < self.captcha_rate:
+            self.served["captcha"] += 1
+            return HTMLResponse(CAPTCHA_PAGE)
+        self.served["200"] += 1
+        return HTMLResponse(self.render_page(page))
+
+    def _build_app(self):
+        app = FastAPI()
+
+        @app.get("/voitures/offres")
+        async def listing(page: int = 1):
+            return self._respond(page)
+
+        @app.get("/recherche")
+        async def search(page: int = 1):
+            return self._respond(page)
+
+        return app
+
+
+# ============ HARNAIS ============
+
+class LoadTest:
+    def __init__(self, args):
+        self.args = args
+        self.site = StandInSite(
+            arrival_rate=args.arrival_rate,
+            forbidden_rate=args.forbidden_rate,
+            rate_limit_rate=args.rate_limit_rate,
+            captcha_rate=args.captcha_rate,
+        )
+        self.api_url = f"http://127.0.0.1:{args.api_port}"
+        self.push_latencies = []
+        self.pushed_ids = set()
+        self.ws_messages = 0
+        self.ws_errors = 0
+        self.api_latencies = []
+        self.api_errors = 0
+        self.api_sent = 0
+        self.memory = []  # (secondes depuis le début, RSS en Mo)
+        self.started = None
+        self.process = None
+
+    def api_env(self):
+        env = dict(os.environ)
+        env.update({
+            "LEBONCOIN_BASE_URL": f"http://127.0.0.1:{self.args.site_port}",
+            "AUTOTRACK_SCRAPE_INTERVAL": str(self.args.scan_interval),
+            "AUTOTRACK_MIN_DELAY": "0.05",
+            "AUTOTRACK_MAX_DELAY": "0.2",
+            "AUTOTRACK_BAN_RECOVERY_DELAY": "1",
+            "AUTOTRACK_REQUESTS_PER_MINUTE": "6000",
+            "AUTOTRACK_REQUESTS_PER_HOUR": "1000000",
+            "AUTOTRACK_SEARCHES_FILE": os.path.join(HERE, ".loadtest_searches.json"),
+            "AUTOTRACK_BUS_SOCKET": f"/tmp/autotrack_loadtest_{self.args.api_port}.sock",
+            "AUTOTRACK_INGEST_PORT": str(self.args.api_port + 1),
+        })
+        return env
+
+    def api_command(self):
+        if self.args.workers > 1:
+            return [sys.executable, "main.py", "--workers", str(self.args.workers),
+                    "--host", "127.0.0.1", "--port", str(self.args.api_port)]
+        return [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+                "--port", str(self.args.api_port), "--log-level", "warning"]
+
+    def rss_mb(self, pid=None):
+        """RSS du process API et de ses enfants (workers, ingestion)"""
+        pid = pid or self.process.pid
+        total = 0
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1]) / 1024
+            with open(f"/proc/{pid}/task/{pid}/children") as f:
+                children = [int(c) for c in f.read().split()]
+        except OSError:
+            return None
+        for child in children:
+            total += self.rss_mb(child) or 0
+        return total
+
+    async def wait_ready(self, client, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            try:
+                r = await client.get(self.api_url + "/")
+                if r.status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+        raise RuntimeError("L'API n'a pas démarré")
+
+    def on_vehicle(self, vehicle, received_at):
+        ad_id = vehicle.get("url", "").rsplit("/", 1)[-1]
+        created = self.site.created_at.get(ad_id)
+        if created is not None and ad_id not in self.pushed_ids:
+            self.pushed_ids.add(ad_id)
+            self.push_latencies.append(received_at - created)
+
+    async def ws_client(self):
+        url = self.api_url.replace("http", "ws") + "/ws"
+        try:
+            async with websockets.connect(url, max_size=None) as ws:
+                async for raw in ws:
+                    received_at = time.time()
+                    self.ws_messages += 1
+                    message = json.loads(raw)
+                    if message.get("type") == "new_vehicle":
+                        self.on_vehicle(message["vehicle"], received_at)
+                    elif message.get("type") == "new_vehicles":  # lot POST /api/ingest
+                        for vehicle in message["vehicles"]:
+                            self.on_vehicle(vehicle, received_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.ws_errors += 1
+
+    def random_query(self):
+        query = {"limit": random.choice([10, 50, 100])}
+        roll = random.random()
+        if roll < 0.3:
+            query["brand"] = random.choice(list(BRANDS))
+        elif roll < 0.45:
+            query["sort"] = random.choice(["price_asc", "price_desc"])
+        elif roll < 0.6:
+            query["min_price"] = random.randint(2000, 20000)
+            query["max_price"] = query["min_price"] + 15000
+        elif roll < 0.7:
+            query["page"] = random.randint(2, 10)
+        return query
+
+    async def api_request(self, client):
+        started = time.perf_counter()
+        try:
+            r = await client.get(self.api_url + "/api/vehicles", params=self.random_query())
+            if r.status_code != 200:
+                self.api_errors += 1
+                return
+            self.api_latencies.append(time.perf_counter() - started)
+        except httpx.HTTPError:
+            self.api_errors += 1
+
+    async def api_driver(self, client):
+        # Boucle ouverte: la charge offerte ne baisse pas si l'API ralentit
+        interval = 1 / self.args.rps
+        pending = set()
+        next_at = time.monotonic()
+        while True:
+            next_at += interval
+            task = asyncio.create_task(self.api_request(client))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+            self.api_sent += 1
+            await asyncio.sleep(max(next_at - time.monotonic(), 0))
+
+    async def memory_sampler(self):
+        while True:
+            rss = self.rss_mb()
+            if rss is not None:
+                self.memory.append((round(time.time() - self.started, 1), round(rss, 1)))
+            await asyncio.sleep(1)
+
+    async def run(self):
+        args = self.args
+        self.site.seed(self.site.ads_per_page * 10)
+        site_server = uvicorn.Server(uvicorn.Config(
+            self.site.app, host="127.0.0.1", port=args.site_port, log_level="warning"))
+        tasks = [asyncio.create_task(site_server.serve())]
+
+        log = open(os.path.join(HERE, "loadtest_api.log"), "w") if args.api_log else subprocess.DEVNULL
+        self.process = subprocess.Popen(
+            self.api_command(), cwd=HERE, env=self.api_env(), stdout=log, stderr=log,
+        )
+        try:
+            limits = httpx.Limits(max_connections=200, max_keepalive_connections=50)
+            async with httpx.AsyncClient(timeout=10, limits=limits) as client:
+                await self.wait_ready(client)
+                # Laisser le scan initial (sans notification) se terminer
+                await asyncio.sleep(args.warmup)
+
+                self.started = time.time()
+                tasks.append(asyncio.create_task(self.site.arrivals()))
+                tasks += [asyncio.create_task(self.ws_client()) for _ in range(args.clients)]
+                tasks.append(asyncio.create_task(self.api_driver(client)))
+                tasks.append(asyncio.create_task(self.memory_sampler()))
+
+                await asyncio.sleep(args.duration)
+        finally:
+            for task in tasks[1:]:
+                task.cancel()
+            site_server.should_exit = True
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.process.terminate()
+            self.process.wait(timeout=10)
+            if log is not subprocess.DEVNULL:
+                log.close()
+            if os.path.exists(os.path.join(HERE, ".loadtest_searches.json")):
+                os.remove(os.path.join(HERE, ".loadtest_searches.json"))
+
+        return self.report()
+
+    def report(self):
+        ms = lambda v: round(v * 1000, 1) if v is not None else None
+        s = lambda v: round(v, 2) if v is not None else None
+        created = len(self.site.created_at)
+        return {
+            "config": {
+                "duration_s": self.args.duration,
+                "ws_clients": self.args.clients,
+                "target_rps": self.args.rps,
+                "arrival_rate": self.args.arrival_rate,
+                "workers": self.args.workers,
+            },
+            "site": {"ads_created": created, "responses": self.site.served},
+            "ingest_to_push": {
+                "pushed": len(self.push_latencies),
+                "missed": created - len(self.push_latencies),
+                "p50_s": s(percentile(self.push_latencies, 0.5)),
+                "p99_s": s(percentile(self.push_latencies, 0.99)),
+                "max_s": s(max(self.push_latencies, default=None)),
+                "ws_messages": self.ws_messages,
+                "ws_errors": self.ws_errors,
+            },
+            "api": {
+                "sent": self.api_sent,
+                "ok": len(self.api_latencies),
+                "errors": self.api_errors,
+                "achieved_rps": round(len(self.api_latencies) / self.args.duration, 1),
+                "p50_ms": ms(percentile(self.api_latencies, 0.5)),
+                "p99_ms": ms(percentile(self.api_latencies, 0.99)),
+            },
+            "memory_mb": {
+                "start": self.memory[0][1] if self.memory else None,
+                "max": max((m for _, m in self.memory), default=None),
+                "end": self.memory[-1][1] if self.memory else None,
+                "samples": self.memory,
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Banc de charge AutoTrack")
+    parser.add_argument("--duration", type=float, default=60, help="Durée de la mesure (s)")
+    parser.add_argument("--warmup", type=float, default=5, help="Attente du scan initial (s)")
+    parser.add_argument("--clients", type=int, default=20, help="Clients WebSocket")
+    parser.add_argument("--rps", type=float, default=10, help="Requêtes/s sur /api/vehicles")
+    parser.add_argument("--arrival-rate", type=float, default=1.0, help="Nouvelles annonces/s sur le faux site")
+    parser.add_argument("--forbidden-rate", type=float, default=0.0, help="Proportion de réponses 403")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Proportion de réponses 429")
+    parser.add_argument("--captcha-rate", type=float, default=0.0, help="Proportion de pages captcha")
+    parser.add_argument("--scan-interval", type=float, default=1.0, help="AUTOTRACK_SCRAPE_INTERVAL de l'API")
+    parser.add_argument("--site-port", type=int, default=8765)
+    parser.add_argument("--api-port", type=int, default=8766)
+    parser.add_argument("--api-log", action="store_true", help="Logs de l'API dans loadtest_api.log")
+    parser.add_argument("--workers", type=int, default=1, help="Workers API (> 1: main.py --workers)")
+    parser.add_argument("--output", help="Écrit le rapport JSON dans ce fichier")
+    parser.add_argument("--max-api-p99-ms", type=float, help="Échec si p99 API au-dessus")
+    parser.add_argument("--max-push-p99-s", type=float, help="Échec si p99 ingestion -> push au-dessus")
+    args = parser.parse_args()
+
+    report = asyncio.run(LoadTest(args).run())
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+
+    failures = []
+    if args.max_api_p99_ms is not None and (report["api"]["p99_ms"] or 0) > args.max_api_p99_ms:
+        failures.append(f"p99 API {report['api']['p99_ms']}ms > {args.max_api_p99_ms}ms")
+    if args.max_push_p99_s is not None and (report["ingest_to_push"]["p99_s"] or float("inf")) > args.max_push_p99_s:
+        failures.append(f"p99 push {report['ingest_to_push']['p99_s']}s > {args.max_push_p99_s}s")
+    if failures:
+        print("❌ " + " | ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,21 +9,39 @@ AMÉLIORATIONS:
 - Délais intelligents entre requêtes
 """
 
-from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi import Body, FastAPI, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel
 from typing import Optional, List
+from urllib.parse import urlencode
 from datetime import datetime, timedelta
 import asyncio
 import os
 import re
 import logging
 from contextlib import asynccontextmanager
+from collections import OrderedDict, Counter, defaultdict, deque
 import json
 import math
 import httpx
+import numpy as np
 import random
 import time
 import hashlib
+from array import array
+import bisect
+from itertools import islice
+from functools import lru_cache
+import sys
+import threading
+import tracemalloc
+import gzip
+import zlib
+import mmap
+import csv
+import io
+import argparse
 
 # BeautifulSoup
 try:
@@ -41,15 +59,117 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 # ============ CONFIGURATION ANTI-BAN ============
-SCRAPE_INTERVAL_SECONDS = 10  # Augmenté pour éviter les bans
-MAX_DELAY_SECONDS = 8
-MIN_DELAY_SECONDS = 3
-BAN_RECOVERY_DELAY = 45  # Augmenté
+LEBONCOIN_BASE_URL = os.getenv("LEBONCOIN_BASE_URL", "https://www.leboncoin.fr").rstrip("/")
+SCRAPE_INTERVAL_SECONDS = float(os.getenv("AUTOTRACK_SCRAPE_INTERVAL", 10))  # Augmenté pour éviter les bans
+MAX_DELAY_SECONDS = float(os.getenv("AUTOTRACK_MAX_DELAY", 8))
+MIN_DELAY_SECONDS = float(os.getenv("AUTOTRACK_MIN_DELAY", 3))
+BAN_RECOVERY_DELAY = float(os.getenv("AUTOTRACK_BAN_RECOVERY_DELAY", 45))  # Augmenté
 MAX_CONSECUTIVE_403 = 1  # Rotation plus agressive
 MAX_REQUESTS_PER_SESSION = 15  # Limite de requêtes par session
-MAX_VEHICLES_IN_MEMORY = 10000
+MAX_VEHICLES_IN_MEMORY = int(os.getenv("AUTOTRACK_MAX_VEHICLES", 10000))
+STORE_MEMORY_BUDGET_MB = float(os.getenv("AUTOTRACK_STORE_BUDGET_MB", 0))  # 0 = limite en nombre seulement
 PAGES_TO_SCRAPE = [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
 
+# Budget global partagé entre toutes les recherches surveillées
+# Dimensionné sur la recherche par défaut (10 pages, MIN_DELAY_SECONDS entre pages, puis
+# SCRAPE_INTERVAL_SECONDS): ~15 req/min, le rythme de la boucle d'origine, qui n'est donc
+# pas ralentie. Chaque recherche ajoutée partage ce budget et scanne moins souvent.
+DEFAULT_REQUESTS_PER_MINUTE = len(PAGES_TO_SCRAPE) * 60 / (SCRAPE_INTERVAL_SECONDS + len(PAGES_TO_SCRAPE) * MIN_DELAY_SECONDS)
+GLOBAL_REQUESTS_PER_MINUTE = float(os.getenv("AUTOTRACK_REQUESTS_PER_MINUTE", round(DEFAULT_REQUESTS_PER_MINUTE, 1)))  # Débit max (token bucket)
+GLOBAL_REQUEST_BURST = 2
+GLOBAL_REQUESTS_PER_HOUR = int(os.getenv("AUTOTRACK_REQUESTS_PER_HOUR", int(GLOBAL_REQUESTS_PER_MINUTE * 60)))  # Budget horaire toutes recherches confondues
+SEARCHES_FILE = os.getenv("AUTOTRACK_SEARCHES_FILE", "searches.json")
+
+# Statistiques de marché (sketches de quantiles en streaming)
+MARKET_SKETCH_K = 128  # Précision des sketches KLL (~1-2% d'erreur de rang)
+MARKET_MAX_SKETCHES = 5000  # Mémoire bornée: sketches les moins récents évincés
+MARKET_MIN_SAMPLES = 5  # Échantillons minimum pour comparer au marché
+MARKET_YEAR_BUCKET = 2  # Tranches d'années
+MARKET_MILEAGE_BUCKET = 25000  # Tranches de kilométrage
+
+# Facettes (compteurs maintenus à chaque insertion/éviction)
+PRICE_BUCKETS = [0, 5000, 10000, 15000, 20000, 30000, 50000]
+
+# Watchdog de la boucle asyncio
+LOOP_WATCHDOG_INTERVAL = 0.1  # Période du battement (s)
+LOOP_LAG_THRESHOLD = 0.25  # Au-delà: capture de la pile bloquante (s)
+LOOP_LAG_HISTORY = 3000  # Mesures conservées pour les percentiles
+LOOP_MAX_OFFENDERS = 20
+PROFILE_MAX_SECONDS = 60
+
+# Détection des republications (SimHash + LSH)
+REPOST_MAX_DISTANCE = 3  # Distance de Hamming max entre empreintes 64 bits
+REPOST_MAX_PRICE_CHANGE = 0.25  # Écart de prix max entre l'original et la republication
+REPOST_MAX_MILEAGE_CHANGE = 2000  # Écart de kilométrage toléré (km, ou 5%)
+SUPPRESS_REPOST_BROADCASTS = os.getenv("AUTOTRACK_SUPPRESS_REPOSTS", "1") == "1"
+
+# Historique des prix
+PRICE_HISTORY_EPOCH = datetime(2020, 1, 1)  # Origine des temps (minutes) de l'historique
+PRICE_HISTORY_MAX_POINTS = 32  # Points conservés par annonce (les plus anciens sont fusionnés)
+
+# Pipeline d'ingestion (files bornées entre étapes)
+PIPELINE_QUEUE_SIZE = 16
+
+# Export en flux
+EXPORT_CHUNK_ROWS = 500  # Lignes par bloc envoyé (la boucle est rendue entre deux blocs)
+
+# Archive colonnaire (toutes les annonces ingérées, au-delà de MAX_VEHICLES_IN_MEMORY)
+ARCHIVE_DIR = os.getenv("AUTOTRACK_ARCHIVE_DIR", "archive")  # "" = désactivée
+ARCHIVE_ROLL = os.getenv("AUTOTRACK_ARCHIVE_ROLL", "hour")  # hour | day: période couverte par un segment
+ARCHIVE_FLUSH_SECONDS = float(os.getenv("AUTOTRACK_ARCHIVE_FLUSH", "60"))  # Écriture groupée en arrière-plan
+ARCHIVE_FLUSH_ROWS = 5000  # Flush anticipé au-delà de ce tampon
+ARCHIVE_MAX_MAPS = 64  # Segments gardés ouverts (mmap) entre deux lectures
+
+# Ingestion externe (POST /api/ingest: NDJSON d'annonces brutes ou de pages HTML)
+INGEST_MAX_BYTES = 64 * 1024 * 1024  # Corps de requête max (décompressé)
+INGEST_MAX_LINE_BYTES = 4 * 1024 * 1024  # Ligne max (une page HTML)
+INGEST_MAX_ADS = 5000  # Annonces max par lot (stocké sans rendre la main: ~0,1 ms par annonce)
+INGEST_PARSE_CHUNK = 200  # Lignes parsées par passage dans un thread
+INGEST_MAX_ERRORS = 50  # Erreurs détaillées renvoyées
+
+# Enregistrement / rejeu des scans
+RECORD_DIR = os.getenv("AUTOTRACK_RECORD_DIR")  # Active l'enregistrement des pages
+REPLAY_FILE = os.getenv("AUTOTRACK_REPLAY_FILE")  # Rejoue une archive au lieu du réseau
+
+# Multi-process: un process d'ingestion + N workers API reliés par un bus local
+ROLE = os.getenv("AUTOTRACK_ROLE", "all")  # all (process unique) | ingest | api
+API_WORKERS = int(os.getenv("AUTOTRACK_WORKERS", "1"))  # > 1: ingestion séparée + N workers API
+BUS_SOCKET = os.getenv("AUTOTRACK_BUS_SOCKET", "/tmp/autotrack_bus.sock")
+INGEST_PORT = int(os.getenv("AUTOTRACK_INGEST_PORT", "8002"))  # HTTP local du process d'ingestion
+BUS_SUBSCRIBER_QUEUE = 10000  # Événements en attente par worker (au-delà: resynchronisation)
+BUS_SNAPSHOT_CHUNK = 500  # Véhicules par message de snapshot
+BUS_LINE_LIMIT = 16 * 1024 * 1024
+BUS_CALL_TIMEOUT = 10
+
+# Alertes persistantes et livraison par webhooks
+ALERTS_FILE = os.getenv("AUTOTRACK_ALERTS_FILE", "alerts.json")
+OUTBOX_FILE = os.getenv("AUTOTRACK_OUTBOX_FILE", "alerts_outbox.jsonl")  # Journal durable des livraisons
+WEBHOOK_BATCH_SIZE = 50  # Alertes max par requête webhook
+WEBHOOK_BATCH_WINDOW = float(os.getenv("AUTOTRACK_WEBHOOK_BATCH_WINDOW", "2"))  # Attente max pour grouper (s)
+WEBHOOK_CONCURRENCY = 2  # Requêtes simultanées max par endpoint
+WEBHOOK_MAX_ATTEMPTS = 8  # Au-delà: lettre morte
+WEBHOOK_BACKOFF_BASE = float(os.getenv("AUTOTRACK_WEBHOOK_BACKOFF", "2"))  # 2s, 4s, 8s... par endpoint
+WEBHOOK_BACKOFF_MAX = 600
+WEBHOOK_TIMEOUT = 10
+OUTBOX_COMPACT_AFTER = 10000  # Lignes terminées avant réécriture du journal
+
+# Modèle de scoring (configuration JSON, rechargeable à chaud)
+SCORING_FILE = os.getenv("AUTOTRACK_SCORING_FILE", "scoring.json")
+DEFAULT_SCORING_MODEL = {
+    "base": 50,
+    "year_bonus": [[2022, 20], [2020, 15]],  # [seuil, points]: premier seuil atteint (année >=)
+    "mileage_bonus": [[50000, 15], [100000, 10]],  # premier seuil non atteint (km <)
+    "pro_bonus": -5,
+    "price_bonus": {"min": 5000, "max": 30000, "points": 5},
+    "min": 0,
+    "max": 100,
+}
+
+# Recherches par défaut (si aucun fichier de recherches)
+DEFAULT_SEARCHES = [
+    {"name": "Toutes les voitures", "params": {}, "pages": len(PAGES_TO_SCRAPE)},
+]
+
 # Configuration proxies (optionnel - à configurer si vous avez des proxies)
 USE_PROXIES = False
 PROXY_LIST = [
@@ -58,13 +178,9 @@ PROXY_LIST = [
     # "http://proxy2.com:8080",
 ]
 
-# Base de données en mémoire
-database = {
-    "vehicles": [],
-}
-
 # WebSocket clients
 websocket_clients = []
+websocket_pending = {}  # client -> octets de broadcasts pas encore remis à son send_text
 
 # User agents rotatifs ÉTENDUS
 USER_AGENTS = [
@@ -125,6 +241,881 @@ def get_city_coordinates(city: str) -> Optional[tuple]:
             return coords
     return None
 
+def distance_km(a: tuple, b: tuple) -> float:
+    """Distance à vol d'oiseau (haversine) entre deux (lat, lon)"""
+    lat1, lon1 = map(math.radians, a)
+    lat2, lon2 = map(math.radians, b)
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * 6371 * math.asin(math.sqrt(h))
+
+# ============ HORLOGE ============
+
+class Clock:
+    """Horloge réelle (toutes les attentes du pipeline passent par ici)"""
+    
+    simulated = False
+    
+    def now(self) -> datetime:
+        return datetime.now()
+    
+    def monotonic(self) -> float:
+        return time.monotonic()
+    
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(max(seconds, 0))
+
+class SimulatedClock(Clock):
+    """Horloge virtuelle: sleep() avance le temps instantanément (rejeu)"""
+    
+    simulated = True
+    
+    def __init__(self, start: float):
+        self.current = start  # epoch en secondes
+    
+    def now(self) -> datetime:
+        return datetime.fromtimestamp(self.current)
+    
+    def monotonic(self) -> float:
+        return self.current
+    
+    def advance_to(self, timestamp: float):
+        if timestamp > self.current:
+            self.current = timestamp
+    
+    async def sleep(self, seconds: float):
+        self.current += max(seconds, 0)
+        await asyncio.sleep(0)
+
+clock = Clock()
+
+def local_datetime(value) -> datetime:
+    """Date ISO 8601 -> datetime naïf en heure locale, comme clock.now() (décalage appliqué)"""
+    parsed = datetime.fromisoformat(str(value))
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+# ============ STOCKAGE VÉHICULES ============
+
+def get_department(location: str) -> Optional[str]:
+    """Département à partir de 'Ville (75001)'"""
+    if not location:
+        return None
+    match = re.search(r'\((\d{5})\)', location)
+    if not match:
+        return None
+    code = match.group(1)
+    return code[:3] if code.startswith("97") else code[:2]
+
+def get_price_bucket(price) -> Optional[str]:
+    """Tranche de prix ('5000-9999', '50000+')"""
+    if not price or price <= 0:
+        return None
+    idx = bisect.bisect_right(PRICE_BUCKETS, price) - 1
+    if idx == len(PRICE_BUCKETS) - 1:
+        return f"{PRICE_BUCKETS[idx]}+"
+    return f"{PRICE_BUCKETS[idx]}-{PRICE_BUCKETS[idx + 1] - 1}"
+
+# Dimension de facette -> valeur pour un véhicule
+FACET_EXTRACTORS = {
+    "brand": lambda v: v.get("brand"),
+    "fuel": lambda v: v.get("fuel"),
+    "gearbox": lambda v: v.get("gearbox"),
+    "year": lambda v: v.get("year"),
+    "price_bucket": lambda v: get_price_bucket(v.get("price")),
+    "department": lambda v: get_department(v.get("location")),
+}
+
+# Coût par véhicule hors dict (entrées _by_seq/_seq_by_id, index), mesuré avec tracemalloc
+VEHICLE_INDEX_OVERHEAD = 200
+
+def deep_size(value) -> int:
+    """Taille approximative retenue par un objet et son contenu (dicts, listes, __slots__)
+    
+    Estimation prudente: les chaînes et tuples partagés entre annonces (marque,
+    carburant, coordonnées) sont comptés à chaque fois (~+25% sur un véhicule).
+    """
+    # Singletons et petits entiers partagés: rien de retenu en propre
+    if value is None or isinstance(value, bool) or (isinstance(value, int) and -5 <= value <= 256):
+        return 0
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(deep_size(v) for v in value.values())
+    elif isinstance(value, (list, tuple, set, deque)):
+        size += sum(deep_size(v) for v in value)
+    elif hasattr(value, "__slots__"):
+        size += sum(deep_size(getattr(value, name, None)) for name in value.__slots__)
+    return size
+
+def sampled_size(collection, sample: int = 1000) -> int:
+    """Taille d'une grande collection estimée sur un échantillon (sans tout parcourir)"""
+    size = sys.getsizeof(collection)
+    count = len(collection)
+    if not count:
+        return size
+    items = list(islice(collection.values() if isinstance(collection, dict) else collection, sample))
+    return size + int(sum(deep_size(item) for item in items) / len(items) * count)
+
+class VehicleColumns:
+    """Colonnes NumPy (année, km, prix, pro, octets) alignées sur les séquences du store
+    
+    Slot = seq % capacité: les séquences présentes sont contiguës et au plus
+    `capacité`, donc chaque véhicule a son propre slot; l'éviction n'a rien à
+    faire, le slot sera réécrit. Permet de rescorer sans parcourir les dicts.
+    """
+    
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.year = np.zeros(capacity, dtype=np.int16)  # 0 = inconnue
+        self.mileage = np.full(capacity, -1, dtype=np.int32)  # -1 = inconnu
+        self.price = np.zeros(capacity, dtype=np.int32)
+        self.is_pro = np.zeros(capacity, dtype=np.bool_)
+        self.nbytes = np.zeros(capacity, dtype=np.int32)  # taille estimée du véhicule
+    
+    def memory(self):
+        return self.year.nbytes + self.mileage.nbytes + self.price.nbytes + self.is_pro.nbytes + self.nbytes.nbytes
+    
+    def set(self, seq, vehicle):
+        slot = seq % self.capacity
+        self.year[slot] = vehicle.get("year") or 0
+        mileage = vehicle.get("mileage")
+        self.mileage[slot] = mileage if mileage is not None else -1
+        self.price[slot] = vehicle.get("price") or 0
+        self.is_pro[slot] = bool(vehicle.get("is_pro"))
+    
+    def set_price(self, seq, price):
+        self.price[seq % self.capacity] = price or 0
+    
+    def take(self, first_seq, next_seq):
+        """Copie des colonnes pour les séquences [first_seq, next_seq)"""
+        slots = np.arange(first_seq, next_seq) % self.capacity
+        return self.year[slots], self.mileage[slots], self.price[slots], self.is_pro[slots]
+
+class VehicleStore:
+    """Stockage en mémoire: ordre d'insertion, index et compteurs de facettes
+    
+    Chaque véhicule reçoit un numéro de séquence croissant; l'éviction se fait
+    toujours par le plus ancien, donc les séquences présentes sont contiguës.
+    """
+    
+    def __init__(self, max_size: int = MAX_VEHICLES_IN_MEMORY, max_bytes: int = 0):
+        self.max_size = max_size
+        self.max_bytes = max_bytes  # budget mémoire des véhicules (0 = aucun)
+        self.bytes = 0  # octets retenus estimés (véhicules + index)
+        self.evicted_for_budget = 0
+        self._by_seq = {}  # seq -> véhicule (plus ancien d'abord)
+        self._seq_by_id = {}
+        self.first_seq = 0
+        self.next_seq = 0
+        self.brand_index = defaultdict(set)  # marque (minuscule) -> seqs
+        self.location_index = defaultdict(set)  # localisation (minuscule) -> seqs
+        self.facets = {name: Counter() for name in FACET_EXTRACTORS}
+        self.columns = VehicleColumns(max_size)
+        self.evict_listeners = []  # appelés avec chaque véhicule évincé
+    
+    def __len__(self):
+        return len(self._by_seq)
+    
+    def __contains__(self, vehicle_id):
+        return vehicle_id in self._seq_by_id
+    
+    def get(self, vehicle_id):
+        seq = self._seq_by_id.get(vehicle_id)
+        return self._by_seq.get(seq) if seq is not None else None
+    
+    def _index(self, seq, vehicle, delta):
+        brand = (vehicle.get("brand") or "").lower()
+        location = (vehicle.get("location") or "").lower()
+        if delta > 0:
+            self.brand_index[brand].add(seq)
+            self.location_index[location].add(seq)
+        else:
+            self._discard(self.brand_index, brand, seq)
+            self._discard(self.location_index, location, seq)
+        for name, extract in FACET_EXTRACTORS.items():
+            value = extract(vehicle)
+            if value is not None:
+                counter = self.facets[name]
+                counter[value] += delta
+                if counter[value] <= 0:
+                    del counter[value]
+    
+    @staticmethod
+    def _discard(index, key, seq):
+        seqs = index.get(key)
+        if seqs is not None:
+            seqs.discard(seq)
+            if not seqs:
+                del index[key]
+    
+    def seq_of(self, vehicle_id):
+        return self._seq_by_id.get(vehicle_id)
+    
+    def add(self, vehicle: dict, seq: Optional[int] = None) -> list:
+        """Ajoute un véhicule (le plus récent). Retourne les véhicules évincés
+        
+        seq: séquence imposée (réplica: celle du process d'ingestion, pour que
+        les curseurs d'export soient valables sur tous les workers)
+        """
+        evicted = []
+        if seq is None or seq < self.next_seq:
+            seq = self.next_seq
+        elif not self._by_seq:
+            self.first_seq = seq
+        else:
+            # Trou de séquences: libérer d'abord les slots de colonnes réutilisés
+            while self._by_seq and seq - self.first_seq >= self.columns.capacity:
+                evicted.append(self._evict_oldest())
+            if not self._by_seq:
+                self.first_seq = seq
+        self.next_seq = seq + 1
+        self._by_seq[seq] = vehicle
+        self._seq_by_id[vehicle["id"]] = seq
+        self._index(seq, vehicle, 1)
+        self.columns.set(seq, vehicle)
+        size = deep_size(vehicle) + VEHICLE_INDEX_OVERHEAD
+        self.columns.nbytes[seq % self.columns.capacity] = size
+        self.bytes += size
+        
+        while len(self._by_seq) > self.max_size:
+            evicted.append(self._evict_oldest())
+        # Budget mémoire: on garde toujours au moins le véhicule ajouté
+        while self.max_bytes and self.bytes > self.max_bytes and len(self._by_seq) > 1:
+            evicted.append(self._evict_oldest())
+            self.evicted_for_budget += 1
+        return evicted
+    
+    def clear(self):
+        """Vide le store (resynchronisation d'un réplica), écouteurs conservés"""
+        self._by_seq.clear()
+        self._seq_by_id.clear()
+        self.first_seq = self.next_seq = 0
+        self.bytes = 0
+        self.brand_index.clear()
+        self.location_index.clear()
+        for counter in self.facets.values():
+            counter.clear()
+    
+    def update_price(self, vehicle_id, price):
+        """Change le prix d'un véhicule stocké (facettes, score et écart au marché recalculés)"""
+        seq = self._seq_by_id.get(vehicle_id)
+        if seq is None:
+            return None
+        vehicle = self._by_seq[seq]
+        self._index(seq, vehicle, -1)
+        vehicle["price"] = price
+        vehicle["score"] = scoring.score_vehicle(vehicle)
+        # Comparé au marché sans nouvel échantillon: l'annonce y figure déjà
+        market.compare(vehicle)
+        self._index(seq, vehicle, 1)
+        self.columns.set_price(seq, price)
+        return vehicle
+    
+    def _evict_oldest(self):
+        while self.first_seq not in self._by_seq:
+            self.first_seq += 1
+        seq = self.first_seq
+        vehicle = self._by_seq.pop(seq)
+        self.bytes -= int(self.columns.nbytes[seq % self.columns.capacity])
+        if self._seq_by_id.get(vehicle["id"]) == seq:
+            del self._seq_by_id[vehicle["id"]]
+        self._index(seq, vehicle, -1)
+        self.first_seq += 1
+        for listener in self.evict_listeners:
+            listener(vehicle)
+        return vehicle
+    
+    def recent(self):
+        """Itère du plus récent au plus ancien (sans copie)"""
+        by_seq = self._by_seq
+        for seq in range(self.next_seq - 1, self.first_seq - 1, -1):
+            vehicle = by_seq.get(seq)
+            if vehicle is not None:
+                yield vehicle
+    
+    def _candidates(self, brand=None, location=None):
+        """Séquences candidates (plus récentes d'abord) via les index"""
+        seqs = None
+        if brand:
+            seqs = self.brand_index.get(brand.lower(), set())
+        if location and location.strip().isdigit():
+            # Code postal ou département: même résultat que la recherche par sous-chaîne
+            # (_matches), mais sur les localisations distinctes plutôt que sur chaque annonce
+            wanted = location.lower()
+            location_seqs = set()
+            for name, name_seqs in self.location_index.items():
+                if wanted in name:
+                    location_seqs |= name_seqs
+            seqs = location_seqs if seqs is None else seqs & location_seqs
+        if seqs is None:
+            return None
+        return sorted(seqs, reverse=True)
+    
+    @staticmethod
+    def _matches(v, location=None, min_price=None, max_price=None):
+        """Filtres hors index (location déjà en minuscules)"""
+        if location and location not in (v.get("location") or "").lower():
+            return False
+        if min_price and v.get("price", 0) < min_price:
+            return False
+        if max_price and v.get("price", 0) > max_price:
+            return False
+        return True
+    
+    def query(self, brand=None, location=None, min_price=None, max_price=None):
+        """Véhicules filtrés, du plus récent au plus ancien"""
+        seqs = self._candidates(brand, location)
+        vehicles = self.recent() if seqs is None else (self._by_seq[s] for s in seqs)
+        location = location.lower() if location else None
+        for v in vehicles:
+            if self._matches(v, location, min_price, max_price):
+                yield v
+    
+    def scan(self, after=-1, until=None, brand=None, location=None, min_price=None, max_price=None):
+        """(seq, véhicule) filtrés, du plus ancien au plus récent, après le curseur `after`
+        
+        Mémoire constante: les index ne sont pas copiés, seulement consultés
+        séquence par séquence (sûr si le store change entre deux itérations).
+        """
+        until = self.next_seq if until is None else until
+        brand_key = brand.lower() if brand else None
+        location = location.lower() if location else None
+        for seq in range(max(after + 1, self.first_seq), until):
+            if brand_key is not None and seq not in self.brand_index.get(brand_key, ()):
+                continue
+            v = self._by_seq.get(seq)
+            if v is not None and self._matches(v, location, min_price, max_price):
+                yield seq, v
+    
+    def facet_counts(self, brand=None, location=None, min_price=None, max_price=None):
+        """Compteurs de facettes, globaux ou restreints aux filtres"""
+        if not (brand or location or min_price or max_price):
+            return {
+                "total": len(self),
+                "facets": {name: dict(counter) for name, counter in self.facets.items()},
+            }
+        total = 0
+        counts = {name: Counter() for name in FACET_EXTRACTORS}
+        for v in self.query(brand, location, min_price, max_price):
+            total += 1
+            for name, extract in FACET_EXTRACTORS.items():
+                value = extract(v)
+                if value is not None:
+                    counts[name][value] += 1
+        return {
+            "total": total,
+            "facets": {name: dict(counter) for name, counter in counts.items()},
+        }
+
+store = VehicleStore(MAX_VEHICLES_IN_MEMORY, int(STORE_MEMORY_BUDGET_MB * 1024 * 1024))
+
+# ============ SCORING ============
+
+class ScoringModel:
+    """Règles de score issues de la configuration (scalaire et vectorisé)"""
+    
+    def __init__(self, config: dict):
+        config = {**DEFAULT_SCORING_MODEL, **(config or {})}
+        try:
+            self.base = float(config["base"])
+            # Année: seuils décroissants (le plus haut atteint gagne)
+            self.year_bonus = sorted(((int(t), float(p)) for t, p in config["year_bonus"]), reverse=True)
+            # Kilométrage: seuils croissants (le plus bas non atteint gagne)
+            self.mileage_bonus = sorted((int(t), float(p)) for t, p in config["mileage_bonus"])
+            self.pro_bonus = float(config["pro_bonus"])
+            price_bonus = config["price_bonus"]
+            self.price_min = int(price_bonus["min"])
+            self.price_max = int(price_bonus["max"])
+            self.price_points = float(price_bonus["points"])
+            self.low, self.high = float(config["min"]), float(config["max"])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Modèle de scoring invalide: {e}")
+        if self.low > self.high:
+            raise ValueError("Modèle de scoring invalide: min > max")
+    
+    def score(self, year, mileage, price, is_pro) -> float:
+        score = self.base
+        if year:
+            score += next((p for t, p in self.year_bonus if year >= t), 0)
+        if mileage is not None:
+            score += next((p for t, p in self.mileage_bonus if mileage < t), 0)
+        if is_pro:
+            score += self.pro_bonus
+        if price and self.price_min <= price <= self.price_max:
+            score += self.price_points
+        return round(min(max(score, self.low), self.high), 1)
+    
+    def score_columns(self, year, mileage, price, is_pro):
+        """Même calcul sur des colonnes NumPy, en une passe"""
+        score = np.full(len(year), self.base)
+        if self.year_bonus:
+            score += np.select([year >= t for t, _ in self.year_bonus], [p for _, p in self.year_bonus], 0)
+        if self.mileage_bonus:
+            known = mileage >= 0
+            score += np.select([known & (mileage < t) for t, _ in self.mileage_bonus],
+                               [p for _, p in self.mileage_bonus], 0)
+        score += np.where(is_pro, self.pro_bonus, 0)
+        score += np.where((price > 0) & (price >= self.price_min) & (price <= self.price_max), self.price_points, 0)
+        np.clip(score, self.low, self.high, out=score)
+        return np.round(score, 1)
+    
+    def to_dict(self):
+        return {
+            "base": self.base,
+            "year_bonus": [list(rule) for rule in self.year_bonus],
+            "mileage_bonus": [list(rule) for rule in self.mileage_bonus],
+            "pro_bonus": self.pro_bonus,
+            "price_bonus": {"min": self.price_min, "max": self.price_max, "points": self.price_points},
+            "min": self.low,
+            "max": self.high,
+        }
+
+class ScoringEngine:
+    """Modèle courant + rescoring du store entier en une passe vectorisée"""
+    
+    def __init__(self, scoring_file: Optional[str] = None):
+        self.scoring_file = scoring_file
+        self.model = ScoringModel(DEFAULT_SCORING_MODEL)
+        self.version = 1
+        self.last_run = None
+        self.lock = asyncio.Lock()
+    
+    def load(self):
+        if not self.scoring_file or not os.path.exists(self.scoring_file):
+            return
+        try:
+            with open(self.scoring_file, encoding="utf-8") as f:
+                self.model = ScoringModel(json.load(f))
+        except Exception as e:
+            logger.error(f"❌ Lecture {self.scoring_file}: {str(e)[:100]}")
+    
+    def save(self):
+        if not self.scoring_file:
+            return
+        try:
+            with open(self.scoring_file, "w", encoding="utf-8") as f:
+                json.dump(self.model.to_dict(), f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"❌ Écriture {self.scoring_file}: {str(e)[:100]}")
+    
+    def score_vehicle(self, vehicle: dict) -> float:
+        return self.model.score(vehicle.get("year"), vehicle.get("mileage"), vehicle.get("price") or 0, vehicle.get("is_pro"))
+    
+    async def rescore(self, model: Optional[ScoringModel] = None) -> dict:
+        """Recalcule tous les scores puis bascule d'un bloc (sans await) vers le nouveau modèle"""
+        async with self.lock:
+            return await self._rescore(model or self.model)
+    
+    async def _rescore(self, model: ScoringModel) -> dict:
+        started = time.perf_counter()
+        first_seq, next_seq = store.first_seq, store.next_seq
+        columns = store.columns.take(first_seq, next_seq)
+        scores = await asyncio.to_thread(model.score_columns, *columns)
+        computed = time.perf_counter()
+        
+        # Bascule atomique vis-à-vis de la boucle: aucune requête ne voit un mélange
+        self.model = model
+        self.version += 1
+        by_seq = store._by_seq
+        for seq, score in zip(range(first_seq, next_seq), scores.tolist()):
+            vehicle = by_seq.get(seq)
+            if vehicle is not None:
+                vehicle["score"] = score
+        # Annonces arrivées pendant le calcul: scorées avec le nouveau modèle
+        for seq in range(next_seq, store.next_seq):
+            vehicle = by_seq.get(seq)
+            if vehicle is not None:
+                vehicle["score"] = self.score_vehicle(vehicle)
+        finished = time.perf_counter()
+        
+        self.last_run = {
+            "version": self.version,
+            "vehicles": next_seq - first_seq,
+            "compute_ms": round((computed - started) * 1000, 1),
+            "swap_ms": round((finished - computed) * 1000, 1),
+            "at": clock.now().isoformat(),
+        }
+        logger.info(f"🧮 Rescoring v{self.version}: {self.last_run['vehicles']} annonces "
+                    f"({self.last_run['compute_ms']}ms calcul, {self.last_run['swap_ms']}ms bascule)")
+        return self.last_run
+    
+    def to_dict(self):
+        return {"version": self.version, "model": self.model.to_dict(), "last_run": self.last_run}
+
+scoring = ScoringEngine(SCORING_FILE)
+
+# ============ URL DE RECHERCHE ============
+
+# Paramètres de recherche supportés -> paramètres leboncoin
+FUEL_CODES = {"essence": "1", "diesel": "2", "électrique": "4", "hybride": "6"}
+GEARBOX_CODES = {"manuelle": "1", "automatique": "2"}
+
+def normalize_search_params(params: dict) -> dict:
+    """Normalise une recherche (casse, espaces, types) pour la dédupliquer"""
+    normalized = {}
+    for key in ("brand", "model", "region", "fuel", "gearbox"):
+        value = params.get(key)
+        if value and str(value).strip():
+            normalized[key] = re.sub(r'\s+', ' ', str(value).strip().lower())
+    for key in ("price_min", "price_max", "year_min", "year_max", "mileage_max"):
+        value = params.get(key)
+        if value not in (None, ""):
+            normalized[key] = int(value)
+    return normalized
+
+def search_key(params: dict) -> str:
+    """Clé canonique d'une recherche normalisée"""
+    return urlencode(sorted(normalize_search_params(params).items()))
+
+def build_search_url(params: dict, page_num: int = 1) -> str:
+    """Construit l'URL leboncoin d'une recherche"""
+    params = normalize_search_params(params)
+    
+    # Recherche vide: listing voitures historique
+    if not params:
+        if page_num == 1:
+            return f"{LEBONCOIN_BASE_URL}/voitures/offres"
+        return f"{LEBONCOIN_BASE_URL}/voitures/offres?page={page_num}"
+    
+    query = {"category": "2"}
+    if "brand" in params:
+        query["u_car_brand"] = params["brand"].upper()
+    if "model" in params:
+        query["u_car_model"] = f"{params['brand'].capitalize()}_{params['model'].capitalize()}" if "brand" in params else params["model"]
+    if "region" in params:
+        query["locations"] = params["region"]
+    if "price_min" in params or "price_max" in params:
+        query["price"] = f"{params.get('price_min', 'min')}-{params.get('price_max', 'max')}"
+    if "year_min" in params or "year_max" in params:
+        query["regdate"] = f"{params.get('year_min', 'min')}-{params.get('year_max', 'max')}"
+    if "mileage_max" in params:
+        query["mileage"] = f"min-{params['mileage_max']}"
+    if params.get("fuel") in FUEL_CODES:
+        query["fuel"] = FUEL_CODES[params["fuel"]]
+    if params.get("gearbox") in GEARBOX_CODES:
+        query["gearbox"] = GEARBOX_CODES[params["gearbox"]]
+    if page_num > 1:
+        query["page"] = str(page_num)
+    
+    return f"{LEBONCOIN_BASE_URL}/recherche?{urlencode(query)}"
+
+# ============ MÉTRIQUES ============
+
+# Buckets préalloués (secondes / nombres)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 5, 10, 20, 30, 40, 50, 75, 100)
+NOTIFY_BUCKETS = (0.1, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0, 300.0)
+
+def _format_labels(label_name, label):
+    if label_name is None:
+        return ""
+    return f'{{{label_name}="{label}"}}'
+
+class MetricCounter:
+    """Compteur monotone (une série par valeur d'étiquette)"""
+    
+    def __init__(self, name, help_text, label_name=None):
+        self.name = name
+        self.help = help_text
+        self.label_name = label_name
+        self.values = defaultdict(int)
+    
+    def inc(self, label=None, amount=1):
+        self.values[label] += amount
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.label_name, label)} {value}")
+        return lines
+
+class MetricGauge:
+    """Jauge évaluée à la lecture (aucun coût sur le chemin critique)
+    
+    Avec label_name, read() retourne un dict {étiquette: valeur}.
+    """
+    
+    def __init__(self, name, help_text, read, label_name=None):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.label_name = label_name
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} gauge"]
+        if self.label_name is None:
+            lines.append(f"{self.name} {self.read()}")
+        else:
+            for label, value in self.read().items():
+                lines.append(f"{self.name}{_format_labels(self.label_name, label)} {value}")
+        return lines
+
+class MetricHistogram:
+    """Histogramme à buckets fixes: observe() = bisect + incrément, sans allocation"""
+    
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS, label_name=None):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.label_name = label_name
+        self.series = {}  # label -> [compteurs par bucket..., +Inf, somme]
+    
+    def _new_series(self, label):
+        series = self.series[label] = [0] * (len(self.buckets) + 2)
+        return series
+    
+    def observe(self, value, label=None):
+        series = self.series.get(label)
+        if series is None:
+            series = self._new_series(label)
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+    
+    def quantile(self, q, label=None):
+        """Quantile approché (borne supérieure du bucket)"""
+        series = self.series.get(label)
+        if not series:
+            return None
+        total = sum(series[:-1])
+        target = q * total
+        cumulative = 0
+        for bound, count in zip(self.buckets, series):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for label, series in self.series.items():
+            prefix = f'{self.label_name}="{label}",' if self.label_name else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            labels = _format_labels(self.label_name, label)
+            lines.append(f"{self.name}_sum{labels} {series[-1]}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+class MetricsRegistry:
+    """Registre exposé au format texte Prometheus sur /metrics"""
+    
+    def __init__(self):
+        self.metrics = []
+    
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+    
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+metrics = MetricsRegistry()
+FETCH_LATENCY = metrics.register(MetricHistogram(
+    "autotrack_fetch_seconds", "Durée des requêtes leboncoin par code HTTP", label_name="status"))
+PARSE_LATENCY = metrics.register(MetricHistogram(
+    "autotrack_parse_seconds", "Temps de parsing HTML par page"))
+ADS_PER_PAGE = metrics.register(MetricHistogram(
+    "autotrack_ads_per_page", "Annonces extraites par page", buckets=COUNT_BUCKETS))
+DEDUP_RESULTS = metrics.register(MetricCounter(
+    "autotrack_dedup_total", "Résultats de la déduplication (hit = déjà vue)", label_name="result"))
+REPOSTS = metrics.register(MetricCounter(
+    "autotrack_reposts_total", "Annonces détectées comme republications"))
+ALERT_MATCHES = metrics.register(MetricCounter(
+    "autotrack_alert_matches_total", "Annonces correspondant à une règle d'alerte"))
+WEBHOOK_DELIVERIES = metrics.register(MetricCounter(
+    "autotrack_webhook_batches_total", "Envois webhook par résultat", label_name="result"))
+metrics.register(MetricGauge(
+    "autotrack_outbox_pending", "Alertes en attente de livraison", lambda: outbox.pending_count()))
+PRICE_CHANGES = metrics.register(MetricCounter(
+    "autotrack_price_changes_total", "Changements de prix sur des annonces connues", label_name="direction"))
+BROADCAST_LATENCY = metrics.register(MetricHistogram(
+    "autotrack_broadcast_seconds", "Durée d'un broadcast WebSocket (tous clients)"))
+API_LATENCY = metrics.register(MetricHistogram(
+    "autotrack_http_request_seconds", "Latence des requêtes API par route", label_name="route"))
+metrics.register(MetricGauge(
+    "autotrack_store_vehicles", "Véhicules en mémoire", lambda: len(store)))
+metrics.register(MetricGauge(
+    "autotrack_store_bytes", "Octets estimés retenus par le store", lambda: store.bytes))
+INGEST_ADS = metrics.register(MetricCounter(
+    "autotrack_ingest_ads_total", "Annonces reçues via /api/ingest par résultat", label_name="result"))
+ARCHIVE_ROWS = metrics.register(MetricCounter(
+    "autotrack_archive_rows_total", "Annonces écrites dans l'archive"))
+metrics.register(MetricGauge(
+    "autotrack_archive_pending", "Annonces en attente d'écriture dans l'archive", lambda: len(archive.pending)))
+metrics.register(MetricGauge(
+    "autotrack_websocket_clients", "Clients WebSocket connectés", lambda: len(websocket_clients)))
+metrics.register(MetricGauge(
+    "autotrack_pipeline_queue_depth", "Pages en attente par étape du pipeline",
+    lambda: pipeline.depths(), label_name="stage"))
+
+TIME_TO_NOTIFY = metrics.register(MetricHistogram(
+    "autotrack_time_to_notify_seconds", "Délai entre détection d'une annonce et son broadcast",
+    buckets=NOTIFY_BUCKETS))
+LOOP_LAG = metrics.register(MetricHistogram(
+    "autotrack_event_loop_lag_seconds", "Retard de la boucle asyncio"))
+
+class MetricsMiddleware:
+    """Middleware ASGI: latence par route (modèle de chemin, pas l'URL brute)"""
+    
+    def __init__(self, app):
+        self.app = app
+        self.route_paths = {}
+    
+    def _route_label(self, scope):
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        label = self.route_paths.get(endpoint)
+        if label is None:
+            label = next((r.path for r in scope["app"].routes if getattr(r, "endpoint", None) is endpoint), "unknown")
+            self.route_paths[endpoint] = label
+        return label
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            API_LATENCY.observe(time.perf_counter() - started, self._route_label(scope))
+
+# ============ WATCHDOG BOUCLE ASYNCIO ============
+
+def _collapse_stack(frame, limit: int = 40) -> str:
+    """Pile au format 'fichier:fonction:ligne;...' (de la racine vers le haut)"""
+    parts = []
+    while frame is not None and len(parts) < limit:
+        code = frame.f_code
+        parts.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+        frame = frame.f_back
+    return ";".join(reversed(parts))
+
+class LoopWatchdog:
+    """Mesure le retard de la boucle et capture la pile de ce qui la bloque
+    
+    Un battement tourne sur la boucle; un thread de surveillance détecte quand
+    il ne bat plus et capture la pile du thread de la boucle pendant le blocage.
+    """
+    
+    def __init__(self, interval: float = LOOP_WATCHDOG_INTERVAL, threshold: float = LOOP_LAG_THRESHOLD):
+        self.interval = interval
+        self.threshold = threshold
+        self.lags = deque(maxlen=LOOP_LAG_HISTORY)
+        self.offenders = deque(maxlen=LOOP_MAX_OFFENDERS)
+        self.max_lag = 0.0
+        self.last_beat = time.monotonic()
+        self.loop_thread_id = None
+        self.running = False
+        self.profiling = False
+        self._task = None
+        self._thread = None
+        self._pending = None  # blocage en cours (capturé par le thread)
+    
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.loop_thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._monitor, name="loop-watchdog", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self.running = False
+        if self._task:
+            self._task.cancel()
+    
+    async def _heartbeat(self):
+        while self.running:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(now - expected, 0.0)
+            self.last_beat = now
+            self.lags.append(lag)
+            LOOP_LAG.observe(lag)
+            if lag > self.max_lag:
+                self.max_lag = lag
+            
+            pending = self._pending
+            if pending is not None:
+                self._pending = None
+                pending["lag"] = round(lag, 3)
+                logger.warning(f"🐢 Boucle bloquée {lag * 1000:.0f}ms: {pending['stack'].rsplit(';', 1)[-1]}")
+    
+    def _monitor(self):
+        """Thread: capture la pile du thread de la boucle pendant un blocage"""
+        while self.running:
+            time.sleep(self.interval / 2)
+            stalled = time.monotonic() - self.last_beat - self.interval
+            if stalled < self.threshold or self._pending is not None:
+                continue
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is None:
+                continue
+            offender = {
+                "detected_at": datetime.now().isoformat(),
+                "lag": round(stalled, 3),
+                "stack": _collapse_stack(frame),
+            }
+            self._pending = offender
+            self.offenders.append(offender)
+    
+    def percentiles(self):
+        lags = sorted(self.lags)
+        if not lags:
+            return {}
+        pick = lambda q: round(lags[min(int(q * len(lags)), len(lags) - 1)] * 1000, 2)
+        return {"p50_ms": pick(0.5), "p90_ms": pick(0.9), "p99_ms": pick(0.99), "max_ms": round(self.max_lag * 1000, 2)}
+    
+    def _sample(self, seconds: float, interval: float):
+        samples = Counter()
+        deadline = time.monotonic() + seconds
+        total = 0
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is not None:
+                samples[_collapse_stack(frame)] += 1
+                total += 1
+            time.sleep(interval)
+        return total, samples
+    
+    async def profile(self, seconds: float, interval: float = 0.005, top: int = 50):
+        """Profilage par échantillonnage du thread de la boucle pendant N secondes"""
+        if self.profiling:
+            raise RuntimeError("Profilage déjà en cours")
+        self.profiling = True
+        try:
+            total, samples = await asyncio.to_thread(self._sample, seconds, interval)
+        finally:
+            self.profiling = False
+        
+        # Temps "self" par fonction (haut de pile) et piles complètes
+        functions = Counter()
+        for stack, count in samples.items():
+            functions[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "seconds": seconds,
+            "samples": total,
+            "top_functions": [
+                {"function": name, "samples": count, "ratio": round(count / total, 3)}
+                for name, count in functions.most_common(top)
+            ] if total else [],
+            "stacks": [
+                {"stack": stack, "samples": count}
+                for stack, count in samples.most_common(top)
+            ],
+        }
+
+watchdog = LoopWatchdog()
+
 # ============ SCRAPER ANTI-BAN ============
 
 class AntiBanScraper:
@@ -144,8 +1135,16 @@ class AntiBanScraper:
         self.total_errors = 0
         self.current_proxy = None
         self.proxy_index = 0
-        self.success_rate = []  # Historique des succès
+        self.success_rate = deque(maxlen=20)  # Historique des succès
         self.adaptive_delay = MIN_DELAY_SECONDS
+        self.replay = None  # Source de rejeu (au lieu du réseau)
+    
+    def recent_success_rate(self, n: int = 5):
+        """Taux de succès sur les n dernières requêtes"""
+        if not self.success_rate:
+            return 0
+        recent = list(islice(reversed(self.success_rate), n))
+        return sum(recent) / len(recent)
     
     def _get_next_proxy(self):
         """Obtient le prochain proxy dans la rotation"""
@@ -209,7 +1208,7 @@ class AntiBanScraper:
         if self.client:
             try:
                 await self.client.aclose()
-                await asyncio.sleep(random.uniform(0.5, 1.5))  # Pause avant nouvelle session
+                await clock.sleep(random.uniform(0.5, 1.5))  # Pause avant nouvelle session
             except:
                 pass
         
@@ -218,6 +1217,14 @@ class AntiBanScraper:
             self.current_proxy = self._get_next_proxy()
             logger.info(f"🔄 Proxy: {self.current_proxy}")
         
+        # Pas de client réseau en rejeu
+        if self.replay:
+            self.session_created_at = clock.now()
+            self.session_request_count = 0
+            self.consecutive_403 = 0
+            self.total_sessions += 1
+            return
+        
         # Générer des headers aléatoires
         headers = self._generate_random_headers()
         
@@ -243,7 +1250,7 @@ class AntiBanScraper:
         
         self.client = httpx.AsyncClient(**client_kwargs)
         
-        self.session_created_at = datetime.now()
+        self.session_created_at = clock.now()
         self.session_request_count = 0
         self.consecutive_403 = 0
         self.total_sessions += 1
@@ -269,7 +1276,7 @@ class AntiBanScraper:
         
         # Rotation si taux de succès faible
         if len(self.success_rate) >= 5:
-            recent_success = sum(self.success_rate[-5:]) / 5
+            recent_success = self.recent_success_rate(5)
             if recent_success < 0.3:
                 logger.info(f"🔄 Rotation: taux de succès faible ({recent_success:.1%})")
                 return True
@@ -279,12 +1286,10 @@ class AntiBanScraper:
     def _update_adaptive_delay(self, success: bool):
         """Adapte le délai en fonction des succès/échecs"""
         self.success_rate.append(1 if success else 0)
-        if len(self.success_rate) > 20:
-            self.success_rate.pop(0)
         
         # Calculer le taux de succès récent
         if len(self.success_rate) >= 5:
-            recent_success = sum(self.success_rate[-5:]) / 5
+            recent_success = self.recent_success_rate(5)
             
             # Augmenter le délai si échecs
             if recent_success < 0.5:
@@ -301,7 +1306,7 @@ class AntiBanScraper:
         # Pause plus longue
         recovery_time = BAN_RECOVERY_DELAY + random.uniform(0, 15)
         logger.info(f"⏳ Pause {recovery_time:.0f}s...")
-        await asyncio.sleep(recovery_time)
+        await clock.sleep(recovery_time)
         
         # Créer une nouvelle session complète
         await self._create_new_session()
@@ -311,28 +1316,46 @@ class AntiBanScraper:
         
         logger.info("✅ Session rotée après ban")
     
-    async def scrape_all_pages(self):
-        """Scrape plusieurs pages avec gestion anti-ban"""
-        all_ads = []
+    async def scrape_pages(self, search=None, limiter=None):
+        """Récupère les pages une à une avec gestion anti-ban
+        
+        Générateur asynchrone: chaque page est cédée dès qu'elle est reçue
+        (page_num, html, fetched_at) pour être traitée sans attendre la fin du scan.
         
-        for page_num in PAGES_TO_SCRAPE:
+        search: recherche surveillée (None = listing par défaut)
+        limiter: limiteur global partagé entre toutes les recherches
+        """
+        pages = search.page_numbers() if search else PAGES_TO_SCRAPE
+        fetched = 0
+        
+        for page_num in pages:
+            if self.replay and self.replay.exhausted:
+                break
+            
             # Vérifier si rotation nécessaire avant chaque page
             if self._should_rotate_session():
                 await self._create_new_session()
-                await asyncio.sleep(random.uniform(2, 4))
+                await clock.sleep(random.uniform(2, 4))
             
             logger.info(f"  📄 Page {page_num}...")
             
             # Délai adaptatif entre pages
             if page_num > 1:
                 delay = random.uniform(self.adaptive_delay, self.adaptive_delay + 2)
-                await asyncio.sleep(delay)
+                await clock.sleep(delay)
+            
+            # Budget et débit globaux (toutes recherches confondues)
+            if limiter and not await limiter.acquire():
+                logger.warning("⚠️ Budget horaire de requêtes épuisé - scan interrompu")
+                break
             
-            ads = await self.get_ads_from_page(page_num)
+            html = await self.fetch_page(page_num, search)
+            if search:
+                search.requests += 1
             
-            if ads:
-                all_ads.extend(ads)
-                logger.info(f"     ✅ {len(ads)} annonces trouvées")
+            if html is not None:
+                fetched += 1
+                yield page_num, html, clock.now()
             else:
                 logger.warning(f"     ⚠️ Aucune annonce")
             
@@ -342,23 +1365,15 @@ class AntiBanScraper:
                 await self._handle_ban_recovery()
                 break
         
-        logger.info(f"📊 Total: {len(all_ads)} annonces sur {len(PAGES_TO_SCRAPE)} pages")
-        return all_ads
+        logger.info(f"📊 Total: {fetched} pages récupérées sur {len(pages)}")
     
-    async def get_ads_from_page(self, page_num=1):
-        """Récupère les annonces d'une page avec détection précoce de ban"""
-        if not BS4_AVAILABLE:
-            logger.error("❌ BeautifulSoup non disponible")
-            return []
-        
+    async def fetch_page(self, page_num=1, search=None):
+        """Récupère le HTML d'une page avec détection précoce de ban (None si échec)"""
         self.request_count += 1
         self.session_request_count += 1
         
         # Construire l'URL
-        if page_num == 1:
-            url = "https://www.leboncoin.fr/voitures/offres"
-        else:
-            url = f"https://www.leboncoin.fr/voitures/offres?page={page_num}"
+        url = build_search_url(search.params if search else {}, page_num)
         
         try:
             # Headers dynamiques pour chaque requête
@@ -369,9 +1384,18 @@ class AntiBanScraper:
             
             # Ajouter un referer si pas page 1
             if page_num > 1:
-                dynamic_headers['Referer'] = f"https://www.leboncoin.fr/voitures/offres?page={page_num-1}"
+                dynamic_headers['Referer'] = build_search_url(search.params if search else {}, page_num - 1)
             
-            response = await self.client.get(url, headers=dynamic_headers)
+            fetch_started = time.perf_counter()
+            try:
+                response = await self._fetch(url, dynamic_headers, search, page_num)
+            except httpx.TimeoutException:
+                FETCH_LATENCY.observe(time.perf_counter() - fetch_started, "timeout")
+                raise
+            except Exception:
+                FETCH_LATENCY.observe(time.perf_counter() - fetch_started, "error")
+                raise
+            FETCH_LATENCY.observe(time.perf_counter() - fetch_started, response.status_code)
             
             # Gestion des erreurs
             if response.status_code == 403:
@@ -383,23 +1407,23 @@ class AntiBanScraper:
                 if self.consecutive_403 >= MAX_CONSECUTIVE_403:
                     await self._handle_ban_recovery()
                 
-                return []
+                return None
             
             if response.status_code == 429:
                 logger.warning("⚠️ 429 Rate Limit")
                 self._update_adaptive_delay(False)
                 await self._handle_ban_recovery()
-                return []
+                return None
             
             if response.status_code != 200:
                 logger.error(f"❌ HTTP {response.status_code}")
                 self.total_errors += 1
                 self._update_adaptive_delay(False)
-                return []
+                return None
             
             # Succès
             self.consecutive_403 = 0
-            self.last_successful_request = datetime.now()
+            self.last_successful_request = clock.now()
             self._update_adaptive_delay(True)
             
             html_content = response.text
@@ -408,58 +1432,82 @@ class AntiBanScraper:
             if "captcha" in html_content.lower() or "verify you are human" in html_content.lower():
                 logger.warning("⚠️ Page de vérification détectée")
                 await self._handle_ban_recovery()
-                return []
-            
-            soup = BeautifulSoup(html_content, 'html.parser')
-            
-            # Chercher les annonces
-            ad_elements = []
-            
-            # Stratégie 1: data-qa-id
-            ads = soup.find_all('a', {'data-qa-id': 'aditem_container'})
-            if ads and len(ads) >= 5:
-                ad_elements = ads
-            
-            # Stratégie 2: articles
-            if not ad_elements:
-                ads = soup.find_all('article')
-                if ads and len(ads) >= 5:
-                    ad_elements = ads
-            
-            # Stratégie 3: liens voitures
-            if not ad_elements:
-                ads = soup.find_all('a', href=re.compile(r'/voitures/\d+\.htm'))
-                if ads:
-                    ad_elements = ads
-            
-            if not ad_elements:
-                logger.warning("⚠️ Aucun élément d'annonce trouvé")
-                return []
-            
-            # Parser les annonces
-            ads_found = []
-            for idx, element in enumerate(ad_elements):
-                try:
-                    ad_data = self._parse_ad(element, idx, soup)
-                    if ad_data and ad_data.get('price', 0) > 0:
-                        ads_found.append(ad_data)
-                except Exception as e:
-                    continue
+                return None
             
-            return ads_found
+            return html_content
             
         except httpx.TimeoutException:
             logger.error("❌ Timeout")
             self.total_errors += 1
             self._update_adaptive_delay(False)
-            return []
+            return None
         except Exception as e:
             logger.error(f"❌ Erreur: {str(e)[:100]}")
             self.total_errors += 1
             self._update_adaptive_delay(False)
+            return None
+    
+    async def _fetch(self, url, headers, search=None, page_num=1):
+        """Requête HTTP (ou page rejouée), enregistrée si l'enregistrement est actif"""
+        if self.replay:
+            return await self.replay.get(url)
+        response = await self.client.get(url, headers=headers)
+        recorder.add_page(url, page_num, response.status_code, response.text)
+        return response
+    
+    def parse_page(self, html_content, detected_at=None):
+        """Extrait les annonces d'une page HTML de résultats
+        
+        detected_at: date de récupération de la page (published_at des annonces)
+        """
+        if not BS4_AVAILABLE:
+            logger.error("❌ BeautifulSoup non disponible")
+            return []
+        
+        parse_started = time.perf_counter()
+        soup = BeautifulSoup(html_content, 'html.parser')
+        
+        # Chercher les annonces
+        ad_elements = []
+        
+        # Stratégie 1: data-qa-id
+        ads = soup.find_all('a', {'data-qa-id': 'aditem_container'})
+        if ads and len(ads) >= 5:
+            ad_elements = ads
+        
+        # Stratégie 2: articles
+        if not ad_elements:
+            ads = soup.find_all('article')
+            if ads and len(ads) >= 5:
+                ad_elements = ads
+        
+        # Stratégie 3: liens voitures
+        if not ad_elements:
+            ads = soup.find_all('a', href=re.compile(r'/voitures/\d+\.htm'))
+            if ads:
+                ad_elements = ads
+        
+        if not ad_elements:
+            PARSE_LATENCY.observe(time.perf_counter() - parse_started)
+            ADS_PER_PAGE.observe(0)
+            logger.warning("⚠️ Aucun élément d'annonce trouvé")
             return []
+        
+        # Parser les annonces
+        ads_found = []
+        for idx, element in enumerate(ad_elements):
+            try:
+                ad_data = self._parse_ad(element, idx, soup, detected_at)
+                if ad_data and ad_data.get('price', 0) > 0:
+                    ads_found.append(ad_data)
+            except Exception as e:
+                continue
+        
+        PARSE_LATENCY.observe(time.perf_counter() - parse_started)
+        ADS_PER_PAGE.observe(len(ads_found))
+        return ads_found
     
-    def _parse_ad(self, element, idx, soup):
+    def _parse_ad(self, element, idx, soup, detected_at=None):
         """Parse une annonce"""
         try:
             # Titre
@@ -515,7 +1563,7 @@ class AntiBanScraper:
                     url = link.get('href', '')
             
             if url and not url.startswith('http'):
-                url = f"https://www.leboncoin.fr{url}"
+                url = f"{LEBONCOIN_BASE_URL}{url}"
             
             # ID unique basé sur URL
             ad_id = None
@@ -548,41 +1596,108 @@ class AntiBanScraper:
                     if not any(x in img_url.lower() for x in ['logo', 'icon', 'favicon']):
                         images.append(img_url)
             
-            # Détections
-            full_text = element.get_text()
-            brand = self._detect_brand(title + " " + full_text)
-            model = self._detect_model(title, brand)
-            year = self._detect_year(full_text)
-            mileage = self._detect_mileage(full_text)
-            fuel = self._detect_fuel(full_text)
-            gearbox = self._detect_gearbox(full_text)
-            is_pro = "pro" in full_text.lower()
-            score = self._calculate_score(year, mileage, price, is_pro)
-            
-            coordinates = get_city_coordinates(location)
-            
-            return {
-                "id": ad_id,
-                "title": title,
-                "brand": brand,
-                "model": model,
-                "price": price,
-                "year": year,
-                "mileage": mileage,
-                "fuel": fuel,
-                "gearbox": gearbox,
-                "location": location,
-                "coordinates": coordinates,
-                "is_pro": is_pro,
-                "images": images[:5],
-                "url": url,
-                "published_at": datetime.now(),
-                "score": score
-            }
+            return self._build_ad(ad_id, title, price, url, location, images, element.get_text(), detected_at)
             
         except Exception as e:
             return None
     
+    def _build_ad(self, ad_id, title, price, url, location, images, full_text, detected_at=None):
+        """Détections (marque, année, km...) et score à partir du texte de l'annonce"""
+        brand = self._detect_brand(title + " " + full_text)
+        model = self._detect_model(title, brand)
+        year = self._detect_year(full_text)
+        mileage = self._detect_mileage(full_text)
+        fuel = self._detect_fuel(full_text)
+        gearbox = self._detect_gearbox(full_text)
+        is_pro = "pro" in full_text.lower()
+        score = self._calculate_score(year, mileage, price, is_pro)
+        
+        coordinates = get_city_coordinates(location)
+        
+        return {
+            "id": ad_id,
+            "title": title,
+            "brand": brand,
+            "model": model,
+            "price": price,
+            "year": year,
+            "mileage": mileage,
+            "fuel": fuel,
+            "gearbox": gearbox,
+            "location": location,
+            "coordinates": coordinates,
+            "is_pro": is_pro,
+            "images": images[:5],
+            "url": url,
+            "published_at": detected_at or clock.now(),
+            "score": score
+        }
+    
+    def parse_record(self, record: dict, detected_at=None):
+        """Annonce brute d'un collecteur externe (champs d'une carte d'annonce)
+        
+        Mêmes règles que le HTML: id tiré de l'URL (ou de `id`), détections sur
+        le titre et le texte libre; les champs structurés fournis (année, km,
+        carburant, boîte, pro) priment s'ils sont valides.
+        Lève ValueError si l'annonce est inexploitable.
+        """
+        title = str(record.get("title") or "").strip()
+        if len(title) < 5:
+            raise ValueError("titre manquant ou trop court")
+        
+        price = record.get("price")
+        if isinstance(price, bool):
+            price = 0
+        elif isinstance(price, (int, float)):
+            price = int(price) if 100 <= price <= 500000 else 0
+        else:
+            price = self._extract_price(str(price or ""))
+        if not price:
+            raise ValueError("prix manquant ou hors limites (100-500000€)")
+        
+        url = str(record.get("url") or "")
+        if url and not url.startswith("http"):
+            url = f"{LEBONCOIN_BASE_URL}{url}"
+        match = re.search(r'/(\d+)\.htm', url)
+        if match:
+            ad_id = f"lbc_{match.group(1)}"
+        elif record.get("id"):
+            ad_id = f"lbc_{str(record['id']).removeprefix('lbc_')}"
+        else:
+            ad_id = f"lbc_{hashlib.md5(f'{title}_{price}'.encode()).hexdigest()[:8]}"
+        
+        location = str(record.get("location") or "France").strip()
+        images = record.get("images") or []
+        if not isinstance(images, list):
+            raise ValueError("images doit être une liste d'URL")
+        images = [str(image) for image in images if image]
+        
+        published_at = record.get("published_at")
+        if published_at:
+            try:
+                detected_at = local_datetime(published_at)
+            except ValueError:
+                raise ValueError("published_at invalide (ISO 8601 attendu)")
+        
+        full_text = " ".join(str(part) for part in (title, record.get("text"), f"{price} €", location) if part)
+        ad = self._build_ad(ad_id, title, price, url, location, images, full_text, detected_at)
+        
+        # Champs structurés du collecteur (plus fiables que les détections)
+        year = record.get("year")
+        if isinstance(year, int) and 1980 <= year <= clock.now().year + 1:
+            ad["year"] = year
+        mileage = record.get("mileage")
+        if isinstance(mileage, int) and not isinstance(mileage, bool) and 0 <= mileage <= 999999:
+            ad["mileage"] = mileage
+        if record.get("fuel") in ("essence", "diesel", "hybride", "électrique"):
+            ad["fuel"] = record["fuel"]
+        if record.get("gearbox") in ("manuelle", "automatique"):
+            ad["gearbox"] = record["gearbox"]
+        if isinstance(record.get("is_pro"), bool):
+            ad["is_pro"] = record["is_pro"]
+        ad["score"] = self._calculate_score(ad["year"], ad["mileage"], price, ad["is_pro"])
+        return ad
+    
     def _extract_price(self, price_text):
         """Extrait le prix"""
         if not price_text:
@@ -669,22 +1784,7 @@ class AntiBanScraper:
         return None
     
     def _calculate_score(self, year, mileage, price, is_pro):
-        score = 50.0
-        if year:
-            if year >= 2022:
-                score += 20
-            elif year >= 2020:
-                score += 15
-        if mileage is not None:
-            if mileage < 50000:
-                score += 15
-            elif mileage < 100000:
-                score += 10
-        if is_pro:
-            score -= 5
-        if 5000 <= price <= 30000:
-            score += 5
-        return round(min(max(score, 0), 100), 1)
+        return scoring.model.score(year, mileage, price, is_pro)
     
     async def close(self):
         if self.client:
@@ -693,31 +1793,2198 @@ class AntiBanScraper:
 # Instance globale
 scraper = AntiBanScraper()
 
-# ============ WEBSOCKET ============
+# ============ ENREGISTREMENT / REJEU ============
 
-async def broadcast_new_vehicle(vehicle):
-    """Broadcast nouvelle annonce"""
-    if not websocket_clients:
-        return
+class ScanRecorder:
+    """Enregistre les pages de chaque scan dans une archive JSONL gzip"""
     
-    vehicle_data = {**vehicle}
-    if isinstance(vehicle_data.get("published_at"), datetime):
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory
+        self.path = None
+        self.current = None
+        self.scans_written = 0
+    
+    @property
+    def enabled(self):
+        return bool(self.directory)
+    
+    def begin_scan(self, search):
+        if not self.enabled:
+            return
+        self.current = {
+            "search": {"id": search.id, "params": search.params, "pages": search.pages,
+                       "interval": search.interval, "names": sorted(search.names)},
+            "started_at": clock.now().timestamp(),
+            "pages": [],
+        }
+    
+    def add_page(self, url, page_num, status, html):
+        if self.current is None:
+            return
+        self.current["pages"].append({
+            "url": url,
+            "page": page_num,
+            "status": status,
+            "fetched_at": clock.now().timestamp(),
+            "html": html,
+        })
+    
+    def _write(self, line: bytes):
+        # Un membre gzip par scan: l'archive reste lisible même si le process est tué
+        with gzip.open(self.path, "ab") as f:
+            f.write(line)
+    
+    async def end_scan(self):
+        if self.current is None:
+            return
+        scan, self.current = self.current, None
+        if self.path is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.path = os.path.join(self.directory, f"scans_{datetime.now():%Y%m%d_%H%M%S}.jsonl.gz")
+            logger.info(f"💾 Enregistrement des scans: {self.path}")
+        line = (json.dumps(scan, ensure_ascii=False) + "\n").encode("utf-8")
+        await asyncio.to_thread(self._write, line)
+        self.scans_written += 1
+
+class RecordedResponse:
+    """Réponse rejouée (mêmes attributs utiles qu'une réponse httpx)"""
+    
+    def __init__(self, status_code, text):
+        self.status_code = status_code
+        self.text = text
+
+class ReplaySource:
+    """Rejoue une archive de scans: pages servies par URL, horloge virtuelle recalée"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self.scans = []
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    self.scans.append(json.loads(line))
+        self.pages = deque(page for scan in self.scans for page in scan["pages"])
+        self.by_url = defaultdict(deque)
+        for page in self.pages:
+            self.by_url[page["url"]].append(page)
+        self.served = 0
+        self.total_pages = len(self.pages)
+    
+    @property
+    def exhausted(self):
+        return self.served >= self.total_pages
+    
+    def start_time(self):
+        return self.scans[0]["started_at"] if self.scans else time.time()
+    
+    def _take(self, url):
+        queue = self.by_url.get(url)
+        while queue:
+            page = queue.popleft()
+            if not page.get("_served"):
+                return page
+        # URL inconnue (recherches différentes): page suivante dans l'ordre enregistré
+        while self.pages:
+            page = self.pages.popleft()
+            if not page.get("_served"):
+                return page
+        return None
+    
+    async def get(self, url):
+        page = self._take(url)
+        if page is None:
+            self.served = self.total_pages
+            return RecordedResponse(200, "")
+        page["_served"] = True
+        self.served += 1
+        if clock.simulated:
+            clock.advance_to(page["fetched_at"])
+        await asyncio.sleep(0)
+        return RecordedResponse(page["status"], page["html"])
+
+recorder = ScanRecorder(RECORD_DIR)
+
+# ============ RECHERCHES SURVEILLÉES ============
+
+class WatchedSearch:
+    """Recherche sauvegardée avec son état propre (annonces vues, métriques)"""
+    
+    def __init__(self, params: dict, name: str = "", pages: int = 3, interval: float = SCRAPE_INTERVAL_SECONDS):
+        self.params = normalize_search_params(params)
+        self.key = search_key(self.params)
+        self.id = hashlib.md5(self.key.encode()).hexdigest()[:10]
+        self.names = {name} if name else set()
+        self.pages = max(1, min(int(pages), len(PAGES_TO_SCRAPE)))
+        self.interval = interval
+        self.seen_ads = set()
+        self.next_due = 0.0  # clock.monotonic()
+        # Métriques
+        self.scans = 0
+        self.requests = 0
+        self.ads_found = 0
+        self.new_ads = 0
+        self.errors = 0
+        self.last_scan_at = None
+        self.last_scan_duration = 0.0
+    
+    def page_numbers(self):
+        return PAGES_TO_SCRAPE[:self.pages]
+    
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "names": sorted(self.names),
+            "params": self.params,
+            "pages": self.pages,
+            "interval": self.interval,
+            "url": build_search_url(self.params),
+            "metrics": {
+                "scans": self.scans,
+                "requests": self.requests,
+                "ads_found": self.ads_found,
+                "new_ads": self.new_ads,
+                "errors": self.errors,
+                "seen_ads": len(self.seen_ads),
+                "last_scan_at": self.last_scan_at.isoformat() if self.last_scan_at else None,
+                "last_scan_duration": round(self.last_scan_duration, 1),
+            },
+        }
+
+class RateLimiter:
+    """Token bucket + budget horaire partagés par toutes les recherches"""
+    
+    def __init__(self, per_minute: float, burst: int, per_hour: int):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self.per_hour = per_hour
+        self.tokens = float(burst)
+        self.last_refill = clock.monotonic()
+        self.hour_started = clock.monotonic()
+        self.hour_count = 0
+        self.total_acquired = 0
+        self._lock = asyncio.Lock()
+    
+    def reset(self):
+        """Réinitialise le seau (changement d'horloge)"""
+        self.tokens = float(self.burst)
+        self.last_refill = clock.monotonic()
+        self.hour_started = clock.monotonic()
+        self.hour_count = 0
+    
+    def _refill(self):
+        now = clock.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+        if now - self.hour_started >= 3600:
+            self.hour_started = now
+            self.hour_count = 0
+    
+    def budget_remaining(self):
+        self._refill()
+        return max(self.per_hour - self.hour_count, 0)
+    
+    async def acquire(self) -> bool:
+        """Attend un jeton. Retourne False si le budget horaire est épuisé"""
+        async with self._lock:
+            self._refill()
+            if self.hour_count >= self.per_hour:
+                return False
+            if self.tokens < 1:
+                await clock.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+            self.hour_count += 1
+            self.total_acquired += 1
+            return True
+    
+    def to_dict(self):
+        return {
+            "requests_per_minute": round(self.rate * 60, 1),
+            "burst": self.burst,
+            "hourly_budget": self.per_hour,
+            "hourly_remaining": self.budget_remaining(),
+            "total_requests": self.total_acquired,
+        }
+
+class SearchScheduler:
+    """Ordonnanceur unique: une seule boucle de scan pour toutes les recherches"""
+    
+    def __init__(self, limiter: RateLimiter, searches_file: Optional[str] = None):
+        self.limiter = limiter
+        self.searches_file = searches_file
+        self.searches = {}  # key normalisée -> WatchedSearch
+    
+    def add(self, params: dict, name: str = "", pages: int = 3, interval: float = SCRAPE_INTERVAL_SECONDS):
+        """Ajoute une recherche (dédupliquée par requête normalisée)"""
+        key = search_key(params)
+        existing = self.searches.get(key)
+        if existing:
+            if name:
+                existing.names.add(name)
+            existing.pages = max(existing.pages, max(1, min(int(pages), len(PAGES_TO_SCRAPE))))
+            existing.interval = min(existing.interval, interval)
+            return existing
+        search = WatchedSearch(params, name, pages, interval)
+        self.searches[key] = search
+        return search
+    
+    def remove(self, search_id: str) -> bool:
+        for key, search in list(self.searches.items()):
+            if search.id == search_id:
+                del self.searches[key]
+                return True
+        return False
+    
+    def get(self, search_id: str):
+        for search in self.searches.values():
+            if search.id == search_id:
+                return search
+        return None
+    
+    def load(self):
+        """Charge les recherches depuis le fichier (ou les recherches par défaut)"""
+        definitions = DEFAULT_SEARCHES
+        if self.searches_file and os.path.exists(self.searches_file):
+            try:
+                with open(self.searches_file, encoding="utf-8") as f:
+                    definitions = json.load(f)
+            except Exception as e:
+                logger.error(f"❌ Lecture {self.searches_file}: {str(e)[:100]}")
+        for definition in definitions:
+            try:
+                self.add(
+                    definition.get("params", {}),
+                    definition.get("name", ""),
+                    definition.get("pages", 3),
+                    float(definition.get("interval", SCRAPE_INTERVAL_SECONDS)),
+                )
+            except (AttributeError, TypeError, ValueError) as e:
+                logger.error(f"❌ Recherche ignorée: {str(e)[:100]}")
+        logger.info(f"🔎 {len(self.searches)} recherche(s) surveillée(s)")
+    
+    def save(self):
+        if not self.searches_file:
+            return
+        definitions = []
+        for search in self.searches.values():
+            for name in sorted(search.names) or [""]:
+                definitions.append({
+                    "name": name,
+                    "params": search.params,
+                    "pages": search.pages,
+                    "interval": search.interval,
+                })
+        try:
+            with open(self.searches_file, "w", encoding="utf-8") as f:
+                json.dump(definitions, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"❌ Écriture {self.searches_file}: {str(e)[:100]}")
+    
+    def next_search(self):
+        """Recherche la plus en retard"""
+        if not self.searches:
+            return None
+        return min(self.searches.values(), key=lambda s: s.next_due)
+    
+    async def scan(self, search, pipeline):
+        """Scanne une recherche: chaque page part dans le pipeline dès sa réception"""
+        started = clock.monotonic()
+        initial = search.scans == 0
+        recorder.begin_scan(search)
+        try:
+            async for page_num, html, fetched_at in scraper.scrape_pages(search, limiter=self.limiter):
+                await pipeline.submit(PageItem(search, page_num, html, fetched_at, initial))
+        except Exception:
+            search.errors += 1
+            raise
+        finally:
+            await recorder.end_scan()
+            search.scans += 1
+            search.last_scan_at = clock.now()
+            search.last_scan_duration = clock.monotonic() - started
+            search.next_due = clock.monotonic() + search.interval + random.uniform(-2, 3)
+    
+    def to_dict(self):
+        return {
+            "limiter": self.limiter.to_dict(),
+            "searches": [s.to_dict() for s in self.searches.values()],
+        }
+
+scheduler = SearchScheduler(
+    RateLimiter(GLOBAL_REQUESTS_PER_MINUTE, GLOBAL_REQUEST_BURST, GLOBAL_REQUESTS_PER_HOUR),
+    SEARCHES_FILE,
+)
+
+# ============ STATISTIQUES DE MARCHÉ ============
+
+class KLLSketch:
+    """Sketch de quantiles KLL: mémoire bornée, insertion O(1) amortie"""
+    
+    __slots__ = ("k", "compactors", "count", "size", "max_size", "min_value", "max_value",
+                 "_median", "_median_count")
+    
+    def __init__(self, k: int = MARKET_SKETCH_K):
+        self.k = k
+        self.compactors = [[]]
+        self.count = 0
+        self.size = 0
+        self.max_size = self._capacity(0)
+        self.min_value = None
+        self.max_value = None
+        self._median = None
+        self._median_count = 0
+    
+    def _capacity(self, level):
+        depth = len(self.compactors) - level - 1
+        return max(2, int(self.k * (2 / 3) ** depth))
+    
+    def update(self, value: float):
+        self.compactors[0].append(value)
+        self.count += 1
+        self.size += 1
+        if self.min_value is None or value < self.min_value:
+            self.min_value = value
+        if self.max_value is None or value > self.max_value:
+            self.max_value = value
+        if self.size >= self.max_size:
+            self._compress()
+    
+    def _compress(self):
+        for level in range(len(self.compactors)):
+            items = self.compactors[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self.compactors):
+                    self.compactors.append([])
+                items.sort()
+                # Garder un élément sur deux (décalage aléatoire), poids x2
+                kept = items[random.randint(0, 1)::2]
+                self.compactors[level + 1].extend(kept)
+                self.size -= len(items) - len(kept)
+                self.compactors[level] = []
+                break
+        self.max_size = sum(self._capacity(h) for h in range(len(self.compactors)))
+    
+    def median(self):
+        """Médiane mise en cache, recalculée après ~2% de nouveaux échantillons"""
+        if self._median is None or self.count - self._median_count > self.count // 50:
+            self._median = self.quantiles([0.5])[0]
+            self._median_count = self.count
+        return self._median
+    
+    def quantiles(self, qs):
+        """Quantiles approchés pour une liste de rangs (0-1)"""
+        weighted = sorted(
+            (value, 1 << level)
+            for level, items in enumerate(self.compactors)
+            for value in items
+        )
+        if not weighted:
+            return [None for _ in qs]
+        total = sum(w for _, w in weighted)
+        results = []
+        for q in qs:
+            target = q * total
+            cumulative = 0
+            result = weighted[-1][0]
+            for value, weight in weighted:
+                cumulative += weight
+                if cumulative >= target:
+                    result = value
+                    break
+            results.append(result)
+        return results
+
+class MarketStats:
+    """Prix du marché par (marque, modèle, tranche d'année, tranche de km)"""
+    
+    QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+    
+    def __init__(self, max_sketches: int = MARKET_MAX_SKETCHES):
+        self.max_sketches = max_sketches
+        self.sketches = OrderedDict()  # clé -> KLLSketch (ordre LRU)
+        self.total_observed = 0
+    
+    @staticmethod
+    def bucket_keys(brand, model, year, mileage):
+        """Clés de la plus précise à la plus large (repli si peu d'échantillons)"""
+        brand = brand.lower() if brand else None
+        if not brand:
+            return []
+        model = model.lower() if model else None
+        year_bucket = year - year % MARKET_YEAR_BUCKET if year else None
+        mileage_bucket = mileage - mileage % MARKET_MILEAGE_BUCKET if mileage is not None else None
+        return [
+            (brand, model, year_bucket, mileage_bucket),
+            (brand, model, year_bucket, None),
+            (brand, model, None, None),
+            (brand, None, None, None),
+        ]
+    
+    def _lookup(self, keys):
+        for key in keys:
+            sketch = self.sketches.get(key)
+            if sketch and sketch.count >= MARKET_MIN_SAMPLES:
+                return key, sketch
+        return None, None
+    
+    def observe(self, vehicle: dict):
+        """Compare le véhicule au marché puis l'ajoute aux sketches"""
+        keys = self.bucket_keys(vehicle.get("brand"), vehicle.get("model"), vehicle.get("year"), vehicle.get("mileage"))
+        self.compare(vehicle, keys)
+        self.record(vehicle, keys)
+        return vehicle
+    
+    def compare(self, vehicle: dict, keys=None):
+        """Prix du marché et écart du véhicule (market_price, below_market_pct), sans l'ajouter"""
+        price = vehicle.get("price") or 0
+        if keys is None:
+            keys = self.bucket_keys(vehicle.get("brand"), vehicle.get("model"), vehicle.get("year"), vehicle.get("mileage"))
+        
+        vehicle["market_price"] = None
+        vehicle["below_market_pct"] = None
+        _, sketch = self._lookup(keys)
+        if sketch:
+            median = sketch.median()
+            if median:
+                vehicle["market_price"] = round(median)
+                vehicle["below_market_pct"] = round((median - price) / median * 100, 1)
+        return vehicle
+    
+    def record(self, vehicle: dict, keys=None):
+        """Ajoute le prix aux sketches sans toucher aux champs du véhicule"""
+        price = vehicle.get("price") or 0
+        if price <= 0:
+            return
+        if keys is None:
+            keys = self.bucket_keys(vehicle.get("brand"), vehicle.get("model"), vehicle.get("year"), vehicle.get("mileage"))
+        
+        # Une clé n'est ajoutée qu'une fois (modèle/années inconnus -> clés identiques)
+        for key in dict.fromkeys(keys):
+            sketch = self.sketches.get(key)
+            if sketch is None:
+                sketch = self.sketches[key] = KLLSketch()
+                if len(self.sketches) > self.max_sketches:
+                    self.sketches.popitem(last=False)
+            else:
+                self.sketches.move_to_end(key)
+            sketch.update(price)
+        self.total_observed += 1
+    
+    def summary(self, key, sketch):
+        values = sketch.quantiles(self.QUANTILES)
+        brand, model, year_bucket, mileage_bucket = key
+        return {
+            "brand": brand,
+            "model": model,
+            "year_range": [year_bucket, year_bucket + MARKET_YEAR_BUCKET - 1] if year_bucket else None,
+            "mileage_range": [mileage_bucket, mileage_bucket + MARKET_MILEAGE_BUCKET - 1] if mileage_bucket is not None else None,
+            "samples": sketch.count,
+            "min": sketch.min_value,
+            "max": sketch.max_value,
+            "quantiles": {f"p{int(q * 100)}": round(v) for q, v in zip(self.QUANTILES, values)},
+        }
+    
+    def query(self, brand, model=None, year=None, mileage=None):
+        key, sketch = self._lookup(self.bucket_keys(brand, model, year, mileage))
+        if not sketch:
+            return None
+        return self.summary(key, sketch)
+
+market = MarketStats()
+
+# ============ DÉTECTION DES REPUBLICATIONS ============
+
+STOP_WORDS = {"de", "la", "le", "les", "et", "a", "à", "du", "des", "en", "avec", "pour", "très", "tres", "bon", "etat", "état"}
+
+def _hash64(token: str) -> int:
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+@lru_cache(maxsize=65536)
+def _token_bits(token: str) -> tuple:
+    """Positions des bits à 1 du hash d'un token (les tokens se répètent énormément)"""
+    h = _hash64(token)
+    return tuple(bit for bit in range(64) if h >> bit & 1)
+
+def _image_key(url: str) -> str:
+    """Empreinte d'une image: chemin sans paramètres (le nom contient le hash du contenu)"""
+    return url.split("?", 1)[0].rsplit("/", 1)[-1]
+
+def ad_features(ad: dict) -> dict:
+    """Caractéristiques pondérées d'une annonce pour SimHash
+    
+    Le prix est exclu (une baisse de prix ne doit pas changer l'empreinte) et les
+    images sont indexées à part: une republication avec de nouvelles photos garde
+    la même empreinte texte.
+    """
+    features = {}
+    title = (ad.get("title") or "").lower()
+    for token in re.findall(r"[a-z0-9à-ÿ]+", title):
+        if token not in STOP_WORDS and len(token) > 1:
+            features[f"t:{token}"] = 3
+    # Les champs structurés sont très partagés entre annonces: poids faible,
+    # c'est le titre qui discrimine (marque/année/km sont revérifiés à part)
+    for key in ("fuel", "gearbox", "year"):
+        value = ad.get(key)
+        if value:
+            features[f"{key}:{str(value).lower()}"] = 1
+    if ad.get("mileage") is not None:
+        features[f"km:{ad['mileage'] // 10000}"] = 1
+    location = normalize_city_name(ad.get("location") or "")
+    if location and location != "france":
+        features[f"loc:{location}"] = 1
+    return features
+
+def simhash(features: dict) -> int:
+    """Empreinte SimHash 64 bits (bit à 1 si le poids des tokens qui l'ont dépasse la moitié)"""
+    weights = [0] * 64
+    total = 0
+    for token, weight in features.items():
+        total += weight
+        for bit in _token_bits(token):
+            weights[bit] += weight
+    fingerprint = 0
+    for bit in range(64):
+        if 2 * weights[bit] > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+class RepostDetector:
+    """Index LSH d'empreintes SimHash: recherche des quasi-doublons en temps sous-linéaire
+    
+    L'empreinte est découpée en REPOST_MAX_DISTANCE + 1 bandes: deux empreintes à
+    distance <= REPOST_MAX_DISTANCE partagent forcément une bande identique. Les
+    images identiques (même hash de contenu) sont indexées à part.
+    """
+    
+    def __init__(self, max_distance: int = REPOST_MAX_DISTANCE):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = 64 // self.bands
+        self.band_mask = (1 << self.band_bits) - 1
+        self.tables = [defaultdict(set) for _ in range(self.bands)]
+        self.images = defaultdict(set)  # clé image -> ids
+        self.fingerprints = {}  # id -> (empreinte, prix, marque, année, km, clés images)
+        self.reposts_found = 0
+    
+    def _band_keys(self, fingerprint):
+        return [(fingerprint >> (i * self.band_bits)) & self.band_mask for i in range(self.bands)]
+    
+    def _compatible(self, ad, candidate):
+        """Garde-fous: même marque/année, kilométrage et prix proches"""
+        _, price, brand, year, mileage, _ = candidate
+        if brand and ad.get("brand") and brand != ad.get("brand"):
+            return False
+        if year and ad.get("year") and year != ad.get("year"):
+            return False
+        new_mileage = ad.get("mileage")
+        if mileage is not None and new_mileage is not None:
+            if abs(new_mileage - mileage) > max(REPOST_MAX_MILEAGE_CHANGE, mileage * 0.05):
+                return False
+        new_price = ad.get("price") or 0
+        if price and new_price:
+            return abs(new_price - price) / price <= REPOST_MAX_PRICE_CHANGE
+        return True
+    
+    def find(self, ad: dict, fingerprint: int):
+        """Id de l'annonce d'origine si l'annonce est une republication"""
+        best_id, best_distance = None, self.max_distance + 1
+        
+        # Même photo (contenu identique): republication quasi certaine
+        for url in ad.get("images") or []:
+            for candidate_id in self.images.get(_image_key(url), ()):
+                candidate = self.fingerprints[candidate_id]
+                if candidate_id != ad["id"] and self._compatible(ad, candidate):
+                    return candidate_id
+        
+        for table, key in zip(self.tables, self._band_keys(fingerprint)):
+            for candidate_id in table.get(key, ()):
+                if candidate_id == ad["id"]:
+                    continue
+                candidate = self.fingerprints[candidate_id]
+                distance = (fingerprint ^ candidate[0]).bit_count()
+                if distance < best_distance and self._compatible(ad, candidate):
+                    best_id, best_distance = candidate_id, distance
+        return best_id
+    
+    def add(self, ad: dict, fingerprint: int):
+        image_keys = tuple(_image_key(url) for url in ad.get("images") or [])
+        self.fingerprints[ad["id"]] = (
+            fingerprint, ad.get("price") or 0, ad.get("brand"), ad.get("year"), ad.get("mileage"), image_keys,
+        )
+        for table, key in zip(self.tables, self._band_keys(fingerprint)):
+            table[key].add(ad["id"])
+        for key in image_keys:
+            self.images[key].add(ad["id"])
+    
+    def remove(self, ad: dict):
+        entry = self.fingerprints.pop(ad["id"], None)
+        if entry is None:
+            return
+        fingerprint, image_keys = entry[0], entry[-1]
+        for table, key in zip(self.tables, self._band_keys(fingerprint)):
+            VehicleStore._discard(table, key, ad["id"])
+        for key in image_keys:
+            VehicleStore._discard(self.images, key, ad["id"])
+    
+    def check(self, ad: dict):
+        """Marque l'annonce (repost_of) et l'indexe. Retourne l'id d'origine ou None"""
+        fingerprint = simhash(ad_features(ad))
+        original = self.find(ad, fingerprint)
+        ad["repost_of"] = original
+        if original:
+            self.reposts_found += 1
+            REPOSTS.inc()
+        self.add(ad, fingerprint)
+        return original
+
+reposts = RepostDetector()
+store.evict_listeners.append(reposts.remove)
+
+# ============ HISTORIQUE DES PRIX ============
+
+class PriceHistory:
+    """Historique des prix par annonce, encodé en deltas dans des array('i')
+    
+    Seules les annonces dont le prix a changé ont une série:
+    [t0, p0, dt1, dp1, dt2, dp2, ...] en minutes depuis PRICE_HISTORY_EPOCH et en
+    euros. Une série de 3 points tient en ~110 octets (une liste de dicts en
+    coûte ~700); les annonces jamais modifiées ne coûtent rien.
+    """
+    
+    def __init__(self, max_points: int = PRICE_HISTORY_MAX_POINTS):
+        self.max_points = max_points
+        self.series = {}  # id -> array('i')
+        self.changes = 0
+    
+    @staticmethod
+    def _minutes(when: datetime) -> int:
+        return int((when - PRICE_HISTORY_EPOCH).total_seconds() // 60)
+    
+    @staticmethod
+    def _last(series):
+        return sum(series[0::2]), sum(series[1::2])
+    
+    def record(self, vehicle: dict, new_price: int, at: datetime):
+        """Ajoute un point; le point initial est le prix stocké à la publication"""
+        series = self.series.get(vehicle["id"])
+        if series is None:
+            started = vehicle.get("published_at") or at
+            series = array("i", (self._minutes(started), vehicle.get("price") or 0))
+        last_minute, last_price = self._last(series)
+        # Concaténation plutôt qu'extend: taille exacte, sans surallocation
+        series = series + array("i", (max(self._minutes(at) - last_minute, 0), new_price - last_price))
+        # Trop de points: le 2e point absorbe le 1er (on garde le plus récent)
+        if len(series) > 2 * self.max_points:
+            series[2] += series[0]
+            series[3] += series[1]
+            series = series[2:]
+        self.series[vehicle["id"]] = series
+        self.changes += 1
+    
+    def points(self, vehicle_id) -> list:
+        """Points décodés [(date, prix)], du plus ancien au plus récent"""
+        series = self.series.get(vehicle_id)
+        if series is None:
+            return []
+        points = []
+        minute = price = 0
+        for i in range(0, len(series), 2):
+            minute += series[i]
+            price += series[i + 1]
+            points.append((PRICE_HISTORY_EPOCH + timedelta(minutes=minute), price))
+        return points
+    
+    def carry(self, from_id, to_id):
+        """Reprend l'historique d'une annonce republiée sous un nouvel id"""
+        series = self.series.get(from_id)
+        if series is not None and to_id not in self.series:
+            self.series[to_id] = array("i", series)
+    
+    def remove(self, vehicle: dict):
+        self.series.pop(vehicle["id"], None)
+    
+    def nbytes(self) -> int:
+        return sys.getsizeof(self.series) + sum(sys.getsizeof(s) for s in self.series.values())
+
+price_history = PriceHistory()
+store.evict_listeners.append(price_history.remove)
+
+# ============ ALERTES ============
+
+class AlertRule:
+    """Critères sauvegardés + webhook où livrer les annonces correspondantes"""
+    
+    FIELDS = ("name", "webhook_url", "brand", "model", "min_price", "max_price", "min_mileage",
+              "max_mileage", "min_year", "max_year", "city", "radius_km", "min_score")
+    
+    def __init__(self, webhook_url: str, name: str = "", brand=None, model=None,
+                 min_price=None, max_price=None, min_mileage=None, max_mileage=None,
+                 min_year=None, max_year=None, city=None, radius_km=None, min_score=None,
+                 rule_id: Optional[str] = None):
+        try:
+            url = httpx.URL(webhook_url or "")
+        except httpx.InvalidURL as e:
+            raise ValueError(f"webhook_url invalide: {e}")
+        if url.scheme not in ("http", "https") or not url.host:
+            raise ValueError("webhook_url doit être une URL http(s)")
+        self.id = rule_id or os.urandom(5).hex()
+        self.name = name
+        self.webhook_url = webhook_url
+        self.brand = brand.strip().lower() if brand else None
+        self.model = model.strip().lower() if model else None
+        self.min_price, self.max_price = min_price, max_price
+        self.min_mileage, self.max_mileage = min_mileage, max_mileage
+        self.min_year, self.max_year = min_year, max_year
+        self.city, self.radius_km = city, radius_km
+        self.min_score = min_score
+        self.center = None
+        if city and radius_km:
+            self.center = get_city_coordinates(city)
+            if self.center is None:
+                raise ValueError(f"Ville inconnue: {city}")
+        self.matches = 0
+    
+    @staticmethod
+    def _in_range(value, low, high):
+        if low is None and high is None:
+            return True
+        if value is None:
+            return False
+        return (low is None or value >= low) and (high is None or value <= high)
+    
+    def match(self, vehicle: dict) -> bool:
+        if self.brand and (vehicle.get("brand") or "").lower() != self.brand:
+            return False
+        if self.model and (vehicle.get("model") or "").lower() != self.model:
+            return False
+        if not self._in_range(vehicle.get("price") or None, self.min_price, self.max_price):
+            return False
+        if not self._in_range(vehicle.get("mileage"), self.min_mileage, self.max_mileage):
+            return False
+        if not self._in_range(vehicle.get("year"), self.min_year, self.max_year):
+            return False
+        if self.min_score is not None and (vehicle.get("score") or 0) < self.min_score:
+            return False
+        if self.center:
+            coordinates = vehicle.get("coordinates")
+            if not coordinates or distance_km(self.center, coordinates) > self.radius_km:
+                return False
+        return True
+    
+    def to_dict(self):
+        data = {field: getattr(self, field) for field in self.FIELDS}
+        data["id"] = self.id
+        data["matches"] = self.matches
+        return data
+
+class AlertIndex:
+    """Règles compilées: (marque, modèle) -> règles triées par prix minimum
+    
+    Une annonce n'est comparée qu'aux règles de sa marque/modèle et aux règles
+    sans marque ou sans modèle; bisect écarte d'emblée celles dont le prix
+    minimum dépasse le sien. Index immuable, reconstruit à chaque modification.
+    """
+    
+    def __init__(self, rules=()):
+        buckets = defaultdict(list)
+        for rule in rules:
+            buckets[(rule.brand, rule.model)].append(rule)
+        self.buckets = {}
+        for key, bucket in buckets.items():
+            bucket.sort(key=lambda r: r.min_price or 0)
+            self.buckets[key] = ([r.min_price or 0 for r in bucket], bucket)
+        self.size = sum(len(bucket) for _, bucket in self.buckets.values())
+    
+    def match(self, vehicle: dict) -> list:
+        brand = (vehicle.get("brand") or "").lower() or None
+        model = (vehicle.get("model") or "").lower() or None
+        price = vehicle.get("price") or 0
+        matched = []
+        for key in dict.fromkeys(((brand, model), (brand, None), (None, model), (None, None))):
+            entry = self.buckets.get(key)
+            if entry is None:
+                continue
+            min_prices, rules = entry
+            for rule in islice(rules, bisect.bisect_right(min_prices, price)):
+                if rule.match(vehicle):
+                    matched.append(rule)
+        return matched
+
+class AlertEngine:
+    """Règles persistées (fichier JSON) évaluées sur chaque annonce ingérée"""
+    
+    def __init__(self, rules_file: Optional[str] = None):
+        self.rules_file = rules_file
+        self.rules = {}
+        self.index = AlertIndex()
+        self.evaluated = 0
+        self.matched = 0
+    
+    def add(self, rule: AlertRule):
+        self.rules[rule.id] = rule
+        self.index = AlertIndex(self.rules.values())
+        return rule
+    
+    def remove(self, rule_id: str) -> bool:
+        if self.rules.pop(rule_id, None) is None:
+            return False
+        self.index = AlertIndex(self.rules.values())
+        return True
+    
+    def load(self):
+        if not self.rules_file or not os.path.exists(self.rules_file):
+            return
+        try:
+            with open(self.rules_file, encoding="utf-8") as f:
+                definitions = json.load(f)
+        except Exception as e:
+            logger.error(f"❌ Lecture {self.rules_file}: {str(e)[:100]}")
+            return
+        for definition in definitions:
+            try:
+                self.rules[definition["id"]] = AlertRule(
+                    rule_id=definition["id"],
+                    **{field: definition.get(field) for field in AlertRule.FIELDS if field in definition},
+                )
+            except (KeyError, TypeError, ValueError) as e:
+                logger.error(f"❌ Règle ignorée: {str(e)[:100]}")
+        self.index = AlertIndex(self.rules.values())
+        logger.info(f"🔔 {len(self.rules)} règle(s) d'alerte")
+    
+    def save(self):
+        if not self.rules_file:
+            return
+        definitions = [
+            {key: value for key, value in rule.to_dict().items() if key != "matches"}
+            for rule in self.rules.values()
+        ]
+        try:
+            with open(self.rules_file, "w", encoding="utf-8") as f:
+                json.dump(definitions, f, ensure_ascii=False, indent=2)
+        except Exception as e:
+            logger.error(f"❌ Écriture {self.rules_file}: {str(e)[:100]}")
+    
+    def evaluate(self, vehicle: dict, event: str = "new_vehicle", old_price=None):
+        """Met en file (outbox) une alerte par règle correspondante"""
+        self.evaluated += 1
+        for rule in self.index.match(vehicle):
+            rule.matches += 1
+            self.matched += 1
+            ALERT_MATCHES.inc()
+            outbox.enqueue(rule.webhook_url, {
+                "rule_id": rule.id,
+                "rule_name": rule.name,
+                "event": event,
+                "old_price": old_price,
+                "vehicle": vehicle_payload(vehicle),
+            })
+    
+    def to_dict(self):
+        return {
+            "rules": [rule.to_dict() for rule in self.rules.values()],
+            "evaluated": self.evaluated,
+            "matched": self.matched,
+        }
+
+class OutboxEntry:
+    __slots__ = ("id", "endpoint", "payload", "attempts", "queued_at")
+    
+    def __init__(self, entry_id, endpoint, payload, attempts=0):
+        self.id = entry_id
+        self.endpoint = endpoint
+        self.payload = payload
+        self.attempts = attempts
+        self.queued_at = time.monotonic()
+
+class WebhookEndpoint:
+    """État de livraison d'un endpoint: file, envois en cours, backoff"""
+    
+    def __init__(self, url: str):
+        self.url = url
+        self.pending = deque()
+        self.inflight = 0
+        self.failures = 0  # échecs consécutifs
+        self.retry_at = 0.0
+        self.delivered = 0
+        self.dead = 0
+        self.last_error = None
+    
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "pending": len(self.pending),
+            "inflight": self.inflight,
+            "consecutive_failures": self.failures,
+            "retry_in_s": round(max(self.retry_at - time.monotonic(), 0), 1),
+            "delivered": self.delivered,
+            "dead": self.dead,
+            "last_error": self.last_error,
+        }
+
+class WebhookOutbox:
+    """Outbox durable: journal JSONL (add/done/dead) + livraison groupée par endpoint
+    
+    Chaque alerte est écrite au journal avant d'être mise en file; au démarrage
+    les entrées sans done/dead sont rechargées. Par endpoint: lots de
+    WEBHOOK_BATCH_SIZE (ou après WEBHOOK_BATCH_WINDOW s), au plus
+    WEBHOOK_CONCURRENCY envois simultanés, backoff exponentiel après un échec.
+    """
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self.endpoints = {}
+        self.unfinished = {}  # id -> entrée (en file ou en cours d'envoi)
+        self.file = None
+        self.dirty = False
+        self.finished_lines = 0
+        self.wakeup = asyncio.Event()
+        self.client = None
+        self.task = None
+        self.inflight = set()  # tâches _deliver en cours (référence gardée jusqu'à leur fin)
+        self.next_id = 0
+    
+    def pending_count(self):
+        return sum(len(e.pending) for e in self.endpoints.values())
+    
+    def _endpoint(self, url):
+        endpoint = self.endpoints.get(url)
+        if endpoint is None:
+            endpoint = self.endpoints[url] = WebhookEndpoint(url)
+        return endpoint
+    
+    def _new_id(self):
+        self.next_id += 1
+        return f"{int(time.time() * 1000):x}-{self.next_id}"
+    
+    def load(self):
+        """Relit le journal et reprend les livraisons non terminées"""
+        if not self.path:
+            return
+        entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue  # ligne tronquée (arrêt brutal)
+                    if record["op"] == "add":
+                        entries[record["id"]] = OutboxEntry(record["id"], record["endpoint"], record["payload"])
+                    else:
+                        entries.pop(record["id"], None)
+        for entry in entries.values():
+            self._endpoint(entry.endpoint).pending.append(entry)
+        self.unfinished = entries
+        self._compact()
+        if entries:
+            logger.info(f"📮 Outbox: {len(entries)} alerte(s) à livrer reprises")
+    
+    def _compact(self):
+        """Réécrit le journal avec les seules entrées non terminées"""
+        if self.file:
+            self.file.close()
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for entry in self.unfinished.values():
+                f.write(json.dumps({"op": "add", "id": entry.id, "endpoint": entry.endpoint,
+                                    "payload": entry.payload}, ensure_ascii=False, default=str) + "\n")
+        os.replace(tmp, self.path)
+        self.file = open(self.path, "a", encoding="utf-8")
+        self.finished_lines = 0
+    
+    def _finish(self, entries, op, error=None):
+        for entry in entries:
+            self.unfinished.pop(entry.id, None)
+        self._log([{"op": op, "id": entry.id, "error": error} for entry in entries])
+        self.finished_lines += len(entries)
+    
+    def _log(self, records):
+        if not self.file:
+            return
+        for record in records:
+            self.file.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        # flush: survit à un crash du process; fsync groupé dans la boucle d'envoi
+        self.file.flush()
+        self.dirty = True
+    
+    def enqueue(self, endpoint: str, payload: dict):
+        entry = OutboxEntry(self._new_id(), endpoint, payload)
+        self._log([{"op": "add", "id": entry.id, "endpoint": endpoint, "payload": payload}])
+        self.unfinished[entry.id] = entry
+        self._endpoint(endpoint).pending.append(entry)
+        self.wakeup.set()
+    
+    async def start(self):
+        self.client = httpx.AsyncClient(timeout=WEBHOOK_TIMEOUT)
+        self.task = asyncio.create_task(self._dispatch())
+    
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        # Envois en cours menés à terme (bornés par WEBHOOK_TIMEOUT) avant de fermer client et journal
+        await asyncio.gather(*self.inflight, return_exceptions=True)
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+        if self.file:
+            self.file.close()
+            self.file = None
+    
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            wait = 1.0
+            for endpoint in self.endpoints.values():
+                if endpoint.pending and now < endpoint.retry_at:
+                    wait = min(wait, endpoint.retry_at - now)
+                    continue
+                while endpoint.pending and endpoint.inflight < WEBHOOK_CONCURRENCY:
+                    age = now - endpoint.pending[0].queued_at
+                    if len(endpoint.pending) < WEBHOOK_BATCH_SIZE and age < WEBHOOK_BATCH_WINDOW:
+                        wait = min(wait, WEBHOOK_BATCH_WINDOW - age)
+                        break
+                    count = min(WEBHOOK_BATCH_SIZE, len(endpoint.pending))
+                    batch = [endpoint.pending.popleft() for _ in range(count)]
+                    endpoint.inflight += 1
+                    task = asyncio.create_task(self._deliver(endpoint, batch))
+                    self.inflight.add(task)
+                    task.add_done_callback(self.inflight.discard)
+            
+            if self.dirty and self.file:
+                self.dirty = False
+                await asyncio.to_thread(os.fsync, self.file.fileno())
+            if self.path and self.finished_lines > OUTBOX_COMPACT_AFTER:
+                self._compact()
+            
+            self.wakeup.clear()
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), max(wait, 0.01))
+            except asyncio.TimeoutError:
+                pass
+    
+    async def _deliver(self, endpoint: WebhookEndpoint, batch: list):
+        permanent = False
+        try:
+            response = await self.client.post(endpoint.url, json={
+                "alerts": [entry.payload for entry in batch],
+                "count": len(batch),
+            })
+            ok = 200 <= response.status_code < 300
+            # 4xx (hors 408/429): le receveur refuse, inutile de réessayer
+            permanent = 400 <= response.status_code < 500 and response.status_code not in (408, 429)
+            error = None if ok else f"HTTP {response.status_code}"
+        except Exception as e:
+            # Toute erreur (réseau, URL refusée par httpx...) est un échec à réessayer:
+            # le lot a déjà quitté endpoint.pending, il ne doit pas être perdu
+            ok = False
+            error = f"{type(e).__name__}: {str(e)[:100]}"
+        finally:
+            endpoint.inflight -= 1
+        
+        if ok:
+            endpoint.failures = 0
+            endpoint.retry_at = 0.0
+            endpoint.delivered += len(batch)
+            WEBHOOK_DELIVERIES.inc("ok")
+            self._finish(batch, "done")
+        else:
+            endpoint.failures += 1
+            endpoint.last_error = error
+            backoff = min(WEBHOOK_BACKOFF_BASE * 2 ** (endpoint.failures - 1), WEBHOOK_BACKOFF_MAX)
+            endpoint.retry_at = time.monotonic() + backoff * random.uniform(0.8, 1.2)
+            retry, dead = [], []
+            for entry in batch:
+                entry.attempts += 1
+                (dead if permanent or entry.attempts >= WEBHOOK_MAX_ATTEMPTS else retry).append(entry)
+            endpoint.pending.extendleft(reversed(retry))
+            if dead:
+                endpoint.dead += len(dead)
+                WEBHOOK_DELIVERIES.inc("dead")
+                self._finish(dead, "dead", error)
+            if retry:
+                WEBHOOK_DELIVERIES.inc("retry")
+            logger.warning(f"📮 Webhook {endpoint.url}: {error} (nouvel essai dans {backoff:.0f}s)")
+        self.wakeup.set()
+    
+    def to_dict(self):
+        return {
+            "pending": self.pending_count(),
+            "endpoints": [endpoint.to_dict() for endpoint in self.endpoints.values()],
+        }
+
+alerts = AlertEngine(ALERTS_FILE)
+outbox = WebhookOutbox(OUTBOX_FILE)
+
+# ============ ARCHIVE COLONNAIRE ============
+
+# Colonnes archivées: numériques (NumPy), dictionnaire (faible cardinalité), texte
+ARCHIVE_NUMERIC = {
+    "published_at": np.int64, "archived_at": np.int64,  # secondes epoch, 0 = inconnue
+    "price": np.int32, "year": np.int16, "mileage": np.int32, "market_price": np.int32,
+    "score": np.float32, "below_market_pct": np.float32, "is_pro": np.bool_,
+}
+ARCHIVE_MISSING = {"mileage": -1, "market_price": -1}  # sentinelle des valeurs inconnues (0 sinon)
+ARCHIVE_DELTA = ("published_at", "archived_at")  # stockées en différences (compression)
+ARCHIVE_DICT = ("brand", "model", "fuel", "gearbox", "location")
+ARCHIVE_TEXT = ("id", "title", "url", "repost_of")
+ARCHIVE_FIELDS = [name for name in ARCHIVE_NUMERIC if name != "archived_at"] + list(ARCHIVE_DICT) + list(ARCHIVE_TEXT)
+ARCHIVE_STATS = ("published_at", "archived_at", "price", "year", "mileage")  # min/max par bloc
+
+def _epoch(value) -> int:
+    return int(value.timestamp()) if isinstance(value, datetime) else 0
+
+def _numeric_column(name, values):
+    """Valeurs Python -> tableau NumPy (None -> valeur sentinelle de la colonne)"""
+    dtype = ARCHIVE_NUMERIC[name]
+    if name in ARCHIVE_DELTA:
+        return np.array([_epoch(v) for v in values], dtype=dtype)
+    if dtype == np.float32:
+        return np.array([np.nan if v is None else v for v in values], dtype=dtype)
+    if name in ARCHIVE_MISSING:
+        return np.array([ARCHIVE_MISSING[name] if v is None else v for v in values], dtype=dtype)
+    return np.array([v or 0 for v in values], dtype=dtype)
+
+def _numeric_values(name, column):
+    """Tableau NumPy -> valeurs Python (sentinelles -> None)"""
+    if name in ARCHIVE_DELTA:
+        return [datetime.fromtimestamp(v).isoformat() if v else None for v in column.tolist()]
+    if name == "is_pro":
+        return column.tolist()
+    if column.dtype == np.float32:
+        return [None if math.isnan(v) else round(v, 2) for v in column.tolist()]
+    missing = ARCHIVE_MISSING.get(name, 0)
+    return [None if v == missing else v for v in column.tolist()]
+
+class ArchiveBlock:
+    """Bloc d'un segment: lignes d'un flush, colonnes compressées séparément"""
+    
+    __slots__ = ("segment", "offset", "length", "rows", "parts", "stats", "brands", "departments")
+    
+    def __init__(self, record):
+        self.segment = record["segment"]
+        self.offset = record["offset"]
+        self.length = record["length"]
+        self.rows = record["rows"]
+        self.parts = record["parts"]  # colonne -> [décalage dans le bloc, longueur]
+        self.stats = record["stats"]  # colonne -> [min, max]
+        self.brands = set(record["brands"])
+        self.departments = set(record["departments"])
+
+class ArchiveSegment:
+    """Fichier append-only d'une période (heure ou jour), min/max agrégés de ses blocs"""
+    
+    def __init__(self, key):
+        self.key = key
+        self.blocks = []
+        self.rows = 0
+        self.bytes = 0
+        self.stats = {}
+    
+    def add(self, block):
+        self.blocks.append(block)
+        self.rows += block.rows
+        self.bytes += block.length
+        for name, (low, high) in block.stats.items():
+            current = self.stats.get(name)
+            self.stats[name] = [low, high] if current is None else [min(current[0], low), max(current[1], high)]
+    
+    def to_dict(self):
+        return {
+            "segment": self.key,
+            "blocks": len(self.blocks),
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "stats": {
+                name: [datetime.fromtimestamp(v).isoformat() for v in bounds] if name in ARCHIVE_DELTA else bounds
+                for name, bounds in self.stats.items()
+            },
+        }
+
+class ArchiveFilter:
+    """Critères d'une requête d'archive (bornes de temps en secondes epoch)"""
+    
+    def __init__(self, since=None, until=None, brand=None, location=None, min_price=None, max_price=None,
+                 min_year=None, max_year=None):
+        self.since = _epoch(since) if since else None
+        self.until = _epoch(until) if until else None
+        self.brand = brand.lower() if brand else None
+        location = location.strip().lower() if location else None
+        self.department = location if location and location.isdigit() and len(location) in (2, 3) else None
+        self.location = location
+        self.bounds = {
+            "published_at": (self.since, self.until),
+            "price": (min_price or None, max_price or None),
+            "year": (min_year, max_year),
+        }
+    
+    def prunes(self, stats, brands=None, departments=None) -> bool:
+        """Vrai si aucune ligne ne peut correspondre (min/max, marques, départements)"""
+        for name, (low, high) in self.bounds.items():
+            bounds = stats.get(name)
+            if bounds is None:
+                continue
+            if low is not None and bounds[1] < low:
+                return True
+            if high is not None and bounds[0] > high:
+                return True
+        if brands is not None and self.brand and self.brand not in brands:
+            return True
+        if departments is not None and self.department and self.department not in departments:
+            return True
+        return False
+
+class AdArchive:
+    """Archive append-only de toutes les annonces ingérées (au-delà du store mémoire)
+    
+    Les annonces sont mises en tampon à l'ingestion (une copie de leurs champs),
+    puis écrites par une tâche de fond: un bloc par flush et par période, chaque
+    colonne compressée séparément (zlib), dans `<période>.seg`. Une ligne par
+    bloc est ajoutée à `index.jsonl` (emplacement, min/max, marques,
+    départements) après l'écriture des données: un bloc absent de l'index
+    (crash) est simplement ignoré. Les lectures passent par mmap et ne
+    décompressent que les blocs non élagués, filtres d'abord puis colonnes
+    restantes pour les lignes retenues. Les workers API lisent les mêmes
+    fichiers (index relu à chaque requête); le tampon non encore écrit n'est
+    visible qu'après le prochain flush.
+    """
+    
+    def __init__(self, path: Optional[str] = None, roll: str = "hour"):
+        self.path = path
+        self.roll = roll
+        self.segments = OrderedDict()  # clé de période -> ArchiveSegment (ordre chronologique)
+        self.pending = []  # (archived_at, valeurs de ARCHIVE_FIELDS)
+        self.index_position = 0  # octets de index.jsonl déjà chargés
+        self.maps = OrderedDict()  # segment -> (mmap, fichier), les moins récemment lus d'abord
+        self.read_lock = threading.Lock()
+        self.wakeup = asyncio.Event()
+        self.task = None
+        self.writer = False  # process d'ingestion: seul à écrire, index tenu en mémoire
+        self.stopping = False
+        self.flushed_rows = 0
+        self.flush_seconds = 0.0
+    
+    @property
+    def index_path(self):
+        return os.path.join(self.path, "index.jsonl")
+    
+    def segment_key(self, at: datetime) -> str:
+        return at.strftime("%Y%m%d%H" if self.roll == "hour" else "%Y%m%d")
+    
+    def rows(self):
+        return sum(segment.rows for segment in self.segments.values())
+    
+    # ---- écriture ----
+    
+    def append(self, vehicle: dict):
+        """Appelé à l'ingestion: copie des champs, écriture différée"""
+        if not self.task:
+            return
+        self.pending.append((clock.now(), [vehicle.get(name) for name in ARCHIVE_FIELDS]))
+        if len(self.pending) >= ARCHIVE_FLUSH_ROWS:
+            self.wakeup.set()
+    
+    async def start(self):
+        if not self.path:
+            return
+        os.makedirs(self.path, exist_ok=True)
+        self.refresh()
+        self.writer = True
+        self.task = asyncio.create_task(self._run())
+        logger.info(f"🗄️ Archive: {len(self.segments)} segment(s), {self.rows()} annonces ({self.path})")
+    
+    async def stop(self):
+        if self.task:
+            # Pas d'annulation: un flush en cours écrirait des blocs absents de l'index en mémoire
+            self.stopping = True
+            self.wakeup.set()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+        for key in list(self.maps):
+            self._unmap(key)
+    
+    async def _run(self):
+        while not self.stopping:
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), ARCHIVE_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"❌ Archive: {str(e)[:100]}")
+        await self.flush()  # annonces reçues pendant la dernière écriture
+    
+    async def flush(self):
+        """Écrit le tampon (encodage, compression et E/S dans un thread)"""
+        if not self.pending:
+            return
+        pending, self.pending = self.pending, []
+        started = time.perf_counter()
+        by_segment = defaultdict(list)
+        for archived_at, values in pending:
+            by_segment[self.segment_key(archived_at)].append((archived_at, values))
+        records = await asyncio.to_thread(self._write, by_segment)
+        for record in records:
+            self._add_block(ArchiveBlock(record))
+        self.flushed_rows += len(pending)
+        self.flush_seconds += time.perf_counter() - started
+        ARCHIVE_ROWS.inc(amount=len(pending))
+    
+    def _write(self, by_segment):
+        records = []
+        for key, rows in by_segment.items():
+            data, parts, stats, brands, departments = self._encode(rows)
+            with open(os.path.join(self.path, f"{key}.seg"), "ab") as f:
+                offset = f.tell()
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            records.append({
+                "segment": key, "offset": offset, "length": len(data), "rows": len(rows),
+                "parts": parts, "stats": stats, "brands": brands, "departments": departments,
+            })
+        # Index écrit après les données: il ne référence que des blocs complets
+        with open(self.index_path, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        return records
+    
+    @staticmethod
+    def _encode(rows):
+        """Lignes -> (octets du bloc, parties, min/max, marques, départements)"""
+        columns = dict(zip(ARCHIVE_FIELDS, zip(*(values for _, values in rows))))
+        columns["archived_at"] = [archived_at for archived_at, _ in rows]
+        chunks, parts, stats = [], {}, {}
+        offset = 0
+        
+        def put(name, raw):
+            nonlocal offset
+            data = zlib.compress(raw, 6)
+            chunks.append(data)
+            parts[name] = [offset, len(data)]
+            offset += len(data)
+        
+        for name in ARCHIVE_NUMERIC:
+            column = _numeric_column(name, columns[name])
+            if name in ARCHIVE_STATS:
+                known = column[column != ARCHIVE_MISSING.get(name, 0)]
+                if len(known):
+                    stats[name] = [int(known.min()), int(known.max())]
+            if name in ARCHIVE_DELTA:
+                column = np.diff(column, prepend=np.int64(0))
+            put(name, column.tobytes())
+        for name in ARCHIVE_DICT:
+            values = list(dict.fromkeys(columns[name]))
+            codes = {value: code for code, value in enumerate(values)}
+            put(name, np.array([codes[v] for v in columns[name]], dtype=np.uint32).tobytes())
+            put(f"{name}.dict", json.dumps(values, ensure_ascii=False).encode("utf-8"))
+        for name in ARCHIVE_TEXT:
+            put(name, json.dumps(list(columns[name]), ensure_ascii=False).encode("utf-8"))
+        
+        brands = sorted({(b or "").lower() for b in columns["brand"]})
+        departments = sorted({d for d in map(get_department, columns["location"]) if d})
+        return b"".join(chunks), parts, stats, brands, departments
+    
+    # ---- index ----
+    
+    def _add_block(self, block):
+        segment = self.segments.get(block.segment)
+        if segment is None:
+            out_of_order = bool(self.segments) and block.segment < next(reversed(self.segments))
+            segment = self.segments[block.segment] = ArchiveSegment(block.segment)
+            if out_of_order:
+                self.segments = OrderedDict(sorted(self.segments.items()))
+        segment.add(block)
+    
+    def refresh(self):
+        """Charge les lignes d'index ajoutées depuis la dernière lecture (workers API)
+        
+        Le process qui écrit connaît déjà ses blocs: l'index n'est lu qu'au démarrage.
+        """
+        if not self.path or self.writer or not os.path.exists(self.index_path):
+            return
+        if os.path.getsize(self.index_path) <= self.index_position:
+            return
+        with open(self.index_path, "rb") as f:
+            f.seek(self.index_position)
+            data = f.read()
+        end = data.rfind(b"\n") + 1  # ligne partielle: relue au prochain appel
+        for line in data[:end].splitlines():
+            try:
+                self._add_block(ArchiveBlock(json.loads(line)))
+            except (ValueError, KeyError):
+                continue
+        self.index_position += end
+    
+    # ---- lecture ----
+    
+    def _map(self, key, end):
+        """mmap du segment, recréé si le fichier a grandi depuis"""
+        entry = self.maps.get(key)
+        if entry is None or len(entry[0]) < end:
+            if entry:
+                self._unmap(key)
+            f = open(os.path.join(self.path, f"{key}.seg"), "rb")
+            entry = self.maps[key] = (mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), f)
+            while len(self.maps) > ARCHIVE_MAX_MAPS:
+                self._unmap(next(iter(self.maps)))
+        self.maps.move_to_end(key)
+        return entry[0]
+    
+    def _unmap(self, key):
+        mm, f = self.maps.pop(key)
+        mm.close()
+        f.close()
+    
+    def plan(self, criteria: ArchiveFilter):
+        """Blocs à lire après élagage par segment puis par bloc"""
+        self.refresh()
+        blocks = []
+        pruned_segments = pruned_blocks = 0
+        for segment in self.segments.values():
+            if criteria.prunes(segment.stats):
+                pruned_segments += 1
+                continue
+            for block in segment.blocks:
+                if criteria.prunes(block.stats, block.brands, block.departments):
+                    pruned_blocks += 1
+                else:
+                    blocks.append(block)
+        return blocks, {"segments": len(self.segments), "pruned_segments": pruned_segments,
+                        "blocks_scanned": len(blocks), "pruned_blocks": pruned_blocks}
+    
+    async def read(self, blocks, criteria: ArchiveFilter, limit: Optional[int] = None):
+        """Lignes correspondantes des blocs, du plus ancien au plus récent
+        
+        Chaque bloc est décompressé dans un thread: la boucle reste libre entre deux blocs.
+        """
+        for block in blocks:
+            try:
+                rows = await asyncio.to_thread(self._decode_block, block, criteria)
+            except (OSError, ValueError, zlib.error) as e:
+                logger.warning(f"⚠️ Archive: bloc illisible {block.segment}@{block.offset}: {e}")
+                continue
+            if limit is not None:
+                rows = rows[:limit]
+                limit -= len(rows)
+            for row in rows:
+                yield row
+            if limit == 0:
+                return
+    
+    def _decode_block(self, block, criteria):
+        # Un seul décodage à la fois: le LRU des mmap ne ferme pas un segment en cours de lecture
+        with self.read_lock:
+            return list(self._read_block(block, criteria))
+    
+    def _read_block(self, block, criteria):
+        mm = self._map(block.segment, block.offset + block.length)
+        
+        def raw(name):
+            start, length = block.parts[name]
+            start += block.offset
+            return zlib.decompress(mm[start:start + length])
+        
+        def numeric(name):
+            column = np.frombuffer(raw(name), dtype=ARCHIVE_NUMERIC[name])
+            return np.cumsum(column) if name in ARCHIVE_DELTA else column
+        
+        def dictionary(name):
+            return np.frombuffer(raw(name), dtype=np.uint32), json.loads(raw(f"{name}.dict"))
+        
+        # Filtres d'abord, sur les seules colonnes concernées
+        decoded = {}
+        mask = np.ones(block.rows, dtype=np.bool_)
+        for name, (low, high) in criteria.bounds.items():
+            if low is None and high is None:
+                continue
+            column = decoded[name] = numeric(name)
+            # Valeurs inconnues (sentinelles) exclues, comme dans les min/max des blocs:
+            # le résultat ne dépend pas de l'élagage
+            mask &= column != ARCHIVE_MISSING.get(name, 0)
+            if low is not None:
+                mask &= column >= low
+            if high is not None:
+                mask &= column <= high
+        for name, wanted in (("brand", criteria.brand), ("location", criteria.location)):
+            if not wanted:
+                continue
+            codes, values = decoded[name] = dictionary(name)
+            if name == "brand":
+                keep = [i for i, v in enumerate(values) if (v or "").lower() == wanted]
+            elif criteria.department:
+                keep = [i for i, v in enumerate(values) if get_department(v) == criteria.department]
+            else:
+                keep = [i for i, v in enumerate(values) if wanted in (v or "").lower()]
+            mask &= np.isin(codes, keep)
+        rows = np.flatnonzero(mask)
+        if not len(rows):
+            return
+        
+        # Puis les autres colonnes, pour les lignes retenues seulement
+        columns = {}
+        for name in ARCHIVE_NUMERIC:
+            column = decoded[name] if name in decoded else numeric(name)
+            columns[name] = _numeric_values(name, column[rows])
+        for name in ARCHIVE_DICT:
+            codes, values = decoded[name] if name in decoded else dictionary(name)
+            columns[name] = [values[c] for c in codes[rows].tolist()]
+        for name in ARCHIVE_TEXT:
+            values = json.loads(raw(name))
+            columns[name] = [values[i] for i in rows.tolist()]
+        names = [name for name in ARCHIVE_COLUMNS if name in columns]
+        for values in zip(*(columns[name] for name in names)):
+            yield dict(zip(names, values))
+    
+    def to_dict(self):
+        return {
+            "enabled": bool(self.path),
+            "path": self.path,
+            "roll": self.roll,
+            "segments": len(self.segments),
+            "blocks": sum(len(s.blocks) for s in self.segments.values()),
+            "rows": self.rows(),
+            "bytes": sum(s.bytes for s in self.segments.values()),
+            "pending": len(self.pending),
+            "flushed_rows": self.flushed_rows,
+            "flush_seconds": round(self.flush_seconds, 3),
+        }
+
+archive = AdArchive(ARCHIVE_DIR, ARCHIVE_ROLL)
+
+# ============ WEBSOCKET ============
+
+def vehicle_payload(vehicle):
+    """Copie sérialisable en JSON d'un véhicule"""
+    vehicle_data = {**vehicle}
+    if isinstance(vehicle_data.get("published_at"), datetime):
         vehicle_data["published_at"] = vehicle_data["published_at"].isoformat()
+    return vehicle_data
+
+async def broadcast_new_vehicle(vehicle):
+    """Broadcast nouvelle annonce"""
+    if not websocket_clients:
+        return
     
-    message = json.dumps({
+    await broadcast_message(json.dumps({
         "type": "new_vehicle",
-        "vehicle": vehicle_data
-    })
+        "vehicle": vehicle_payload(vehicle)
+    }))
+
+async def broadcast_new_vehicles(vehicles):
+    """Broadcast d'un lot d'annonces (POST /api/ingest) en un seul message"""
+    if not websocket_clients or not vehicles:
+        return
+    
+    await broadcast_message(json.dumps({
+        "type": "new_vehicles",
+        "count": len(vehicles),
+        "vehicles": [vehicle_payload(v) for v in vehicles]
+    }))
+
+async def broadcast_price_drop(vehicle, old_price):
+    """Broadcast baisse de prix d'une annonce connue"""
+    if not websocket_clients:
+        return
     
+    new_price = vehicle.get("price") or 0
+    await broadcast_message(json.dumps({
+        "type": "price_drop",
+        "vehicle_id": vehicle["id"],
+        "old_price": old_price,
+        "new_price": new_price,
+        "drop_pct": round((old_price - new_price) / old_price * 100, 1) if old_price else None,
+        "vehicle": vehicle_payload(vehicle)
+    }))
+
+async def broadcast_message(message: str):
+    """Envoie un message à tous les clients WebSocket"""
+    started = time.perf_counter()
     disconnected = []
-    for client in websocket_clients:
+    # Envois séquentiels: un client lent retarde les suivants, dont le retard est compté ici
+    clients = list(websocket_clients)
+    size = len(message.encode("utf-8"))
+    for client in clients:
+        websocket_pending[client] = websocket_pending.get(client, 0) + size
+    for client in clients:
         try:
             await client.send_text(message)
         except:
             disconnected.append(client)
+        finally:
+            remaining = websocket_pending.get(client, 0) - size
+            if remaining > 0:
+                websocket_pending[client] = remaining
+            else:
+                websocket_pending.pop(client, None)
     
     for client in disconnected:
-        websocket_clients.remove(client)
+        if client in websocket_clients:
+            websocket_clients.remove(client)
+    BROADCAST_LATENCY.observe(time.perf_counter() - started)
+
+# ============ PIPELINE D'INGESTION ============
+
+class PageItem:
+    """Page récupérée en transit dans le pipeline"""
+    
+    __slots__ = ("search", "page_num", "html", "fetched_at", "initial", "batch", "ads", "price_drops", "price_changes")
+    
+    def __init__(self, search, page_num, html, fetched_at, initial, batch=False):
+        self.search = search
+        self.page_num = page_num
+        self.html = html
+        self.fetched_at = fetched_at
+        self.initial = initial  # Premier scan de la recherche: stocké sans notification
+        self.batch = batch  # Lot /api/ingest: pas de recherche, diffusé en un message
+        self.ads = []
+        self.price_drops = []  # (véhicule, ancien prix)
+        self.price_changes = []  # événements price_change pour le bus
+    
+    def origin(self):
+        return "lot /api/ingest" if self.batch else f"page {self.page_num}"
+
+class IngestPipeline:
+    """fetch -> parse -> dedup -> store -> broadcast, reliés par des files bornées
+    
+    Le scan (fetch) pousse chaque page dès sa réception; les étapes suivantes
+    tournent en parallèle, donc les nouvelles annonces de la page 1 sont
+    stockées et poussées pendant que les pages suivantes sont récupérées.
+    Une file pleine bloque l'étape amont (backpressure).
+    """
+    
+    STAGES = ("parse", "dedup", "store", "broadcast")
+    
+    def __init__(self, maxsize: int = PIPELINE_QUEUE_SIZE):
+        self.queues = {stage: asyncio.Queue(maxsize) for stage in self.STAGES}
+        self.processed = Counter()
+        self.tasks = []
+    
+    def start(self):
+        if self.tasks:
+            return
+        workers = {
+            "parse": self._parse,
+            "dedup": self._dedup,
+            "store": self._store,
+            "broadcast": self._broadcast,
+        }
+        for stage in self.STAGES:
+            self.tasks.append(asyncio.create_task(self._run(stage, workers[stage])))
+    
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+    
+    async def drain(self):
+        """Attend que toutes les files soient vides (dans l'ordre des étapes)"""
+        for stage in self.STAGES:
+            await self.queues[stage].join()
+    
+    def depths(self):
+        return {stage: queue.qsize() for stage, queue in self.queues.items()}
+    
+    async def submit(self, item: PageItem):
+        await self.queues["parse"].put(item)
+        # Horloge virtuelle: le fetch n'avance pas le temps pendant que les
+        # étapes travaillent (traitement = 0s virtuelle, latences fidèles)
+        if clock.simulated:
+            await self.drain()
+    
+    async def _run(self, stage, worker):
+        queue = self.queues[stage]
+        while True:
+            item = await queue.get()
+            try:
+                result = await worker(item)
+                self.processed[stage] += 1
+                if result is not None:
+                    next_stage = self.STAGES[self.STAGES.index(stage) + 1]
+                    await self.queues[next_stage].put(result)
+            except Exception as e:
+                logger.error(f"❌ Pipeline [{stage}]: {str(e)[:100]}")
+            finally:
+                queue.task_done()
+    
+    async def _parse(self, item):
+        # BeautifulSoup hors de la boucle asyncio
+        item.ads = await asyncio.to_thread(scraper.parse_page, item.html, item.fetched_at)
+        item.html = None
+        item.search.ads_found += len(item.ads)
+        if item.ads:
+            logger.info(f"     ✅ Page {item.page_num}: {len(item.ads)} annonces trouvées")
+        return item
+    
+    async def _dedup(self, item):
+        search = item.search
+        new_ads = []
+        for ad in item.ads:
+            if search is not None and ad['id'] not in search.seen_ads:
+                search.seen_ads.add(ad['id'])
+                search.new_ads += 1
+            if ad['id'] in scraper.seen_ads:
+                self._diff_price(item, store.get(ad['id']), ad.get('price'))
+                continue
+            scraper.seen_ads.add(ad['id'])
+            new_ads.append(ad)
+        DEDUP_RESULTS.inc("hit", len(item.ads) - len(new_ads))
+        DEDUP_RESULTS.inc("miss", len(new_ads))
+        item.ads = new_ads
+        # Hausses comprises: _store publie les changements de prix sur le bus (réplicas)
+        if not new_ads and not item.price_changes:
+            return None
+        return item
+    
+    def _diff_price(self, item, stored, new_price):
+        """Annonce déjà vue: enregistre un changement de prix éventuel"""
+        if stored is None or not new_price:
+            return
+        old_price = stored.get("price") or 0
+        if not old_price or new_price == old_price:
+            return
+        at = item.fetched_at or clock.now()
+        price_history.record(stored, new_price, at)
+        store.update_price(stored["id"], new_price)
+        item.price_changes.append(price_change_event(stored["id"], old_price, new_price, at))
+        if new_price < old_price:
+            PRICE_CHANGES.inc("drop")
+            item.price_drops.append((stored, old_price))
+        else:
+            PRICE_CHANGES.inc("rise")
+    
+    async def _store(self, item):
+        for ad in item.ads:
+            # Parsé dans un thread: le modèle a pu changer entre-temps
+            ad["score"] = scoring.score_vehicle(ad)
+            original = reposts.check(ad)
+            if original:
+                self._link_repost(item, ad, store.get(original))
+                # Même véhicule que l'original: comparé au marché sans y compter deux fois
+                market.compare(ad)
+            else:
+                market.observe(ad)
+            store.add(ad)
+            archive.append(ad)
+        bus_server.publish_ingested(item)
+        if item.initial:
+            if item.ads:
+                logger.info(f"     💾 {len(item.ads)} annonces chargées (page {item.page_num})")
+            # Les baisses de prix sur des annonces connues restent notifiées
+            item.ads = []
+            return item if item.price_drops else None
+        if item.ads:
+            scraper.total_new_ads += len(item.ads)
+            logger.info(f"\n🆕 {len(item.ads)} NOUVELLE(S) ANNONCE(S)! ({item.origin()})")
+        return item if item.ads or item.price_drops else None
+    
+    def _link_repost(self, item, ad, original):
+        """Republication (nouvel id, ex. id md5(titre_prix)): l'historique suit l'annonce"""
+        if original is None:
+            return
+        old_price = original.get("price") or 0
+        new_price = ad.get("price") or 0
+        if not old_price or not new_price or new_price == old_price:
+            return
+        at = item.fetched_at or clock.now()
+        price_history.carry(original["id"], ad["id"])
+        price_history.record({**original, "id": ad["id"]}, new_price, at)
+        item.price_changes.append(price_change_event(ad["id"], old_price, new_price, at, original["id"]))
+        if new_price < old_price:
+            PRICE_CHANGES.inc("drop")
+            item.price_drops.append((ad, old_price))
+        else:
+            PRICE_CHANGES.inc("rise")
+    
+    async def _broadcast(self, item):
+        for vehicle, old_price in item.price_drops:
+            logger.info(f"   📉 {vehicle['title'][:50]}: {old_price}€ -> {vehicle['price']}€")
+            alerts.evaluate(vehicle, "price_drop", old_price)
+            await broadcast_price_drop(vehicle, old_price)
+        if item.batch:
+            await self._broadcast_batch(item)
+            return None
+        for ad in item.ads:
+            if ad.get("repost_of") and SUPPRESS_REPOST_BROADCASTS:
+                logger.info(f"   ♻️ Republication de {ad['repost_of']}: {ad['title'][:50]}")
+                continue
+            logger.info(f"   📌 {ad['title'][:50]}... - {ad['price']}€ - {ad['location']}")
+            alerts.evaluate(ad)
+            await broadcast_new_vehicle(ad)
+            TIME_TO_NOTIFY.observe((clock.now() - ad["published_at"]).total_seconds())
+        return None
+    
+    async def _broadcast_batch(self, item):
+        """Lot /api/ingest: alertes par annonce, un seul message WebSocket"""
+        vehicles = [ad for ad in item.ads if not (ad.get("repost_of") and SUPPRESS_REPOST_BROADCASTS)]
+        for ad in vehicles:
+            alerts.evaluate(ad)
+        if not vehicles:
+            return
+        logger.info(f"   📦 {len(vehicles)} annonce(s) diffusée(s) en un lot")
+        await broadcast_new_vehicles(vehicles)
+        now = clock.now()
+        for ad in vehicles:
+            TIME_TO_NOTIFY.observe((now - ad["published_at"]).total_seconds())
+    
+    async def ingest(self, ads: list) -> dict:
+        """Lot d'un collecteur externe: dédup, stockage puis diffusion d'un seul tenant
+        
+        Les étapes sont appelées directement, sans les files: le lot entier est
+        dédupliqué et stocké sans rendre la main à la boucle (aucune requête ne
+        voit un lot à moitié stocké), puis diffusé en un message.
+        """
+        item = PageItem(None, 0, None, clock.now(), False, batch=True)
+        item.ads = ads
+        if await self._dedup(item) is not None:
+            await self._store(item)
+            await self._broadcast(item)
+        INGEST_ADS.inc("new", len(item.ads))
+        INGEST_ADS.inc("duplicate", len(ads) - len(item.ads))
+        return {
+            "new": len(item.ads),
+            "duplicates": len(ads) - len(item.ads),
+            "price_changes": len(item.price_changes),
+            "price_drops": len(item.price_drops),
+        }
+
+pipeline = IngestPipeline()
+
+# ============ BUS D'ÉVÉNEMENTS (MULTI-PROCESS) ============
+
+def bus_encode(message: dict) -> bytes:
+    return (json.dumps(message, ensure_ascii=False, default=str) + "\n").encode("utf-8")
+
+def price_change_event(vehicle_id, old_price, new_price, at, carry_from=None):
+    return {
+        "type": "price_change",
+        "vehicle_id": vehicle_id,
+        "old_price": old_price,
+        "new_price": new_price,
+        "at": at.isoformat(),
+        "carry_from": carry_from,
+    }
+
+class EventBus:
+    """Serveur du bus (process d'ingestion) sur socket Unix, JSON par ligne
+    
+    Un worker qui se connecte reçoit un snapshot du modèle de score, du store et
+    de l'historique des prix, puis chaque véhicule stocké et chaque changement de
+    prix. Il peut aussi appeler des commandes (stats, recherches) exécutées ici.
+    Un worker trop lent (file pleine) est déconnecté: il se reconnecte et repart
+    d'un snapshot.
+    """
+    
+    def __init__(self, path: str = BUS_SOCKET):
+        self.path = path
+        self.server = None
+        self.subscribers = {}  # writer -> file d'envoi
+        self.published = 0
+        self.dropped = 0
+    
+    async def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.server = await asyncio.start_unix_server(self._handle, path=self.path, limit=BUS_LINE_LIMIT)
+        logger.info(f"🚌 Bus d'événements: {self.path}")
+    
+    async def stop(self):
+        if self.server is None:
+            return
+        self.server.close()
+        for writer in list(self.subscribers):
+            self._drop(writer)
+        await self.server.wait_closed()
+        self.server = None
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+    
+    def publish(self, message: dict):
+        if not self.subscribers:
+            return
+        line = bus_encode(message)
+        self.published += 1
+        for writer in list(self.subscribers):
+            self._enqueue(writer, line)
+    
+    def publish_ingested(self, item):
+        """Véhicules stockés puis changements de prix d'une page du pipeline"""
+        if not self.subscribers:
+            return
+        if item.batch:
+            # Lot /api/ingest: un seul événement, diffusé en un message par les workers
+            if item.ads:
+                self.publish({
+                    "type": "new_vehicles",
+                    "vehicles": [vehicle_payload(ad) for ad in item.ads],
+                    "seqs": [store.seq_of(ad["id"]) for ad in item.ads],
+                    "notify": [not (ad.get("repost_of") and SUPPRESS_REPOST_BROADCASTS) for ad in item.ads],
+                })
+        else:
+            for ad in item.ads:
+                suppressed = ad.get("repost_of") and SUPPRESS_REPOST_BROADCASTS
+                self.publish({
+                    "type": "new_vehicle",
+                    "vehicle": vehicle_payload(ad),
+                    "seq": store.seq_of(ad["id"]),
+                    "notify": not item.initial and not suppressed,
+                })
+        for event in item.price_changes:
+            self.publish({**event, "notify": event["new_price"] < event["old_price"]})
+    
+    def _enqueue(self, writer, line: bytes):
+        queue = self.subscribers.get(writer)
+        if queue is None:
+            return
+        try:
+            queue.put_nowait(line)
+        except asyncio.QueueFull:
+            logger.warning("🐢 Worker trop lent: déconnecté (resynchronisation)")
+            self._drop(writer)
+    
+    def _drop(self, writer):
+        if self.subscribers.pop(writer, None) is not None:
+            self.dropped += 1
+        writer.close()
+    
+    def snapshot(self) -> list:
+        """Messages d'état initial (construits sans await: cohérents avec le flux qui suit)"""
+        # Modèle de score d'abord: les réplicas rescorent avec lui (changements de prix)
+        lines = [bus_encode({"type": "snapshot_scoring", "model": scoring.model.to_dict()})]
+        seqs, vehicles = [], []
+        for seq, v in store.scan():
+            seqs.append(seq)
+            vehicles.append(vehicle_payload(v))
+        for i in range(0, len(vehicles), BUS_SNAPSHOT_CHUNK):
+            lines.append(bus_encode({
+                "type": "snapshot",
+                "vehicles": vehicles[i:i + BUS_SNAPSHOT_CHUNK],
+                "seqs": seqs[i:i + BUS_SNAPSHOT_CHUNK],
+            }))
+        series = {vid: list(values) for vid, values in price_history.series.items()}
+        lines.append(bus_encode({"type": "snapshot_history", "series": series}))
+        lines.append(bus_encode({"type": "snapshot_end", "vehicles": len(vehicles)}))
+        return lines
+    
+    async def _handle(self, reader, writer):
+        self.subscribers[writer] = asyncio.Queue(BUS_SUBSCRIBER_QUEUE)
+        sender = asyncio.create_task(self._send(writer, self.snapshot()))
+        logger.info(f"🚌 Worker connecté ({len(self.subscribers)})")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                message = json.loads(line)
+                if message.get("type") == "call":
+                    asyncio.create_task(self._call(writer, message))
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"⚠️ Bus: {str(e)[:100]}")
+        finally:
+            sender.cancel()
+            self._drop(writer)
+            logger.info(f"🚌 Worker déconnecté ({len(self.subscribers)})")
+    
+    async def _send(self, writer, snapshot):
+        try:
+            for line in snapshot:
+                writer.write(line)
+                await writer.drain()
+            queue = self.subscribers.get(writer)
+            while queue is not None:
+                writer.write(await queue.get())
+                await writer.drain()
+        except ConnectionError:
+            self._drop(writer)
+    
+    async def _call(self, writer, message):
+        reply = {"type": "reply", "id": message.get("id")}
+        handler = BUS_COMMANDS.get(message.get("command"))
+        try:
+            if handler is None:
+                raise HTTPException(status_code=400, detail=f"Commande inconnue: {message.get('command')}")
+            reply["result"] = await handler(message.get("params") or {})
+        except HTTPException as e:
+            reply.update(error=e.detail, status=e.status_code)
+        except Exception as e:
+            reply.update(error=str(e)[:200], status=500)
+        self._enqueue(writer, bus_encode(reply))
+    
+    def to_dict(self):
+        return {
+            "socket": self.path,
+            "workers": len(self.subscribers),
+            "published": self.published,
+            "dropped": self.dropped,
+        }
+
+class BusClient:
+    """Côté worker API: réplica du store alimenté par le bus, commandes relayées"""
+    
+    def __init__(self, path: str = BUS_SOCKET):
+        self.path = path
+        self.writer = None
+        self.synced = False
+        self.pending = {}  # id -> future
+        self.next_id = 0
+        self.events = 0
+        self.connections = 0
+    
+    async def run(self):
+        """Connexion (et reconnexion) au process d'ingestion"""
+        global market
+        while True:
+            try:
+                reader, writer = await asyncio.open_unix_connection(self.path, limit=BUS_LINE_LIMIT)
+            except OSError:
+                await asyncio.sleep(1)
+                continue
+            self.writer = writer
+            self.connections += 1
+            store.clear()
+            price_history.series.clear()
+            # Le snapshot rejoue tous les prix: sketches repartis de zéro (sinon comptés deux fois)
+            market = MarketStats()
+            try:
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    await self._apply(json.loads(line))
+            except (ConnectionError, ValueError) as e:
+                logger.warning(f"⚠️ Bus: {str(e)[:100]}")
+            finally:
+                self.writer = None
+                self.synced = False
+                writer.close()
+                for future in self.pending.values():
+                    if not future.done():
+                        future.set_exception(ConnectionError("Bus déconnecté"))
+                self.pending.clear()
+            logger.warning("🔌 Bus perdu, reconnexion...")
+            await asyncio.sleep(1)
+    
+    async def call(self, command: str, params: Optional[dict] = None):
+        """Exécute une commande dans le process d'ingestion"""
+        if self.writer is None:
+            raise HTTPException(status_code=503, detail="Process d'ingestion injoignable")
+        self.next_id += 1
+        call_id = self.next_id
+        future = asyncio.get_running_loop().create_future()
+        self.pending[call_id] = future
+        self.writer.write(bus_encode({"type": "call", "id": call_id, "command": command, "params": params}))
+        try:
+            await self.writer.drain()
+            reply = await asyncio.wait_for(future, BUS_CALL_TIMEOUT)
+        except (ConnectionError, asyncio.TimeoutError):
+            raise HTTPException(status_code=503, detail="Process d'ingestion injoignable")
+        finally:
+            self.pending.pop(call_id, None)
+        if "error" in reply:
+            raise HTTPException(status_code=reply.get("status", 500), detail=reply["error"])
+        return reply["result"]
+    
+    @staticmethod
+    def _vehicle(payload):
+        if payload.get("published_at"):
+            payload["published_at"] = datetime.fromisoformat(payload["published_at"])
+        return payload
+    
+    async def _apply(self, message):
+        kind = message["type"]
+        self.events += 1
+        if kind == "new_vehicle":
+            vehicle = self._vehicle(message["vehicle"])
+            store.add(vehicle, message.get("seq"))
+            # Republications hors marché, comme dans le process d'ingestion
+            if not vehicle.get("repost_of"):
+                market.record(vehicle)
+            if message.get("notify"):
+                await broadcast_new_vehicle(vehicle)
+                TIME_TO_NOTIFY.observe((clock.now() - vehicle["published_at"]).total_seconds())
+        elif kind == "new_vehicles":
+            notified = []
+            for payload, notify, seq in zip(message["vehicles"], message["notify"], message["seqs"]):
+                vehicle = self._vehicle(payload)
+                store.add(vehicle, seq)
+                if not vehicle.get("repost_of"):
+                    market.record(vehicle)
+                if notify:
+                    notified.append(vehicle)
+            if notified:
+                await broadcast_new_vehicles(notified)
+                now = clock.now()
+                for vehicle in notified:
+                    TIME_TO_NOTIFY.observe((now - vehicle["published_at"]).total_seconds())
+        elif kind == "price_change":
+            await self._apply_price_change(message)
+        elif kind == "reply":
+            future = self.pending.get(message.get("id"))
+            if future is not None and not future.done():
+                future.set_result(message)
+        elif kind == "snapshot":
+            for payload, seq in zip(message["vehicles"], message["seqs"]):
+                vehicle = self._vehicle(payload)
+                store.add(vehicle, seq)
+                if not vehicle.get("repost_of"):
+                    market.record(vehicle)
+        elif kind == "snapshot_history":
+            for vehicle_id, values in message["series"].items():
+                price_history.series[vehicle_id] = array("i", values)
+        elif kind == "snapshot_scoring":
+            # Véhicules du snapshot déjà scorés par le process d'ingestion
+            scoring.model = ScoringModel(message["model"])
+        elif kind == "rescore":
+            await scoring.rescore(ScoringModel(message["model"]))
+        elif kind == "snapshot_end":
+            self.synced = True
+            logger.info(f"🚌 Réplica synchronisé: {len(store)} véhicules")
+    
+    async def _apply_price_change(self, message):
+        vehicle_id = message["vehicle_id"]
+        old_price, new_price = message["old_price"], message["new_price"]
+        if message.get("carry_from"):
+            price_history.carry(message["carry_from"], vehicle_id)
+        stored = store.get(vehicle_id) or store.get(message.get("carry_from")) or {}
+        reference = {"id": vehicle_id, "published_at": stored.get("published_at"), "price": old_price}
+        price_history.record(reference, new_price, datetime.fromisoformat(message["at"]))
+        vehicle = store.update_price(vehicle_id, new_price)
+        if vehicle is not None and message.get("notify"):
+            await broadcast_price_drop(vehicle, old_price)
+    
+    def to_dict(self):
+        return {
+            "socket": self.path,
+            "connected": self.writer is not None,
+            "synced": self.synced,
+            "events": self.events,
+            "connections": self.connections,
+        }
+
+bus_server = EventBus(BUS_SOCKET)
+bus_client = BusClient(BUS_SOCKET)
+
+# Commandes exécutées par le process d'ingestion pour le compte des workers
+BUS_COMMANDS = {
+    "root": lambda params: root(),
+    "stats": lambda params: get_stats(),
+    "searches.list": lambda params: list_searches(),
+    "searches.create": lambda params: create_search(SearchRequest(**params)),
+    "searches.delete": lambda params: delete_search(params["search_id"]),
+    "alerts.list": lambda params: list_alerts(),
+    "alerts.create": lambda params: create_alert(AlertRequest(**params)),
+    "alerts.delete": lambda params: delete_alert(params["rule_id"]),
+    "alerts.outbox": lambda params: get_outbox(),
+    "scoring.get": lambda params: get_scoring(),
+    "scoring.rescore": lambda params: rescore_vehicles(params.get("model")),
+    "ingest.commit": lambda params: commit_ingest(params["ads"]),
+}
 
 # ============ FASTAPI APP ============
 
@@ -729,9 +3996,32 @@ async def lifespan(app: FastAPI):
     if USE_PROXIES:
         logger.info(f"🌐 Proxies: {len(PROXY_LIST)} configurés")
     
-    task = asyncio.create_task(background_monitor())
+    if ROLE == "api":
+        # Worker sans état: pas de scraper, réplica alimenté par le bus
+        logger.info(f"🧩 Worker API {os.getpid()} (bus: {BUS_SOCKET})")
+        task = asyncio.create_task(bus_client.run())
+    else:
+        if REPLAY_FILE:
+            setup_replay(REPLAY_FILE)
+        else:
+            scheduler.load()
+            scoring.load()
+            alerts.load()
+            outbox.load()
+            await outbox.start()
+            await archive.start()
+        if ROLE == "ingest":
+            await bus_server.start()
+        task = asyncio.create_task(background_monitor())
+    watchdog.start()
     yield
+    watchdog.stop()
+    await bus_server.stop()
     scraper.running = False
+    task.cancel()
+    await pipeline.stop()
+    await outbox.stop()
+    await archive.stop()
     await scraper.close()
     logger.info("🛑 API arrêtée")
 
@@ -742,6 +4032,7 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+app.add_middleware(MetricsMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -769,89 +4060,123 @@ async def websocket_endpoint(websocket: WebSocket):
 # ============ MONITORING ============
 
 async def background_monitor():
-    """Monitoring avec système anti-ban"""
+    """Monitoring avec système anti-ban (une boucle pour toutes les recherches)"""
     scraper.running = True
     logger.info(f"⏱️ Intervalle: {SCRAPE_INTERVAL_SECONDS}s")
+    logger.info(f"🚦 Budget global: {GLOBAL_REQUESTS_PER_MINUTE} req/min, {GLOBAL_REQUESTS_PER_HOUR} req/h")
     
     await scraper.setup()
-    
-    # Scan initial
-    logger.info("🔍 Scan initial (mode anti-ban)...")
-    try:
-        initial_ads = await scraper.scrape_all_pages()
-        
-        logger.info(f"\n📋 ANNONCES DÉTECTÉES:")
-        for i, ad in enumerate(initial_ads[:10]):
-            logger.info(f"  {i+1}. {ad['title'][:60]} - {ad['price']}€ - {ad['location'][:30]}")
-            scraper.seen_ads.add(ad['id'])
-            database["vehicles"].insert(0, ad)
-        
-        if len(initial_ads) > 10:
-            logger.info(f"  ... et {len(initial_ads)-10} autres")
-        
-        logger.info(f"\n✅ {len(initial_ads)} annonces chargées\n")
-    except Exception as e:
-        logger.error(f"❌ Erreur scan initial: {str(e)}")
+    pipeline.start()
     
     scan_count = 0
     
     logger.info(f"✅ Monitoring actif (anti-ban)!\n")
     
     while scraper.running:
+        search = scheduler.next_search()
+        if not search:
+            await clock.sleep(SCRAPE_INTERVAL_SECONDS)
+            continue
+        
+        # Attendre l'échéance de la recherche la plus en retard
+        wait = search.next_due - clock.monotonic()
+        if wait > 0:
+            logger.info(f"⏳ Pause {wait:.1f}s...\n")
+            await clock.sleep(wait)
+            continue
+        
         scan_count += 1
+        label = ", ".join(sorted(search.names)) or search.id
         
-        logger.info(f"🔍 Scan #{scan_count} (délai adaptatif: {scraper.adaptive_delay:.1f}s)...")
+        logger.info(f"🔍 Scan #{scan_count} [{label}] (délai adaptatif: {scraper.adaptive_delay:.1f}s)...")
         
         try:
-            ads = await scraper.scrape_all_pages()
-            
-            new_ads = [ad for ad in ads if ad['id'] not in scraper.seen_ads]
-            
-            if new_ads:
-                logger.info(f"\n🆕 {len(new_ads)} NOUVELLE(S) ANNONCE(S)!")
-                scraper.total_new_ads += len(new_ads)
-                
-                for ad in new_ads:
-                    scraper.seen_ads.add(ad['id'])
-                    database["vehicles"].insert(0, ad)
-                    logger.info(f"   📌 {ad['title'][:50]}... - {ad['price']}€ - {ad['location']}")
-                    await broadcast_new_vehicle(ad)
-                
-                if len(database["vehicles"]) > MAX_VEHICLES_IN_MEMORY:
-                    database["vehicles"] = database["vehicles"][:MAX_VEHICLES_IN_MEMORY]
-            else:
-                logger.info(f"✓ Aucune nouvelle annonce")
+            await scheduler.scan(search, pipeline)
             
             # Stats tous les 3 scans
             if scan_count % 3 == 0:
-                uptime = (datetime.now() - scraper.session_created_at).total_seconds() / 60
-                success_rate = sum(scraper.success_rate[-10:]) / min(len(scraper.success_rate), 10) if scraper.success_rate else 0
+                uptime = (clock.now() - scraper.session_created_at).total_seconds() / 60
+                success_rate = scraper.recent_success_rate(10)
                 
                 logger.info(f"\n📊 STATS:")
                 logger.info(f"   • Nouvelles: {scraper.total_new_ads}")
-                logger.info(f"   • Total DB: {len(database['vehicles'])}")
+                logger.info(f"   • Total DB: {len(store)}")
                 logger.info(f"   • IDs vus: {len(scraper.seen_ads)}")
+                logger.info(f"   • Recherches: {len(scheduler.searches)}")
+                logger.info(f"   • Budget horaire restant: {scheduler.limiter.budget_remaining()}")
                 logger.info(f"   • Sessions: {scraper.total_sessions}")
                 logger.info(f"   • Taux succès: {success_rate:.1%}")
                 logger.info(f"   • Délai adaptatif: {scraper.adaptive_delay:.1f}s")
+                logger.info(f"   • Files pipeline: {pipeline.depths()}")
                 logger.info(f"   • Uptime session: {uptime:.1f}min\n")
             
         except Exception as e:
             logger.error(f"❌ Erreur: {str(e)[:100]}")
         
-        # Délai avec variation aléatoire
-        pause_time = SCRAPE_INTERVAL_SECONDS + random.uniform(-2, 3)
-        logger.info(f"⏳ Pause {pause_time:.1f}s...\n")
-        await asyncio.sleep(pause_time)
+        if scraper.replay and scraper.replay.exhausted:
+            logger.info("⏹️ Rejeu terminé")
+            scraper.running = False
+    
+    # Laisser le pipeline traiter les pages déjà récupérées
+    await pipeline.drain()
+
+# ============ REJEU ============
+
+def setup_replay(path: str) -> ReplaySource:
+    """Remplace le réseau par une archive et bascule sur l'horloge virtuelle"""
+    global clock
+    source = ReplaySource(path)
+    clock = SimulatedClock(source.start_time())
+    scheduler.limiter.reset()
+    scraper.replay = source
+    for scan in source.scans:
+        recorded = scan["search"]
+        for name in recorded.get("names") or [""]:
+            scheduler.add(recorded["params"], name, recorded.get("pages", 3), recorded.get("interval", SCRAPE_INTERVAL_SECONDS))
+    logger.info(f"⏪ Rejeu: {len(source.scans)} scans, {source.total_pages} pages ({path})")
+    return source
+
+async def run_replay(path: str):
+    """Rejoue une archive sans serveur et affiche débit et latences"""
+    source = setup_replay(path)
+    virtual_start = clock.monotonic()
+    wall_start = time.perf_counter()
+    await background_monitor()
+    wall = time.perf_counter() - wall_start
+    virtual = clock.monotonic() - virtual_start
+    
+    parse_count = sum(sum(series[:-1]) for series in PARSE_LATENCY.series.values())
+    report = {
+        "scans": len(source.scans),
+        "pages": source.served,
+        "vehicles": len(store),
+        "new_ads": scraper.total_new_ads,
+        "virtual_seconds": round(virtual, 1),
+        "wall_seconds": round(wall, 2),
+        "speedup": round(virtual / wall, 1) if wall else None,
+        "pages_per_second": round(source.served / wall, 1) if wall else None,
+        "parse_p50_s": PARSE_LATENCY.quantile(0.5),
+        "parse_p99_s": PARSE_LATENCY.quantile(0.99),
+        "pages_parsed": parse_count,
+        "time_to_notify_p50_s": TIME_TO_NOTIFY.quantile(0.5),
+        "time_to_notify_p99_s": TIME_TO_NOTIFY.quantile(0.99),
+    }
+    print(json.dumps(report, indent=2))
+    return report
 
 # ============ ROUTES API ============
 
 @app.get("/")
 async def root():
     """Informations API"""
+    if ROLE == "api":
+        info = await bus_client.call("root")
+        info.update(vehicles_count=len(store), websocket_clients=len(websocket_clients), worker=os.getpid())
+        return info
+    
     uptime = None
     if scraper.session_created_at:
-        uptime = (datetime.now() - scraper.session_created_at).total_seconds()
+        uptime = (clock.now() - scraper.session_created_at).total_seconds()
     
     success_rate = sum(scraper.success_rate) / len(scraper.success_rate) if scraper.success_rate else 0
     
@@ -859,7 +4184,7 @@ async def root():
         "name": "AutoTrack API - Anti-Ban",
         "version": "9.0",
         "status": "running",
-        "vehicles_count": len(database["vehicles"]),
+        "vehicles_count": len(store),
         "unique_ads_seen": len(scraper.seen_ads),
         "websocket_clients": len(websocket_clients),
         "stats": {
@@ -885,26 +4210,25 @@ async def get_vehicles(
     sort: str = "recent"
 ):
     """Récupère les véhicules avec filtres"""
-    vehicles = database["vehicles"].copy()
-    
-    if brand:
-        vehicles = [v for v in vehicles if v.get("brand") and v.get("brand").lower() == brand.lower()]
-    if location:
-        vehicles = [v for v in vehicles if v.get("location") and location.lower() in v.get("location", "").lower()]
-    if min_price:
-        vehicles = [v for v in vehicles if v.get("price", 0) >= min_price]
-    if max_price:
-        vehicles = [v for v in vehicles if v.get("price", 0) <= max_price]
-    
-    if sort == "price_asc":
-        vehicles.sort(key=lambda x: x.get("price", 0))
-    elif sort == "price_desc":
-        vehicles.sort(key=lambda x: x.get("price", 999999), reverse=True)
-    
-    total = len(vehicles)
     start = (page - 1) * limit
     end = start + limit
-    paginated = vehicles[start:end]
+    
+    if sort in ("price_asc", "price_desc"):
+        vehicles = list(store.query(brand, location, min_price, max_price))
+        if sort == "price_asc":
+            vehicles.sort(key=lambda x: x.get("price", 0))
+        else:
+            vehicles.sort(key=lambda x: x.get("price", 999999), reverse=True)
+        total = len(vehicles)
+        paginated = vehicles[start:end]
+    else:
+        # Ordre récent: un seul passage, seule la page demandée est copiée
+        total = 0
+        paginated = []
+        for v in store.query(brand, location, min_price, max_price):
+            if start <= total < end:
+                paginated.append(v)
+            total += 1
     
     return {
         "total": total,
@@ -913,17 +4237,224 @@ async def get_vehicles(
         "vehicles": paginated,
     }
 
+@app.get("/api/vehicles/{vehicle_id}/history")
+async def get_vehicle_history(vehicle_id: str):
+    """Historique des prix d'une annonce"""
+    vehicle = store.get(vehicle_id)
+    points = price_history.points(vehicle_id)
+    if vehicle is None and not points:
+        raise HTTPException(status_code=404, detail="Annonce introuvable")
+    if not points and vehicle is not None:
+        # Prix jamais modifié: un seul point, le prix de publication
+        published_at = vehicle.get("published_at")
+        points = [(published_at, vehicle.get("price"))]
+    first_price, last_price = points[0][1], points[-1][1]
+    return {
+        "vehicle_id": vehicle_id,
+        "title": vehicle.get("title") if vehicle else None,
+        "repost_of": vehicle.get("repost_of") if vehicle else None,
+        "current_price": last_price,
+        "initial_price": first_price,
+        "change_pct": round((last_price - first_price) / first_price * 100, 1) if first_price else None,
+        "history": [
+            {"at": at.isoformat() if isinstance(at, datetime) else at, "price": price}
+            for at, price in points
+        ],
+    }
+
+# ============ EXPORT ============
+
+EXPORT_COLUMNS = [
+    "seq", "id", "title", "brand", "model", "price", "year", "mileage", "fuel", "gearbox",
+    "location", "is_pro", "score", "market_price", "below_market_pct", "repost_of", "url", "published_at",
+]
+
+def export_row(seq, vehicle):
+    row = vehicle_payload(vehicle)
+    row["seq"] = seq
+    return row
+
+def export_formatter(fmt: str, columns=EXPORT_COLUMNS):
+    """(en-tête, ligne -> texte) du format d'export, CSV sans construire le fichier en mémoire"""
+    if fmt != "csv":
+        return "", lambda row: json.dumps(row, ensure_ascii=False) + "\n"
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    header = buffer.getvalue()
+    
+    def line(row):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(row)
+        return buffer.getvalue()
+    
+    return header, line
+
+async def export_stream(rows, fmt: str, compress: bool, columns=EXPORT_COLUMNS):
+    """Flux d'octets par blocs de EXPORT_CHUNK_ROWS lignes, gzip à la volée
+    
+    `rows` peut être un itérable asynchrone (archive: blocs décodés hors de la boucle).
+    """
+    header, line = export_formatter(fmt, columns)
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+    chunk = [header] if header else []
+    
+    def encode(final=False):
+        data = "".join(chunk).encode("utf-8")
+        chunk.clear()
+        if compressor:
+            data = compressor.compress(data) + (compressor.flush() if final else b"")
+        return data
+    
+    if hasattr(rows, "__aiter__"):
+        async for row in rows:
+            chunk.append(line(row))
+            if len(chunk) >= EXPORT_CHUNK_ROWS:
+                data = encode()
+                if data:
+                    yield data
+    else:
+        for row in rows:
+            chunk.append(line(row))
+            if len(chunk) >= EXPORT_CHUNK_ROWS:
+                data = encode()
+                if data:
+                    yield data
+                # Rendre la main à la boucle (scraping, autres requêtes)
+                await asyncio.sleep(0)
+    data = encode(final=True)
+    if data:
+        yield data
+
+@app.get("/api/export")
+async def export_vehicles(
+    format: str = "ndjson",
+    brand: Optional[str] = None,
+    location: Optional[str] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    cursor: int = -1,
+    compress: bool = Query(False, alias="gzip"),
+):
+    """Export complet en flux (NDJSON ou CSV), du plus ancien au plus récent
+    
+    Chaque ligne porte son `seq`: pour reprendre un export interrompu, repasser
+    la dernière valeur reçue dans `cursor`. L'export s'arrête aux annonces
+    présentes au début de la requête (X-Export-Until).
+    
+    Multi-process: les réplicas stockent chaque annonce à la séquence du process
+    d'ingestion (transmise par le bus), un curseur reste donc valable d'un worker
+    à l'autre et après une resynchronisation; pendant celle-ci l'export répond 503.
+    """
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Format invalide (ndjson ou csv)")
+    if ROLE == "api" and not bus_client.synced:
+        raise HTTPException(status_code=503, detail="Réplica en cours de synchronisation, réessayer")
+    until = store.next_seq
+    rows = (
+        export_row(seq, v)
+        for seq, v in store.scan(cursor, until, brand, location, min_price, max_price)
+    )
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    headers = {
+        "X-Export-Until": str(until - 1),
+        "Content-Disposition": f'attachment; filename="autotrack_export.{format}"',
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export_stream(rows, format, compress), media_type=media_type, headers=headers)
+
+# ============ ARCHIVE ============
+
+ARCHIVE_COLUMNS = EXPORT_COLUMNS[1:] + ["archived_at"]
+
+@app.get("/api/archive")
+async def query_archive(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    brand: Optional[str] = None,
+    location: Optional[str] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+    min_year: Optional[int] = None,
+    max_year: Optional[int] = None,
+    limit: Optional[int] = Query(None, ge=1),
+    format: str = "ndjson",
+    compress: bool = Query(False, alias="gzip"),
+):
+    """Annonces archivées (publiées entre `since` et `until`), en flux NDJSON ou CSV
+    
+    Les segments puis les blocs dont les min/max (date, prix, année), marques
+    ou départements excluent les filtres ne sont pas lus (compteurs dans les
+    en-têtes X-Archive-*). Les annonces ingérées depuis le dernier flush
+    (AUTOTRACK_ARCHIVE_FLUSH) n'y figurent pas encore.
+    """
+    if not archive.path:
+        raise HTTPException(status_code=404, detail="Archive désactivée (AUTOTRACK_ARCHIVE_DIR)")
+    if format not in ("ndjson", "csv"):
+        raise HTTPException(status_code=400, detail="Format invalide (ndjson ou csv)")
+    criteria = ArchiveFilter(since, until, brand, location, min_price, max_price, min_year, max_year)
+    blocks, plan = archive.plan(criteria)
+    rows = archive.read(blocks, criteria, limit)
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    headers = {
+        "X-Archive-Segments": str(plan["segments"]),
+        "X-Archive-Pruned-Segments": str(plan["pruned_segments"]),
+        "X-Archive-Blocks-Scanned": str(plan["blocks_scanned"]),
+        "X-Archive-Pruned-Blocks": str(plan["pruned_blocks"]),
+        "Content-Disposition": f'attachment; filename="autotrack_archive.{format}"',
+    }
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(export_stream(rows, format, compress, ARCHIVE_COLUMNS),
+                             media_type=media_type, headers=headers)
+
+@app.get("/api/archive/segments")
+async def list_archive_segments():
+    """Segments de l'archive avec leurs min/max"""
+    archive.refresh()
+    return {
+        **archive.to_dict(),
+        "segments": [segment.to_dict() for segment in archive.segments.values()],
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """Métriques au format Prometheus"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/facets")
+async def get_facets(
+    brand: Optional[str] = None,
+    location: Optional[str] = None,
+    min_price: Optional[int] = None,
+    max_price: Optional[int] = None,
+):
+    """Compteurs par marque, carburant, boîte, année, tranche de prix et département"""
+    return store.facet_counts(brand, location, min_price, max_price)
+
 @app.get("/api/stats")
 async def get_stats():
     """Statistiques détaillées"""
+    if ROLE == "api":
+        stats = await bus_client.call("stats")
+        stats["worker"] = {
+            "pid": os.getpid(),
+            "replica_vehicles": len(store),
+            "websocket_clients": len(websocket_clients),
+            "bus": bus_client.to_dict(),
+        }
+        return stats
+    
     uptime = None
     if scraper.session_created_at:
-        uptime = (datetime.now() - scraper.session_created_at).total_seconds()
+        uptime = (clock.now() - scraper.session_created_at).total_seconds()
     
     success_rate = sum(scraper.success_rate) / len(scraper.success_rate) if scraper.success_rate else 0
     
     return {
-        "total_vehicles": len(database["vehicles"]),
+        "total_vehicles": len(store),
         "unique_ads_seen": len(scraper.seen_ads),
         "scraper_running": scraper.running,
         "requests": {
@@ -939,6 +4470,22 @@ async def get_stats():
         },
         "discoveries": {
             "total_new_ads": scraper.total_new_ads,
+            "reposts": reposts.reposts_found,
+            "price_changes": price_history.changes,
+        },
+        "price_history": {
+            "tracked_ads": len(price_history.series),
+            "memory_kb": round(price_history.nbytes() / 1024, 1),
+        },
+        "archive": archive.to_dict(),
+        "bus": bus_server.to_dict() if ROLE == "ingest" else None,
+        "pipeline": {
+            "queue_depths": pipeline.depths(),
+            "processed": dict(pipeline.processed),
+        },
+        "searches": {
+            "total": len(scheduler.searches),
+            "hourly_budget_remaining": scheduler.limiter.budget_remaining(),
         },
         "anti_ban": {
             "adaptive_delay": f"{scraper.adaptive_delay:.1f}s",
@@ -947,6 +4494,457 @@ async def get_stats():
         }
     }
 
-if __name__ == "__main__":
+@app.get("/api/market")
+async def get_market(
+    brand: Optional[str] = None,
+    model: Optional[str] = None,
+    year: Optional[int] = None,
+    mileage: Optional[int] = None,
+    limit: int = 50,
+):
+    """Prix du marché (quantiles) pour un segment, ou segments les plus fournis"""
+    if brand:
+        summary = market.query(brand, model, year, mileage)
+        if not summary:
+            raise HTTPException(status_code=404, detail="Pas assez de données pour ce segment")
+        return summary
+    
+    # Vue d'ensemble: segments par marque/modèle
+    segments = [
+        (key, sketch) for key, sketch in market.sketches.items()
+        if key[2] is None and key[3] is None and sketch.count >= MARKET_MIN_SAMPLES
+    ]
+    segments.sort(key=lambda item: item[1].count, reverse=True)
+    return {
+        "total_observed": market.total_observed,
+        "sketches": len(market.sketches),
+        "segments": [market.summary(key, sketch) for key, sketch in segments[:limit]],
+    }
+
+# ============ ROUTES ADMIN ============
+
+@app.get("/api/admin/loop")
+async def get_loop_health():
+    """Retard de la boucle asyncio (percentiles) et derniers blocages capturés"""
+    return {
+        "running": watchdog.running,
+        "interval_ms": watchdog.interval * 1000,
+        "threshold_ms": watchdog.threshold * 1000,
+        "lag": watchdog.percentiles(),
+        "offenders": list(reversed(watchdog.offenders)),
+    }
+
+@app.get("/api/admin/profile")
+async def profile_loop(seconds: float = 5, top: int = 30):
+    """Capture un profil par échantillonnage de la boucle pendant N secondes"""
+    if not watchdog.loop_thread_id:
+        raise HTTPException(status_code=503, detail="Watchdog inactif")
+    seconds = min(max(seconds, 0.1), PROFILE_MAX_SECONDS)
+    try:
+        return await watchdog.profile(seconds, top=top)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.get("/api/admin/scoring")
+async def get_scoring():
+    """Modèle de scoring courant et dernier rescoring"""
+    if ROLE == "api":
+        return await bus_client.call("scoring.get")
+    return scoring.to_dict()
+
+@app.post("/api/admin/scoring")
+async def rescore_vehicles(model: Optional[dict] = Body(None)):
+    """Remplace le modèle (champs absents = défaut) puis rescore tout le store
+    
+    Sans corps: rescoring avec le modèle courant.
+    """
+    if ROLE == "api":
+        return await bus_client.call("scoring.rescore", {"model": model})
+    try:
+        new_model = ScoringModel(model) if model is not None else scoring.model
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    result = await scoring.rescore(new_model)
+    scoring.save()
+    # Les workers API rescorent leur réplica avec le même modèle
+    bus_server.publish({"type": "rescore", "model": new_model.to_dict()})
+    return {**result, "model": new_model.to_dict()}
+
+# ============ MÉMOIRE ============
+
+def process_rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def memory_by_structure() -> dict:
+    """Octets estimés par structure (échantillonnage pour les grandes collections)
+    
+    Files du pipeline non estimées (internes d'asyncio): seules leurs profondeurs
+    sont rapportées. Côté WebSocket, seuls les broadcasts pas encore remis à
+    send_text sont comptés (tampons d'uvicorn non inclus).
+    """
+    return {
+        "vehicles": store.bytes,
+        "store_columns": store.columns.memory(),
+        "seen_ads": sampled_size(scraper.seen_ads),
+        "search_seen_ads": sum(sampled_size(search.seen_ads) for search in scheduler.searches.values()),
+        "price_history": price_history.nbytes(),
+        "repost_index": sampled_size(reposts.fingerprints) + sum(sampled_size(table) for table in reposts.tables)
+                        + sampled_size(reposts.images),
+        "market_sketches": sampled_size(market.sketches),
+        "websocket_pending": sum(websocket_pending.values()),
+        "alert_outbox": sampled_size(outbox.unfinished),
+        "loop_watchdog": deep_size(watchdog.lags) + deep_size(watchdog.offenders),
+    }
+
+class MemoryTracer:
+    """tracemalloc à la demande: start, snapshots (avec diff du précédent), stop"""
+    
+    def __init__(self):
+        self.previous = None
+    
+    def start(self, frames: int = 1):
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        self.previous = None
+        return {"tracing": True}
+    
+    def stop(self):
+        tracemalloc.stop()
+        self.previous = None
+        return {"tracing": False}
+    
+    def snapshot(self, top: int = 20):
+        if not tracemalloc.is_tracing():
+            raise RuntimeError("tracemalloc inactif (?tracemalloc=start d'abord)")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        current, peak = tracemalloc.get_traced_memory()
+        result = {
+            "traced_mb": round(current / 1024 / 1024, 2),
+            "peak_mb": round(peak / 1024 / 1024, 2),
+            "top": [
+                {"where": str(stat.traceback), "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:top]
+            ],
+        }
+        if self.previous is not None:
+            result["growth_since_previous"] = [
+                {"where": str(stat.traceback), "size_diff_kb": round(stat.size_diff / 1024, 1),
+                 "count_diff": stat.count_diff}
+                for stat in snapshot.compare_to(self.previous, "lineno")[:top]
+            ]
+        self.previous = snapshot
+        return result
+
+memory_tracer = MemoryTracer()
+
+@app.get("/api/admin/memory")
+async def get_memory(tracemalloc_action: Optional[str] = Query(None, alias="tracemalloc"), top: int = 20):
+    """Mémoire par structure, budget du store et tracemalloc à la demande
+    
+    ?tracemalloc=start active le traçage, ?tracemalloc=snapshot renvoie les
+    plus grosses allocations (et la croissance depuis le snapshot précédent),
+    ?tracemalloc=stop le coupe. Valeurs propres à ce process.
+    """
+    structures = memory_by_structure()
+    mb = lambda value: round(value / 1024 / 1024, 2) if value is not None else None
+    report = {
+        "pid": os.getpid(),
+        "rss_mb": mb(process_rss_bytes()),
+        "store": {
+            "vehicles": len(store),
+            "max_vehicles": store.max_size,
+            "budget_mb": mb(store.max_bytes) if store.max_bytes else None,
+            "used_mb": mb(store.bytes),
+            "avg_vehicle_bytes": round(store.bytes / len(store)) if len(store) else None,
+            "evicted_for_budget": store.evicted_for_budget,
+        },
+        "structures_mb": {name: mb(value) for name, value in structures.items()},
+        "tracked_total_mb": mb(sum(structures.values())),
+        "caches": {
+            "simhash_tokens": _token_bits.cache_info().currsize,
+            "market_sketches": len(market.sketches),
+            "websocket_clients": len(websocket_clients),
+        },
+        "pipeline_depths": pipeline.depths(),
+        "websocket_buffers": {
+            "clients_behind": len(websocket_pending),
+            "pending_kb": round(sum(websocket_pending.values()) / 1024, 1),
+            "max_client_pending_kb": round(max(websocket_pending.values(), default=0) / 1024, 1),
+        },
+    }
+    try:
+        if tracemalloc_action == "start":
+            report["tracemalloc"] = memory_tracer.start()
+        elif tracemalloc_action == "stop":
+            report["tracemalloc"] = memory_tracer.stop()
+        elif tracemalloc_action == "snapshot":
+            report["tracemalloc"] = await asyncio.to_thread(memory_tracer.snapshot, top)
+        elif tracemalloc_action is not None:
+            raise HTTPException(status_code=400, detail="tracemalloc: start, snapshot ou stop")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return report
+
+# ============ ROUTES RECHERCHES ============
+
+class SearchRequest(BaseModel):
+    name: str = ""
+    params: dict = {}
+    pages: int = 3
+    interval: float = SCRAPE_INTERVAL_SECONDS
+
+@app.get("/api/searches")
+async def list_searches():
+    """Recherches surveillées, métriques et budget global"""
+    if ROLE == "api":
+        return await bus_client.call("searches.list")
+    return scheduler.to_dict()
+
+@app.post("/api/searches")
+async def create_search(request: SearchRequest):
+    """Ajoute une recherche (fusionnée si la requête normalisée existe déjà)"""
+    if ROLE == "api":
+        return await bus_client.call("searches.create", request.model_dump())
+    try:
+        search = scheduler.add(request.params, request.name, request.pages, max(request.interval, SCRAPE_INTERVAL_SECONDS))
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Recherche invalide: {e}")
+    scheduler.save()
+    return search.to_dict()
+
+@app.delete("/api/searches/{search_id}")
+async def delete_search(search_id: str):
+    """Supprime une recherche"""
+    if ROLE == "api":
+        return await bus_client.call("searches.delete", {"search_id": search_id})
+    if not scheduler.remove(search_id):
+        raise HTTPException(status_code=404, detail="Recherche introuvable")
+    scheduler.save()
+    return {"deleted": search_id}
+
+# ============ ROUTES ALERTES ============
+
+class AlertRequest(BaseModel):
+    webhook_url: str
+    name: str = ""
+    brand: Optional[str] = None
+    model: Optional[str] = None
+    min_price: Optional[int] = None
+    max_price: Optional[int] = None
+    min_mileage: Optional[int] = None
+    max_mileage: Optional[int] = None
+    min_year: Optional[int] = None
+    max_year: Optional[int] = None
+    city: Optional[str] = None
+    radius_km: Optional[float] = None
+    min_score: Optional[float] = None
+
+@app.get("/api/alerts")
+async def list_alerts():
+    """Règles d'alerte et nombre de correspondances"""
+    if ROLE == "api":
+        return await bus_client.call("alerts.list")
+    return alerts.to_dict()
+
+@app.post("/api/alerts")
+async def create_alert(request: AlertRequest):
+    """Crée une règle: les annonces correspondantes sont POSTées sur webhook_url"""
+    if ROLE == "api":
+        return await bus_client.call("alerts.create", request.model_dump())
+    try:
+        rule = alerts.add(AlertRule(**request.model_dump()))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Règle invalide: {e}")
+    alerts.save()
+    return rule.to_dict()
+
+@app.delete("/api/alerts/{rule_id}")
+async def delete_alert(rule_id: str):
+    """Supprime une règle (les alertes déjà en file restent livrées)"""
+    if ROLE == "api":
+        return await bus_client.call("alerts.delete", {"rule_id": rule_id})
+    if not alerts.remove(rule_id):
+        raise HTTPException(status_code=404, detail="Règle introuvable")
+    alerts.save()
+    return {"deleted": rule_id}
+
+@app.get("/api/alerts/outbox")
+async def get_outbox():
+    """État des livraisons par endpoint (file, backoff, lettres mortes)"""
+    if ROLE == "api":
+        return await bus_client.call("alerts.outbox")
+    return outbox.to_dict()
+
+# ============ INGESTION EXTERNE ============
+
+def parse_ingest_lines(lines, fetched_at):
+    """Lignes NDJSON -> (annonces, erreurs), avec l'extraction du scraper (thread)"""
+    ads, errors = [], []
+    for number, line in lines:
+        try:
+            record = json.loads(line)
+            if not isinstance(record, dict):
+                raise ValueError("objet JSON attendu")
+            if "html" in record:
+                page_at = fetched_at
+                if record.get("fetched_at"):
+                    page_at = local_datetime(record["fetched_at"])
+                page_ads = scraper.parse_page(str(record["html"]), page_at)
+                if not page_ads:
+                    raise ValueError("aucune annonce extraite du HTML")
+                ads.extend(page_ads)
+            else:
+                ads.append(scraper.parse_record(record, fetched_at))
+        except ValueError as e:
+            errors.append({"line": number, "error": str(e)[:200]})
+    return ads, errors
+
+async def read_ingest_lines(request: Request):
+    """(numéro, ligne) non vides du corps NDJSON, au fil de la réception (gzip accepté)"""
+    decompressor = zlib.decompressobj(31) if request.headers.get("content-encoding") == "gzip" else None
+    buffer = b""
+    received = 0
+    number = 0
+    too_large = HTTPException(status_code=413, detail=f"Lot trop volumineux (max {INGEST_MAX_BYTES} octets)")
+    async for chunk in request.stream():
+        if decompressor:
+            # Décompression bornée au reste du budget: un corps très compressible
+            # (bombe gzip) est rejeté sans être décompressé en entier
+            data, chunk = chunk, b""
+            while data:
+                try:
+                    part = decompressor.decompress(data, INGEST_MAX_BYTES - received - len(chunk) + 1)
+                except zlib.error:
+                    raise HTTPException(status_code=400, detail="Corps gzip invalide")
+                chunk += part
+                if received + len(chunk) > INGEST_MAX_BYTES:
+                    raise too_large
+                data = decompressor.unconsumed_tail
+        received += len(chunk)
+        if received > INGEST_MAX_BYTES:
+            raise too_large
+        *lines, buffer = (buffer + chunk).split(b"\n")
+        for line in lines:
+            number += 1
+            if line.strip():
+                yield number, line
+        if len(buffer) > INGEST_MAX_LINE_BYTES:
+            raise HTTPException(status_code=413, detail=f"Ligne {number + 1} trop longue")
+    if buffer.strip():
+        yield number + 1, buffer
+
+async def commit_ingest(payloads: list) -> dict:
+    """Process d'ingestion: lot déjà parsé par un worker API (via le bus)"""
+    return await pipeline.ingest([BusClient._vehicle(payload) for payload in payloads])
+
+@app.post("/api/ingest")
+async def ingest_batch(request: Request, strict: bool = False):
+    """Lot d'annonces de collecteurs externes (NDJSON, Content-Encoding gzip accepté)
+    
+    Une ligne par annonce brute ({"title", "price", "url", "location", "text",
+    "images", "year", "mileage", ...}) ou par page de résultats ({"html",
+    "fetched_at"}). Parsé avec l'extraction du scraper au fil de la réception,
+    puis dédupliqué, stocké et diffusé en un seul lot. Les lignes invalides sont
+    ignorées et listées; `strict=true` rejette alors tout le lot.
+    """
+    fetched_at = clock.now()
+    ads, errors, chunk = [], [], []
+    lines = 0
+    
+    async def parse(chunk):
+        chunk_ads, chunk_errors = await asyncio.to_thread(parse_ingest_lines, chunk, fetched_at)
+        ads.extend(chunk_ads)
+        errors.extend(chunk_errors)
+        if len(ads) > INGEST_MAX_ADS:
+            raise HTTPException(status_code=413, detail=f"Trop d'annonces dans le lot (max {INGEST_MAX_ADS})")
+    
+    async for number, line in read_ingest_lines(request):
+        lines += 1
+        chunk.append((number, line))
+        if len(chunk) >= INGEST_PARSE_CHUNK:
+            await parse(chunk)
+            chunk = []
+    if chunk:
+        await parse(chunk)
+    
+    INGEST_ADS.inc("rejected", len(errors))
+    if strict and errors:
+        raise HTTPException(status_code=400, detail={
+            "message": f"{len(errors)} ligne(s) invalide(s), lot rejeté",
+            "errors": errors[:INGEST_MAX_ERRORS],
+        })
+    if not ads:
+        summary = {"new": 0, "duplicates": 0, "price_changes": 0, "price_drops": 0}
+    elif ROLE == "api":
+        summary = await bus_client.call("ingest.commit", {"ads": [vehicle_payload(ad) for ad in ads]})
+    else:
+        summary = await pipeline.ingest(ads)
+    return {
+        "lines": lines,
+        "parsed": len(ads),
+        "rejected": len(errors),
+        **summary,
+        "errors": errors[:INGEST_MAX_ERRORS],
+    }
+
+# ============ MULTI-PROCESS ============
+
+def run_cluster(workers: int, host: str, port: int):
+    """1 process d'ingestion + `workers` workers API uvicorn (même port, cœurs séparés)"""
+    import subprocess
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8001)
+    
+    here = os.path.dirname(os.path.abspath(__file__))
+    ingest = subprocess.Popen(
+        [sys.executable, os.path.join(here, "main.py"), "--role", "ingest"],
+        # Un seul process d'ingestion: AUTOTRACK_WORKERS n'est pas transmis
+        env={**os.environ, "AUTOTRACK_ROLE": "ingest", "AUTOTRACK_WORKERS": "1"},
+    )
+    logger.info(f"🧩 Process d'ingestion {ingest.pid} + {workers} workers API")
+    # Les workers uvicorn réimportent main.py: le rôle passe par l'environnement
+    os.environ["AUTOTRACK_ROLE"] = "api"
+    try:
+        uvicorn.run("main:app", host=host, port=port, workers=workers, app_dir=here)
+    finally:
+        ingest.terminate()
+        ingest.wait(timeout=10)
+
+def main(argv=None):
+    global ROLE
+    parser = argparse.ArgumentParser(description="AutoTrack API")
+    parser.add_argument("--replay", help="Rejoue une archive de scans (.jsonl.gz) sans serveur")
+    parser.add_argument("--role", choices=["all", "ingest", "api"], default=ROLE,
+                        help="all: process unique; ingest: scraper + bus; api: worker sans état")
+    parser.add_argument("--workers", type=int, default=API_WORKERS,
+                        help="> 1 (rôle all): process d'ingestion séparé + N workers API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8001)
+    args = parser.parse_args(argv)
+    
+    if args.replay:
+        asyncio.run(run_replay(args.replay))
+        return
+    import uvicorn
+    ROLE = args.role
+    if ROLE == "ingest":
+        # Le process d'ingestion garde une API complète, en local uniquement
+        uvicorn.run(app, host="127.0.0.1", port=INGEST_PORT)
+    elif ROLE == "api":
+        uvicorn.run(app, host=args.host, port=args.port)
+    elif args.workers > 1:
+        run_cluster(args.workers, args.host, args.port)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# Aucun fichier d'état (recherches, alertes, outbox, archive) pendant les tests
+os.environ.setdefault("AUTOTRACK_SEARCHES_FILE", "")
+os.environ.setdefault("AUTOTRACK_ALERTS_FILE", "")
+os.environ.setdefault("AUTOTRACK_OUTBOX_FILE", "")
+os.environ.setdefault("AUTOTRACK_SCORING_FILE", "")
+os.environ.setdefault("AUTOTRACK_ARCHIVE_DIR", "")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,168 @@
+import asyncio
+import json
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+START = datetime(2026, 10, 1, 8, 0)
+
+
+def vehicle(vehicle_id, **fields):
+    base = {
+        "id": vehicle_id, "title": f"Renault Clio {vehicle_id}", "brand": "Renault", "model": "Clio",
+        "price": 8000, "year": 2015, "mileage": 90000, "fuel": "diesel", "gearbox": "manuelle",
+        "location": "Paris (75011)", "is_pro": False, "score": 65.0, "market_price": None,
+        "below_market_pct": None, "repost_of": None, "url": f"https://www.leboncoin.fr/ad/voitures/{vehicle_id}.htm",
+        "published_at": START,
+    }
+    base.update(fields)
+    return base
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = main.SimulatedClock(START.timestamp())
+    monkeypatch.setattr(main, "clock", clock)
+    return clock
+
+
+def fill(path, clock, blocks):
+    """Un bloc par (heure d'archivage, véhicules)"""
+    archive = main.AdArchive(str(path), "hour")
+
+    async def run():
+        await archive.start()
+        for at, vehicles in blocks:
+            clock.current = at.timestamp()
+            for v in vehicles:
+                archive.append(v)
+            await archive.flush()
+        await archive.stop()
+
+    asyncio.run(run())
+    return archive
+
+
+async def collect(rows):
+    return [row async for row in rows]
+
+
+def query(path, **filters):
+    reader = main.AdArchive(str(path), "hour")
+    criteria = main.ArchiveFilter(**filters)
+    blocks, plan = reader.plan(criteria)
+    return asyncio.run(collect(reader.read(blocks, criteria))), plan
+
+
+def test_round_trip_keeps_values_and_unknowns(tmp_path, clock):
+    ads = [
+        vehicle("1", market_price=9000, below_market_pct=11.1, repost_of="lbc_0", is_pro=True),
+        vehicle("2", year=None, mileage=None, price=0, fuel=None, published_at=None),
+    ]
+    fill(tmp_path, clock, [(START, ads)])
+
+    rows, plan = query(tmp_path)
+    assert plan["blocks_scanned"] == 1
+    first, second = rows
+    assert first["id"] == "1" and first["title"] == "Renault Clio 1"
+    assert (first["price"], first["year"], first["mileage"]) == (8000, 2015, 90000)
+    assert (first["market_price"], first["below_market_pct"]) == (9000, 11.1)
+    assert first["is_pro"] is True and first["repost_of"] == "lbc_0"
+    assert first["published_at"] == START.isoformat()
+    assert first["archived_at"] == START.isoformat()
+    assert (second["price"], second["year"], second["mileage"], second["fuel"]) == (None, None, None, None)
+    assert second["published_at"] is None
+
+
+def test_segments_and_blocks_are_pruned_by_stats(tmp_path, clock):
+    fill(tmp_path, clock, [
+        (START, [vehicle("old", year=2005, price=3000)]),
+        (START.replace(hour=9), [vehicle("new", year=2020, price=15000)]),
+        (START.replace(hour=9, minute=30), [vehicle("peugeot", brand="Peugeot", location="Lyon (69003)", year=2009)]),
+        (START.replace(hour=10), [vehicle("recent", year=2021)]),
+    ])
+
+    rows, plan = query(tmp_path, max_year=2010)
+    assert [r["id"] for r in rows] == ["old", "peugeot"]
+    assert plan["pruned_segments"] == 1 and plan["pruned_blocks"] == 1
+    assert plan["blocks_scanned"] == 2
+
+    rows, plan = query(tmp_path, brand="peugeot")
+    assert [r["id"] for r in rows] == ["peugeot"]
+    assert plan["blocks_scanned"] == 1
+
+    rows, plan = query(tmp_path, location="69")
+    assert [r["id"] for r in rows] == ["peugeot"]
+    assert plan["blocks_scanned"] == 1
+
+    rows, _ = query(tmp_path, location="lyon")
+    assert [r["id"] for r in rows] == ["peugeot"]
+
+
+def test_unknown_values_never_match_a_bound(tmp_path, clock):
+    # Deux blocs avec une année inconnue: l'un élagué par ses min/max, l'autre non
+    fill(tmp_path, clock, [
+        (START, [vehicle("a", year=2020), vehicle("a-unknown", year=None)]),
+        (START.replace(hour=9), [vehicle("b", year=2008), vehicle("b-unknown", year=None)]),
+    ])
+
+    rows, plan = query(tmp_path, max_year=2010)
+    assert [r["id"] for r in rows] == ["b"]
+    assert plan["pruned_segments"] == 1
+
+    rows, _ = query(tmp_path, min_price=1, max_price=100000)
+    assert len(rows) == 4
+
+
+def test_time_range_filters_on_published_at(tmp_path, clock):
+    fill(tmp_path, clock, [
+        (START, [vehicle("early", published_at=START.replace(hour=7)), vehicle("late", published_at=START)]),
+    ])
+
+    rows, _ = query(tmp_path, since=START.replace(hour=7, minute=30))
+    assert [r["id"] for r in rows] == ["late"]
+    rows, plan = query(tmp_path, until=START.replace(hour=6))
+    assert rows == [] and plan["pruned_segments"] == 1
+
+
+def test_writer_restart_appends_to_existing_segment(tmp_path, clock):
+    fill(tmp_path, clock, [(START, [vehicle("1")])])
+    archive = fill(tmp_path, clock, [(START.replace(minute=10), [vehicle("2")])])
+
+    assert archive.rows() == 2
+    assert len(archive.segments) == 1
+    rows, _ = query(tmp_path)
+    assert [r["id"] for r in rows] == ["1", "2"]
+
+
+def test_limit_stops_reading_blocks(tmp_path, clock):
+    fill(tmp_path, clock, [
+        (START, [vehicle("1"), vehicle("2")]),
+        (START.replace(minute=10), [vehicle("3")]),
+    ])
+    reader = main.AdArchive(str(tmp_path), "hour")
+    criteria = main.ArchiveFilter()
+    blocks, _ = reader.plan(criteria)
+    rows = asyncio.run(collect(reader.read(blocks, criteria, limit=2)))
+    assert [r["id"] for r in rows] == ["1", "2"]
+
+
+def test_archive_route_streams_and_validates_limit(tmp_path, clock, monkeypatch):
+    fill(tmp_path, clock, [(START, [vehicle("1"), vehicle("2", brand="Peugeot")])])
+    monkeypatch.setattr(main, "archive", main.AdArchive(str(tmp_path), "hour"))
+    client = TestClient(main.app)
+
+    response = client.get("/api/archive", params={"format": "csv", "limit": 1})
+    assert response.status_code == 200
+    lines = response.text.splitlines()
+    assert lines[0].startswith("id,title") and len(lines) == 2
+
+    response = client.get("/api/archive", params={"brand": "peugeot"})
+    assert [json.loads(line)["id"] for line in response.text.splitlines()] == ["2"]
+    assert response.headers["X-Archive-Blocks-Scanned"] == "1"
+
+    assert client.get("/api/archive", params={"limit": 0}).status_code == 422
+    assert client.get("/api/archive", params={"limit": -1}).status_code == 422
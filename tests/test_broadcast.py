@@ -0,0 +1,42 @@
+import asyncio
+
+import main
+
+
+class Client:
+    def __init__(self, gate=None, fail=False):
+        self.gate = gate
+        self.fail = fail
+        self.received = []
+
+    async def send_text(self, message):
+        if self.gate:
+            await self.gate.wait()
+        if self.fail:
+            raise ConnectionError("fermé")
+        self.received.append(message)
+
+
+def test_pending_broadcast_bytes_per_client(monkeypatch):
+    gate = asyncio.Event()
+    slow, behind, broken = Client(gate), Client(), Client(fail=True)
+    monkeypatch.setattr(main, "websocket_clients", [slow, behind, broken])
+    monkeypatch.setattr(main, "websocket_pending", {})
+    message = '{"type": "new_vehicle", "prix": "9 000 €"}'
+    size = len(message.encode("utf-8"))
+
+    async def run():
+        first = asyncio.create_task(main.broadcast_message(message))
+        second = asyncio.create_task(main.broadcast_message(message))
+        await asyncio.sleep(0)
+        # Le client lent bloque les deux broadcasts: tout reste en attente
+        assert main.websocket_pending == {slow: 2 * size, behind: 2 * size, broken: 2 * size}
+        report = main.memory_by_structure()
+        assert report["websocket_pending"] == 6 * size
+        gate.set()
+        await asyncio.gather(first, second)
+
+    asyncio.run(run())
+    assert main.websocket_pending == {}
+    assert slow.received == behind.received == [message, message]
+    assert main.websocket_clients == [slow, behind]
@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+import pytest
+import uvicorn
+
+import main
+
+
+@pytest.fixture
+def launched(monkeypatch):
+    """Process et serveurs lancés, sans rien démarrer réellement"""
+    calls = {"popen": [], "uvicorn": []}
+
+    class Process:
+        pid = 1234
+
+        def __init__(self, args, env=None):
+            calls["popen"].append((args, env))
+
+        def terminate(self):
+            pass
+
+        def wait(self, timeout=None):
+            return 0
+
+    monkeypatch.setattr(subprocess, "Popen", Process)
+    monkeypatch.setattr(uvicorn, "run", lambda app, **kwargs: calls["uvicorn"].append((app, kwargs)))
+    monkeypatch.setattr(main, "ROLE", "all")
+    monkeypatch.setenv("AUTOTRACK_WORKERS", "4")
+    monkeypatch.setenv("AUTOTRACK_ROLE", "all")
+    return calls
+
+
+def test_cluster_starts_one_ingest_child_without_workers(launched):
+    main.main(["--workers", "4"])
+
+    [(args, env)] = launched["popen"]
+    assert args[0] == sys.executable and args[1].endswith("main.py")
+    assert args[2:] == ["--role", "ingest"]
+    assert env["AUTOTRACK_ROLE"] == "ingest"
+    assert env["AUTOTRACK_WORKERS"] == "1"
+    [(app, kwargs)] = launched["uvicorn"]
+    assert app == "main:app" and kwargs["workers"] == 4 and kwargs["port"] == 8001
+    assert os.environ["AUTOTRACK_ROLE"] == "api"
+
+
+def test_ingest_role_never_starts_a_cluster(launched):
+    # Enfant lancé par run_cluster, même si AUTOTRACK_WORKERS > 1 lui parvenait
+    main.main(["--role", "ingest", "--workers", "4"])
+
+    assert launched["popen"] == []
+    [(app, kwargs)] = launched["uvicorn"]
+    assert app is main.app
+    assert (kwargs["host"], kwargs["port"]) == ("127.0.0.1", main.INGEST_PORT)
+    assert main.ROLE == "ingest"
@@ -0,0 +1,208 @@
+import asyncio
+import gzip
+import json
+import time
+import zlib
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+def ad(ad_id, price=8000, **fields):
+    base = {
+        "id": ad_id, "title": "Renault Clio IV 1.5 dCi 90 Business", "brand": "Renault", "model": "Clio",
+        "price": price, "year": 2015, "mileage": 90000, "fuel": "diesel", "gearbox": "manuelle",
+        "location": "Paris (75011)", "is_pro": False, "url": f"https://www.leboncoin.fr/ad/voitures/{ad_id}.htm",
+        "published_at": datetime(2026, 10, 1, 8, 0), "images": [],
+    }
+    base.update(fields)
+    return base
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    """Store, marché, reposts et dédup vides pour chaque test"""
+    store = main.VehicleStore(max_size=1000)
+    reposts = main.RepostDetector()
+    store.evict_listeners.append(reposts.remove)
+    monkeypatch.setattr(main, "store", store)
+    monkeypatch.setattr(main, "market", main.MarketStats())
+    monkeypatch.setattr(main, "reposts", reposts)
+    monkeypatch.setattr(main, "price_history", main.PriceHistory())
+    monkeypatch.setattr(main.scraper, "seen_ads", set())
+
+
+def test_reposts_are_not_counted_in_the_market():
+    first = asyncio.run(main.pipeline.ingest([ad("lbc_1")]))
+    assert first["new"] == 1
+    assert main.market.total_observed == 1
+
+    asyncio.run(main.pipeline.ingest([ad("lbc_2", price=7900)]))
+    repost = main.store.get("lbc_2")
+    assert repost["repost_of"] == "lbc_1"
+    assert main.market.total_observed == 1
+    assert "market_price" in repost
+
+
+def test_replica_skips_reposts_in_the_market():
+    client = main.BusClient("")
+    vehicles = [
+        main.vehicle_payload(ad("lbc_1")),
+        {**main.vehicle_payload(ad("lbc_2")), "repost_of": "lbc_1"},
+    ]
+    asyncio.run(client._apply({"type": "new_vehicles", "vehicles": vehicles, "notify": [False, False], "seqs": [0, 1]}))
+    assert len(main.store) == 2
+    assert main.market.total_observed == 1
+
+
+@pytest.fixture
+def paris_time(monkeypatch):
+    monkeypatch.setenv("TZ", "Europe/Paris")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_aware_dates_are_converted_to_local_time(paris_time):
+    # 06:00 UTC = 08:00 à Paris (heure d'été)
+    at = datetime(2026, 10, 1, 8, 0)
+    parsed = main.scraper.parse_record(ad("1", published_at="2026-10-01T06:00:00Z"), at)
+    assert parsed["published_at"] == datetime(2026, 10, 1, 8, 0)
+    parsed = main.scraper.parse_record(ad("2", published_at="2026-10-01T07:30:00"), at)
+    assert parsed["published_at"] == datetime(2026, 10, 1, 7, 30)
+
+
+def record(number, **fields):
+    return {
+        "title": f"Peugeot 208 GT Line n°{number}", "price": 9000 + number,
+        "url": f"https://www.leboncoin.fr/ad/voitures/{1000 + number}.htm",
+        "location": "Lyon (69003)", "year": 2018, "mileage": 60000 + number, **fields,
+    }
+
+
+def ndjson(*lines):
+    return "\n".join(line if isinstance(line, str) else json.dumps(line) for line in lines).encode()
+
+
+def post(body, **kwargs):
+    return TestClient(main.app).post("/api/ingest", content=body, **kwargs)
+
+
+def test_errors_carry_body_line_numbers():
+    body = ndjson(record(1), "", "pas du json", record(2), {"title": "Clio", "price": 5000}, "[1, 2]", record(3))
+    response = post(body)
+    assert response.status_code == 200
+    summary = response.json()
+    assert (summary["lines"], summary["parsed"], summary["rejected"], summary["new"]) == (6, 3, 3, 3)
+    assert [error["line"] for error in summary["errors"]] == [3, 5, 6]
+    assert "titre" in summary["errors"][1]["error"]
+
+
+def test_strict_rejects_the_whole_batch():
+    response = post(ndjson(record(1), {"title": "Peugeot 208", "price": 1}), params={"strict": "true"})
+    assert response.status_code == 400
+    assert response.json()["detail"]["errors"][0]["line"] == 2
+    assert len(main.store) == 0
+
+    assert post(ndjson(record(1)), params={"strict": "true"}).json()["new"] == 1
+
+
+def test_gzip_body():
+    body = gzip.compress(ndjson(*(record(i) for i in range(5))))
+    response = post(body, headers={"Content-Encoding": "gzip"})
+    assert response.json()["new"] == 5
+    assert post(b"pas du gzip", headers={"Content-Encoding": "gzip"}).status_code == 400
+
+
+def test_size_limits(monkeypatch):
+    body = ndjson(*(record(i) for i in range(3)))
+    monkeypatch.setattr(main, "INGEST_MAX_BYTES", len(body) - 1)
+    assert post(body).status_code == 413
+    # Limite appliquée au corps décompressé
+    assert post(gzip.compress(body), headers={"Content-Encoding": "gzip"}).status_code == 413
+
+    monkeypatch.setattr(main, "INGEST_MAX_BYTES", len(body))
+    monkeypatch.setattr(main, "INGEST_MAX_ADS", 2)
+    assert post(body).status_code == 413
+    assert len(main.store) == 0
+
+    monkeypatch.setattr(main, "INGEST_MAX_LINE_BYTES", 50)
+    assert post(ndjson(record(1, text="x" * 100))).status_code == 413
+
+
+def test_gzip_bomb_is_rejected_without_full_inflate(monkeypatch):
+    limit = 1024 * 1024
+    monkeypatch.setattr(main, "INGEST_MAX_BYTES", limit)
+    body = gzip.compress(b"\n" * (200 * limit))  # 200 Mo décompressés, ~200 Ko compressés
+    inflated = []
+    decompressobj = zlib.decompressobj
+
+    class CountingDecompressor:
+        def __init__(self, *args):
+            self.inner = decompressobj(*args)
+
+        def decompress(self, data, max_length=0):
+            out = self.inner.decompress(data, max_length)
+            inflated.append(len(out))
+            return out
+
+        @property
+        def unconsumed_tail(self):
+            return self.inner.unconsumed_tail
+
+    monkeypatch.setattr(zlib, "decompressobj", CountingDecompressor)
+    response = post(body, headers={"Content-Encoding": "gzip"})
+    assert response.status_code == 413
+    assert sum(inflated) <= limit + 1
+
+
+def test_duplicates_within_a_batch_and_across_batches():
+    response = post(ndjson(record(1), record(2), record(1), record(1, price=8000)))
+    summary = response.json()
+    assert (summary["parsed"], summary["new"], summary["duplicates"]) == (4, 2, 2)
+    assert len(main.store) == 2
+
+    summary = post(ndjson(record(2), record(3))).json()
+    assert (summary["new"], summary["duplicates"]) == (1, 1)
+
+
+def test_commit_round_trip_over_the_bus_encoding():
+    """Lot parsé par un worker API, sérialisé sur le bus puis stocké par le process d'ingestion"""
+    fetched_at = datetime(2026, 10, 1, 8, 0)
+    ads, errors = main.parse_ingest_lines([(1, ndjson(record(1))), (2, ndjson(record(2, title="Renault Megane Estate", year=2012)))], fetched_at)
+    assert errors == []
+    message = json.loads(main.bus_encode({
+        "type": "call", "id": 1, "command": "ingest.commit",
+        "params": {"ads": [main.vehicle_payload(ad) for ad in ads]},
+    }))
+
+    summary = asyncio.run(main.BUS_COMMANDS[message["command"]](message["params"]))
+    assert summary == {"new": 2, "duplicates": 0, "price_changes": 0, "price_drops": 0}
+    json.loads(main.bus_encode({"type": "reply", "id": 1, "result": summary}))
+    stored = main.store.get(ads[0]["id"])
+    assert stored["published_at"] == ads[0]["published_at"]
+    assert isinstance(stored["published_at"], datetime)
+    assert (stored["price"], stored["year"], stored["mileage"]) == (9001, 2018, 60001)
+
+
+def test_replica_uses_the_ingest_scoring_model(monkeypatch):
+    custom = main.ScoringModel({**main.DEFAULT_SCORING_MODEL, "base": 20, "pro_bonus": -20})
+    monkeypatch.setattr(main.scoring, "model", custom)
+    asyncio.run(main.pipeline.ingest([ad("lbc_1", is_pro=True)]))
+    snapshot = [json.loads(line) for line in main.bus_server.snapshot()]
+
+    # Réplica: modèle par défaut tant que le snapshot n'est pas appliqué
+    monkeypatch.setattr(main.scoring, "model", main.ScoringModel(main.DEFAULT_SCORING_MODEL))
+    monkeypatch.setattr(main, "store", main.VehicleStore(max_size=1000))
+    client = main.BusClient("")
+    for message in snapshot:
+        asyncio.run(client._apply(message))
+
+    assert client.synced
+    assert main.scoring.model.to_dict() == custom.to_dict()
+    vehicle = main.store.update_price("lbc_1", 7000)
+    assert vehicle["score"] == custom.score(2015, 90000, 7000, True)
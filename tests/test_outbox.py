@@ -0,0 +1,36 @@
+import asyncio
+import json
+
+import httpx
+
+import main
+
+
+def test_stop_waits_for_inflight_deliveries(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "WEBHOOK_BATCH_WINDOW", 0)
+    journal = tmp_path / "outbox.jsonl"
+    received = []
+
+    async def handler(request):
+        await asyncio.sleep(0.2)
+        received.append(json.loads(request.content))
+        return httpx.Response(200)
+
+    async def run():
+        outbox = main.WebhookOutbox(str(journal))
+        outbox.load()
+        await outbox.start()
+        await outbox.client.aclose()
+        outbox.client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+        outbox.enqueue("https://hooks.example.com/a", {"vehicle_id": "lbc_1"})
+        outbox.enqueue("https://hooks.example.com/b", {"vehicle_id": "lbc_2"})
+        while len(outbox.inflight) < 2:
+            await asyncio.sleep(0.01)
+        await outbox.stop()
+        return outbox
+
+    outbox = asyncio.run(run())
+    assert sorted(alert["alerts"][0]["vehicle_id"] for alert in received) == ["lbc_1", "lbc_2"]
+    assert outbox.unfinished == {} and not outbox.inflight
+    ops = [json.loads(line)["op"] for line in journal.read_text().splitlines()]
+    assert ops.count("done") == 2
@@ -0,0 +1,35 @@
+import asyncio
+import json
+
+import main
+
+
+def test_load_skips_invalid_searches(tmp_path):
+    path = tmp_path / "searches.json"
+    path.write_text(json.dumps([
+        {"name": "Clio", "params": {"brand": "Renault", "price_max": "9000"}, "pages": 2},
+        {"name": "Prix invalide", "params": {"price_max": "pas cher"}},
+        {"name": "Pages invalides", "params": {"brand": "Peugeot"}, "pages": "deux"},
+        {"name": "Intervalle invalide", "params": {"brand": "Fiat"}, "interval": "souvent"},
+        "pas une recherche",
+        {"name": "Golf", "params": {"brand": "Volkswagen"}, "interval": "60"},
+    ]))
+    scheduler = main.SearchScheduler(main.RateLimiter(60, 2, 100), str(path))
+    scheduler.load()
+
+    searches = {search.key: search for search in scheduler.searches.values()}
+    assert len(searches) == 2
+    golf = next(s for s in searches.values() if "Golf" in s.names)
+    assert golf.interval == 60.0
+
+
+def test_limiter_refuses_once_the_hourly_budget_is_spent(monkeypatch):
+    monkeypatch.setattr(main, "clock", main.SimulatedClock(0))
+    limiter = main.RateLimiter(60, 2, 3)
+
+    async def run():
+        return [await limiter.acquire() for _ in range(4)]
+
+    assert asyncio.run(run()) == [True, True, True, False]
+    main.clock.current += 3600
+    assert asyncio.run(limiter.acquire()) is True
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+import pytest
+
+import main
+
+
+def vehicle(vehicle_id, price=8000, **fields):
+    base = {
+        "id": vehicle_id, "title": "Renault Clio", "brand": "Renault", "model": "Clio",
+        "price": price, "year": 2015, "mileage": 90000, "fuel": "diesel", "gearbox": "manuelle",
+        "location": "Paris (75011)", "is_pro": False, "url": "", "published_at": datetime(2026, 10, 1),
+    }
+    base.update(fields)
+    return base
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = main.VehicleStore(max_size=100)
+    monkeypatch.setattr(main, "store", store)
+    monkeypatch.setattr(main, "market", main.MarketStats())
+    return store
+
+
+def test_update_price_recomputes_score_and_market(store):
+    for i in range(main.MARKET_MIN_SAMPLES):
+        main.market.observe(vehicle(f"ref{i}", price=10000))
+    ad = vehicle("lbc_1", price=40000)
+    ad["score"] = main.scoring.score_vehicle(ad)
+    main.market.observe(ad)
+    store.add(ad)
+    observed = main.market.total_observed
+    assert ad["below_market_pct"] < 0
+
+    updated = store.update_price("lbc_1", 7000)
+    assert updated["score"] == main.scoring.score_vehicle(vehicle("lbc_1", price=7000))
+    assert updated["score"] > main.scoring.score_vehicle(vehicle("lbc_1", price=40000))
+    assert updated["market_price"] == ad["market_price"]
+    assert updated["below_market_pct"] == round((ad["market_price"] - 7000) / ad["market_price"] * 100, 1)
+    assert store.facets["price_bucket"]["5000-9999"] == 1
+    # Aucun nouvel échantillon de marché
+    assert main.market.total_observed == observed
+
+
+def test_location_filter_keeps_substring_semantics(store):
+    locations = ["Paris (75011)", "Ardèche (07200)", "Marseille (13007)", "Lyon (69003)", "France", None]
+    for i, location in enumerate(locations):
+        store.add(vehicle(f"lbc_{i}", location=location, brand="Peugeot" if i % 2 else "Renault"))
+
+    for location in ("75", "07", "750", "13007", "0", "lyon"):
+        expected = [
+            v["id"] for v in reversed(store._by_seq.values())
+            if location in (v.get("location") or "").lower()
+        ]
+        assert [v["id"] for v in store.query(location=location)] == expected
+        assert [v["id"] for _, v in store.scan(location=location)] == expected[::-1]
+
+    assert [v["id"] for v in store.query(brand="renault", location="07")] == ["lbc_2"]
+    assert [v["id"] for v in store.query(brand="peugeot", location="07")] == ["lbc_1"]
+
+    store.update_price("lbc_0", 9000)
+    store._evict_oldest()
+    assert list(store.query(location="75")) == []
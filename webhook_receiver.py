@@ -0,0 +1,99 @@
+"""
+Receveur de webhooks local pour tester les alertes AutoTrack
+
+Reçoit les lots POSTés par l'outbox (/api/alerts -> webhook_url), les compte
+et peut simuler un endpoint défaillant (erreurs, lenteur, panne temporaire)
+pour vérifier les nouveaux essais, le backoff et la concurrence par endpoint.
+
+Usage:
+    python webhook_receiver.py --port 8899
+    python webhook_receiver.py --fail-rate 0.3 --delay 0.5
+    python webhook_receiver.py --down-for 60      # 503 pendant 60s puis OK
+
+Puis créer une règle pointant dessus:
+    curl -X POST localhost:8001/api/alerts -H 'content-type: application/json' \\
+         -d '{"webhook_url": "http://127.0.0.1:8899/webhook", "brand": "renault", "max_price": 8000}'
+
+    curl localhost:8899/stats
+"""
+
+import argparse
+import asyncio
+import random
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+
+class Receiver:
+    def __init__(self, fail_rate=0.0, fail_status=503, delay=0.0, down_for=0.0):
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.delay = delay
+        self.down_until = time.monotonic() + down_for
+        self.batches = 0
+        self.alerts = 0
+        self.failed = 0
+        self.concurrent = 0
+        self.max_concurrent = 0
+        self.seen_ids = {}  # (rule_id, vehicle id, event) -> réceptions (doublons = nouveaux essais)
+        self.app = self._build_app()
+
+    def _build_app(self):
+        app = FastAPI(title="Receveur webhooks AutoTrack")
+
+        @app.post("/webhook")
+        async def webhook(request: Request):
+            self.concurrent += 1
+            self.max_concurrent = max(self.max_concurrent, self.concurrent)
+            try:
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                if time.monotonic() < self.down_until or random.random() < self.fail_rate:
+                    self.failed += 1
+                    return JSONResponse({"error": "simulé"}, status_code=self.fail_status)
+                body = await request.json()
+                self.batches += 1
+                for alert in body.get("alerts", []):
+                    self.alerts += 1
+                    vehicle = alert.get("vehicle") or {}
+                    key = (alert.get("rule_id"), vehicle.get("id"), alert.get("event"))
+                    self.seen_ids[key] = self.seen_ids.get(key, 0) + 1
+                    print(f"🔔 [{alert.get('rule_name') or alert.get('rule_id')}] {alert.get('event')}: "
+                          f"{vehicle.get('title')} - {vehicle.get('price')}€")
+                return {"received": len(body.get("alerts", []))}
+            finally:
+                self.concurrent -= 1
+
+        @app.get("/stats")
+        async def stats():
+            return {
+                "batches": self.batches,
+                "alerts": self.alerts,
+                "unique_alerts": len(self.seen_ids),
+                "duplicates": self.alerts - len(self.seen_ids),
+                "failed_requests": self.failed,
+                "max_concurrent_requests": self.max_concurrent,
+            }
+
+        return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Receveur de webhooks local")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Proportion de requêtes en échec")
+    parser.add_argument("--fail-status", type=int, default=503, help="Code HTTP des échecs simulés")
+    parser.add_argument("--delay", type=float, default=0.0, help="Latence ajoutée par requête (s)")
+    parser.add_argument("--down-for", type=float, default=0.0, help="Panne totale au démarrage (s)")
+    args = parser.parse_args()
+
+    receiver = Receiver(args.fail_rate, args.fail_status, args.delay, args.down_for)
+    uvicorn.run(receiver.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()